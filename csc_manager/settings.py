@@ -90,6 +90,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "members.middleware.RequireVerifiedEmailMiddleware",
+    "members.middleware.RequestProfilingMiddleware",
 ]
 
 ROOT_URLCONF = 'csc_manager.urls'
@@ -146,6 +147,53 @@ else:
 
 
 
+# Cache
+# Any django-environ cache URL, e.g. locmemcache:// (per process) or
+# filecache:///var/tmp/csc_cache (shared between workers on one host)
+
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
+
+# Seconds a cached live race state may be served before it is rebuilt,
+# even if no new race event has bumped its version
+LIVE_STATE_CACHE_TTL = env.int("LIVE_STATE_CACHE_TTL", default=30)
+
+# Seconds the dashboard's per-league race counts may be served before
+# they are recounted, even if no race change has bumped their version
+DASHBOARD_CACHE_TTL = env.int("DASHBOARD_CACHE_TTL", default=300)
+
+# Seconds the race entry form's member and boat dropdowns may be served
+# before they are rebuilt. A member or boat added or removed shows at
+# once in every worker; an edit made by another worker shows after this
+# at the latest unless CACHE_URL is shared
+ENTRY_CHOICES_CACHE_TTL = env.int("ENTRY_CHOICES_CACHE_TTL", default=3600)
+
+# Seconds a race's entry details (helm, sail, class, PY) may be served to
+# the replay engine before they are reloaded. An entry added or removed
+# shows at once in every worker; an edit made by another worker shows
+# after this at the latest unless CACHE_URL is shared
+RACE_ENTRY_CACHE_TTL = env.int("RACE_ENTRY_CACHE_TTL", default=3600)
+
+# Events replayed between saved race checkpoints (races.RaceCheckpoint);
+# a rebuild starts from the latest one. 0 turns checkpoints off
+RACE_CHECKPOINT_INTERVAL = env.int("RACE_CHECKPOINT_INTERVAL", default=500)
+
+# Race replay engine: races.engine.RaceReplay (dicts) or
+# races.engine_columnar.ColumnarRaceReplay (NumPy arrays, for big fleets)
+RACE_STATE_ENGINE = env("RACE_STATE_ENGINE", default="races.engine.RaceReplay")
+
+# Request profiling (members.middleware.RequestProfilingMiddleware), off
+# unless PROFILING=True. Adds Server-Timing headers, logs requests slower
+# than PROFILING_SLOW_MS with their slowest SQL, and dumps cProfile
+# output for a sample of requests to the URL names listed.
+PROFILING = env.bool("PROFILING", default=False)
+PROFILING_SLOW_MS = env.int("PROFILING_SLOW_MS", default=500)
+PROFILING_CPROFILE_URLS = env.list("PROFILING_CPROFILE_URLS", default=[])
+PROFILING_CPROFILE_SAMPLE = env.float("PROFILING_CPROFILE_SAMPLE", default=0.1)
+PROFILING_CPROFILE_DIR = env("PROFILING_CPROFILE_DIR", default=str(BASE_DIR / "profiles"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -1,5 +1,18 @@
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.shortcuts import redirect
-from django.urls import reverse
+from django.template.backends.django import Template
+from django.urls import Resolver404, resolve, reverse
+
+logger = logging.getLogger(__name__)
 
 class RequireVerifiedEmailMiddleware:
     def __init__(self, get_response):
@@ -19,3 +32,147 @@ class RequireVerifiedEmailMiddleware:
             return redirect("login")
 
         return self.get_response(request)
+
+#----------------------------------------------------------#
+
+# timings of the request being handled on this thread
+_profile = threading.local()
+
+
+def _timed_render(render):
+    """
+    Wraps the template backend's render() to add its time to the current
+    request. Only top-level renders go through here; includes don't.
+    """
+    def wrapper(self, *args, **kwargs):
+        stats = getattr(_profile, "stats", None)
+        if stats is None:
+            return render(self, *args, **kwargs)
+
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            stats["template"] += time.perf_counter() - started
+
+    wrapper.profiled = True
+    return wrapper
+
+
+class RequestProfilingMiddleware:
+    """
+    Opt-in (settings.PROFILING) per-request instrumentation: DB query
+    count and time, template render time and total time.
+
+    Every response gets a Server-Timing header. Requests slower than
+    PROFILING_SLOW_MS are logged with their slowest SQL, and a sample of
+    requests to the URL names in PROFILING_CPROFILE_URLS are run under
+    cProfile with the output written to PROFILING_CPROFILE_DIR.
+    """
+
+    # slowest statements included in the slow request log
+    SLOW_SQL_SHOWN = 3
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+
+        if not getattr(Template.render, "profiled", False):
+            Template.render = _timed_render(Template.render)
+
+    def __call__(self, request):
+        stats = {"queries": [], "template": 0.0}
+        _profile.stats = stats
+
+        profiler = self.sampled_profiler(request)
+        started = time.perf_counter()
+
+        try:
+            with self.capture_sql(stats["queries"]):
+                if profiler:
+                    response = profiler.runcall(self.get_response, request)
+                else:
+                    response = self.get_response(request)
+        finally:
+            _profile.stats = None
+
+        total = time.perf_counter() - started
+        db = sum(duration for duration, sql in stats["queries"])
+
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={db * 1000:.1f};desc="{len(stats["queries"])} queries"',
+            f"tpl;dur={stats['template'] * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ])
+
+        if total * 1000 >= settings.PROFILING_SLOW_MS:
+            self.log_slow(request, total, db, stats)
+
+        if profiler:
+            self.dump(profiler, request)
+
+        return response
+
+    # -------------------------------------------------
+    # SQL
+    # -------------------------------------------------
+    def capture_sql(self, queries):
+        """
+        Times every statement on the default connection, DEBUG or not.
+        """
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append((time.perf_counter() - started, sql))
+
+        return connections["default"].execute_wrapper(wrapper)
+
+    def log_slow(self, request, total, db, stats):
+        slowest = sorted(stats["queries"], reverse=True)[:self.SLOW_SQL_SHOWN]
+
+        logger.warning(
+            "Slow request %s %s: %.0fms total, %d queries in %.0fms, "
+            "templates %.0fms\n%s",
+            request.method,
+            request.get_full_path(),
+            total * 1000,
+            len(stats["queries"]),
+            db * 1000,
+            stats["template"] * 1000,
+            "\n".join(f"  {duration * 1000:.1f}ms {sql}" for duration, sql in slowest),
+        )
+
+    # -------------------------------------------------
+    # CPROFILE
+    # -------------------------------------------------
+    def sampled_profiler(self, request):
+        urls = settings.PROFILING_CPROFILE_URLS
+        if not urls or random.random() >= settings.PROFILING_CPROFILE_SAMPLE:
+            return None
+
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+
+        if url_name not in urls:
+            return None
+
+        request.profile_url_name = url_name
+        return cProfile.Profile()
+
+    def dump(self, profiler, request):
+        directory = settings.PROFILING_CPROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+
+        path = os.path.join(
+            directory,
+            f"{request.profile_url_name}-{time.strftime('%Y%m%d-%H%M%S')}"
+            f"-{os.getpid()}-{threading.get_ident()}.prof",
+        )
+        profiler.dump_stats(path)
+        logger.info("Profile of %s written to %s", request.get_full_path(), path)
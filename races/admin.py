@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import BoatType, RegisteredBoat, League, RaceEntry,Race,RaceResult,Event,RaceEvent, ResultSet, ResultSetEntry
+from .models import BoatType, RegisteredBoat, League, LeagueStanding, RaceEntry,Race,RaceResult,Event,RaceEvent, RaceEntryProjection, RaceCheckpoint, ResultSet, ResultSetEntry
 
 # Register your models here.
 
@@ -48,10 +48,22 @@ class EventAdmin(admin.ModelAdmin):
 
 @admin.register(RaceEvent)
 class RaceEventAdmin(admin.ModelAdmin):
-    list_display = ("race", "device_id", "sequence", "event_type", "race_entry","created_at")
+    list_display = ("race", "attempt", "device_id", "sequence", "event_type", "race_entry","created_at")
     search_fields = ("race", "sequence")
     ordering = ("race", "sequence")
 
+@admin.register(RaceEntryProjection)
+class RaceEntryProjectionAdmin(admin.ModelAdmin):
+    list_display = ("race_entry", "race", "attempt", "laps", "last_seconds")
+    search_fields = ("race__id",)
+    ordering = ("race", "race_entry")
+
+@admin.register(RaceCheckpoint)
+class RaceCheckpointAdmin(admin.ModelAdmin):
+    list_display = ("race", "attempt", "position", "race_seconds", "fleet")
+    search_fields = ("race__id",)
+    ordering = ("race", "attempt", "position")
+
 @admin.register(ResultSet)
 class ResultSetAdmin(admin.ModelAdmin):
     list_display = ("race", "source", "created_by", "created_at", "state","published_at")
@@ -62,4 +74,10 @@ class ResultSetAdmin(admin.ModelAdmin):
 class ResultSetEntryAdmin(admin.ModelAdmin):
     list_display = ("result_set", "race_entry", "laps", "elapsed_seconds", "finish_position","corrected_seconds")
     search_fields = ("result_set", "race_entry")
-    ordering = ("result_set", "race_entry")
\ No newline at end of file
+    ordering = ("result_set", "race_entry")
+
+@admin.register(LeagueStanding)
+class LeagueStandingAdmin(admin.ModelAdmin):
+    list_display = ("league", "sailor", "sailed", "counted", "total", "updated_at")
+    search_fields = ("league__name",)
+    ordering = ("league", "-total")
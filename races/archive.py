@@ -0,0 +1,499 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils.dateparse import parse_date, parse_datetime
+
+from members.models import Member
+from races.engine import EVENT_ORDER
+from races.entry_cache import bump_race_entry_version
+from races.models import (
+    Event, League, Race, RaceEntry, RaceEvent, RegisteredBoat, ResultSet,
+    ResultSetEntry,
+)
+from races.projection import rebuild_race_projection
+from races.services import assign_attempts, race_events_committed, refresh_league_standings
+
+
+# rows fetched per round trip while exporting
+EXPORT_CHUNK_SIZE = 2000
+
+# one column per field of every record type; "type" says which apply
+ARCHIVE_COLUMNS = [
+    "type", "id", "name", "description", "date_from", "date_to",
+    "race", "league", "start_datetime", "status",
+    "helm", "crew", "boat", "boat_type_name", "py_used",
+    "result_set", "source", "state", "created_by", "published_at",
+    "race_entry", "laps", "elapsed_seconds", "finish_position", "tied",
+    "corrected_seconds",
+    "device_id", "sequence", "attempt", "event_type", "race_seconds",
+    "created_at",
+]
+
+#----------------------------------------------------------#
+# EXPORT
+#----------------------------------------------------------#
+
+def archive_records(races):
+    """
+    Every record needed to restore `races` (a Race queryset): their
+    leagues, the races, their entries, result sets and event logs, as
+    dicts with a "type".
+
+    Each record type is one chunked query, so memory stays flat however
+    long the logs are. Leagues are referred to by name, members by email
+    and boats by sail number, so an archive can move between databases.
+    """
+    race_ids = races.values("id")
+
+    leagues = League.objects.filter(races__in=race_ids).distinct().order_by("id").values(
+        "id", "name", "description", "date_from", "date_to",
+    )
+    for row in leagues.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {"type": "league", **row}
+
+    for race in races.select_related("event", "league").order_by("id").iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield {
+            "type": "race",
+            "id": race.id,
+            "league": race.league.name if race.league else None,
+            # full precision: imports match races on it (DjangoJSONEncoder
+            # would cut it to milliseconds)
+            "start_datetime": race.event.start_datetime.isoformat(),
+            "status": race.status,
+        }
+
+    entries = RaceEntry.objects.filter(race_id__in=race_ids).order_by("id").values(
+        "id", "race", "boat_type_name", "py_used",
+        helm_email=F("helm__email"),
+        crew_email=F("crew__email"),
+        sail_number=F("boat__sail_number"),
+    )
+    for row in entries.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            "type": "entry",
+            "id": row["id"],
+            "race": row["race"],
+            "helm": row["helm_email"],
+            "crew": row["crew_email"],
+            "boat": row["sail_number"],
+            "boat_type_name": row["boat_type_name"],
+            "py_used": row["py_used"],
+        }
+
+    result_sets = ResultSet.objects.filter(race_id__in=race_ids).order_by(
+        "race", "created_at"
+    ).values(
+        "id", "race", "source", "state", "published_at",
+        created_by_email=F("created_by__email"),
+    )
+    for row in result_sets.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            "type": "result_set",
+            "id": row["id"],
+            "race": row["race"],
+            "source": row["source"],
+            "state": row["state"],
+            "created_by": row["created_by_email"],
+            "published_at": row["published_at"],
+        }
+
+    result_entries = ResultSetEntry.objects.filter(
+        result_set__race_id__in=race_ids
+    ).order_by("id").values(
+        "result_set", "race_entry", "laps", "elapsed_seconds",
+        "finish_position", "tied", "corrected_seconds",
+    )
+    for row in result_entries.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {"type": "result_entry", **row}
+
+    events = RaceEvent.objects.filter(race_id__in=race_ids).order_by(
+        "race", *EVENT_ORDER
+    ).values(
+        "race", "device_id", "sequence", "attempt", "event_type",
+        "race_entry", "race_seconds", "created_at",
+    )
+    for row in events.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {"type": "event", **row}
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+
+
+class _Line:
+    """
+    File-like object for csv.writer that hands back each written line.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_lines(records):
+    writer = csv.DictWriter(_Line(), fieldnames=ARCHIVE_COLUMNS)
+    yield writer.writeheader()
+
+    for record in records:
+        yield writer.writerow(record)
+
+
+ARCHIVE_FORMATS = {
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+    "csv": (csv_lines, "text/csv"),
+}
+
+#----------------------------------------------------------#
+# IMPORT
+#----------------------------------------------------------#
+
+def read_ndjson(lines):
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(lines):
+    # CSV has no nulls: an empty cell is a missing value
+    for row in csv.DictReader(lines):
+        yield {key: (value if value != "" else None) for key, value in row.items()}
+
+
+def _int(value):
+    return None if value is None else int(value)
+
+
+def _float(value):
+    return None if value is None else float(value)
+
+
+def _bool(value):
+    return value in (True, "True", "true", "1")
+
+
+def _date(value):
+    return parse_date(value) if isinstance(value, str) else value
+
+
+def _datetime(value):
+    return parse_datetime(value) if isinstance(value, str) else value
+
+
+class ArchiveImporter:
+    """
+    Restores records from archive_records(). Leagues are matched on name
+    and races on (start, league, number among the races with that start
+    and league), so re-importing reuses what is already here and an
+    archive from another database never lands on an unrelated race that
+    happens to share its id. Both are created when missing. Entries are
+    matched on (race, helm). Events are bulk inserted a batch at a time
+    and skipped when their (device_id, sequence) is already stored.
+
+    Only the id maps for races, entries and result sets are held in
+    memory, never the event log.
+    """
+
+    def __init__(self, batch_size=2000):
+        self.batch_size = batch_size
+        self.counts = dict.fromkeys(
+            ["leagues", "races", "entries", "result_sets", "result_entries", "events",
+             "duplicates", "skipped"], 0
+        )
+
+        self.leagues = {}        # league name → league id here
+        self.races = {}          # archived race id → race id here
+        self.race_numbers = {}   # (start, league name) → races read with it
+        self.entries = {}        # archived entry id → entry id here
+        self.result_sets = {}    # archived result set id → result set id here
+        self.pending = []
+        self.pending_type = None
+
+        self.event_races = set()
+        self.result_races = set()
+        self.entry_races = set()
+
+        self.handlers = {
+            "league": self.import_leagues,
+            "race": self.import_races,
+            "entry": self.import_entries,
+            "result_set": self.import_result_sets,
+            "result_entry": self.import_result_entries,
+            "event": self.import_events,
+        }
+
+    def run(self, records):
+        with transaction.atomic():
+            for record in records:
+                if record["type"] != self.pending_type or len(self.pending) >= self.batch_size:
+                    self.flush()
+                    self.pending_type = record["type"]
+
+                self.pending.append(record)
+
+            self.flush()
+
+            for league in League.objects.filter(races__in=self.result_races).distinct():
+                refresh_league_standings(league)
+
+            for race_id in self.event_races:
+                rebuild_race_projection(race_id)
+
+            if self.event_races:
+                race_ids = set(self.event_races)
+                transaction.on_commit(lambda: race_events_committed(race_ids))
+
+            # bulk_create skips the signal that refreshes a race's entries
+            if self.entry_races:
+                entry_race_ids = set(self.entry_races)
+                transaction.on_commit(lambda: bump_race_entry_version(entry_race_ids))
+
+        return self.counts
+
+    def flush(self):
+        if self.pending:
+            if self.pending_type not in self.handlers:
+                raise ValueError(f"Unknown record type: {self.pending_type}")
+            self.handlers[self.pending_type](self.pending)
+        self.pending = []
+
+    def known_race(self, records):
+        """
+        Records whose race was imported; the rest are counted as skipped.
+        """
+        known = [r for r in records if self._race(r) is not None]
+        self.counts["skipped"] += len(records) - len(known)
+        return known
+
+    # -------------------------------------------------
+    # RECORD TYPES
+    # -------------------------------------------------
+    def import_leagues(self, records):
+        existing = dict(
+            League.objects.filter(
+                name__in={r["name"] for r in records}
+            ).values_list("name", "id")
+        )
+
+        for record in records:
+            if record["name"] in existing:
+                self.leagues[record["name"]] = existing[record["name"]]
+                continue
+
+            league = League.objects.create(
+                name=record["name"],
+                description=record["description"] or "",
+                date_from=_date(record["date_from"]),
+                date_to=_date(record["date_to"]),
+            )
+            self.leagues[league.name] = league.id
+            self.counts["leagues"] += 1
+
+    def import_races(self, records):
+        starts = {_datetime(r["start_datetime"]) for r in records}
+
+        # races here with those starts, in id order per (start, league)
+        existing = {}
+        for race_id, start, league in Race.objects.filter(
+            event__start_datetime__in=starts
+        ).order_by("id").values_list("id", "event__start_datetime", "league__name"):
+            existing.setdefault((start, league), []).append(race_id)
+
+        # archives without league records: leagues already here by name
+        missing = {r["league"] for r in records if r["league"]} - set(self.leagues)
+        self.leagues.update(
+            League.objects.filter(name__in=missing).values_list("name", "id")
+        )
+
+        # archived races are in id order, so their number matches the
+        # same race's number here
+        for record in records:
+            archived_id = _int(record["id"])
+            start = _datetime(record["start_datetime"])
+
+            key = (start, record["league"])
+            number = self.race_numbers.get(key, 0)
+            self.race_numbers[key] = number + 1
+
+            if number < len(existing.get(key, [])):
+                self.races[archived_id] = existing[key][number]
+                continue
+
+            event = Event.objects.create(
+                start_datetime=start,
+                type=Event.EventType.RACE,
+            )
+            race = Race.objects.create(
+                event=event,
+                league_id=self.leagues.get(record["league"]),
+                status=record["status"],
+            )
+            self.races[archived_id] = race.id
+            self.counts["races"] += 1
+
+    def import_entries(self, records):
+        records = self.known_race(records)
+        race_ids = {self._race(r) for r in records}
+
+        members = dict(
+            Member.objects.filter(
+                email__in={r["helm"] for r in records} | {r["crew"] for r in records if r["crew"]}
+            ).values_list("email", "id")
+        )
+        boats = {}
+        for boat_id, sail_number, type_name in RegisteredBoat.objects.filter(
+            sail_number__in={r["boat"] for r in records}
+        ).values_list("id", "sail_number", "boat_type__name").order_by("id"):
+            boats.setdefault((sail_number, type_name), boat_id)
+            boats.setdefault((sail_number, None), boat_id)
+
+        existing = {
+            (race_id, helm_id): entry_id
+            for entry_id, race_id, helm_id in RaceEntry.objects.filter(
+                race_id__in=race_ids
+            ).values_list("id", "race_id", "helm_id")
+        }
+
+        new = []
+
+        for record in records:
+            race_id = self._race(record)
+            helm_id = members.get(record["helm"])
+            boat_id = boats.get(
+                (record["boat"], record["boat_type_name"]),
+                boats.get((record["boat"], None)),
+            )
+
+            if helm_id is None or boat_id is None:
+                self.counts["skipped"] += 1
+                continue
+
+            if (race_id, helm_id) in existing:
+                self.entries[_int(record["id"])] = existing[race_id, helm_id]
+                continue
+
+            new.append((_int(record["id"]), RaceEntry(
+                race_id=race_id,
+                helm_id=helm_id,
+                crew_id=members.get(record["crew"]),
+                boat_id=boat_id,
+                boat_type_name=record["boat_type_name"],
+                py_used=_int(record["py_used"]),
+            )))
+
+        RaceEntry.objects.bulk_create([entry for _, entry in new])
+        self.entry_races.update(entry.race_id for _, entry in new)
+
+        for archived_id, entry in new:
+            self.entries[archived_id] = entry.id
+
+        self.counts["entries"] += len(new)
+
+    def import_result_sets(self, records):
+        records = self.known_race(records)
+
+        existing = set(
+            str(pk) for pk in ResultSet.objects.filter(
+                id__in=[r["id"] for r in records]
+            ).values_list("id", flat=True)
+        )
+        members = dict(
+            Member.objects.filter(
+                email__in={r["created_by"] for r in records}
+            ).values_list("email", "id")
+        )
+
+        new = []
+
+        for record in records:
+            # already here → leave it, and its entries, alone
+            if str(record["id"]) in existing or record["created_by"] not in members:
+                self.counts["skipped"] += 1
+                continue
+
+            new.append(ResultSet(
+                id=record["id"],
+                race_id=self._race(record),
+                source=record["source"],
+                state=record["state"],
+                created_by_id=members[record["created_by"]],
+                published_at=_datetime(record["published_at"]),
+            ))
+            self.result_sets[str(record["id"])] = record["id"]
+
+        ResultSet.objects.bulk_create(new)
+        self.counts["result_sets"] += len(new)
+        self.result_races.update(rs.race_id for rs in new)
+
+    def import_result_entries(self, records):
+        new = []
+
+        for record in records:
+            result_set = self.result_sets.get(str(record["result_set"]))
+            race_entry = self.entries.get(_int(record["race_entry"]))
+
+            if result_set is None or race_entry is None:
+                continue
+
+            new.append(ResultSetEntry(
+                result_set_id=result_set,
+                race_entry_id=race_entry,
+                laps=_int(record["laps"]),
+                elapsed_seconds=_int(record["elapsed_seconds"]),
+                finish_position=_int(record["finish_position"]),
+                tied=_bool(record["tied"]),
+                corrected_seconds=_float(record["corrected_seconds"]),
+            ))
+
+        ResultSetEntry.objects.bulk_create(new)
+        self.counts["result_entries"] += len(new)
+
+    def import_events(self, records):
+        events = []
+
+        for record in records:
+            race_id = self._race(record)
+            entry_id = _int(record["race_entry"])
+
+            if race_id is None or (entry_id and entry_id not in self.entries):
+                self.counts["skipped"] += 1
+                continue
+
+            events.append(RaceEvent(
+                race_id=race_id,
+                device_id=record["device_id"],
+                sequence=_int(record["sequence"]),
+                event_type=record["event_type"],
+                race_entry_id=self.entries.get(entry_id),
+                race_seconds=_int(record["race_seconds"]),
+            ))
+
+        # (device_id, sequence) dedup against what is already stored
+        stored = set(
+            RaceEvent.objects.filter(
+                device_id__in={ev.device_id for ev in events},
+                sequence__in={ev.sequence for ev in events},
+            ).values_list("device_id", "sequence")
+        )
+
+        new = []
+
+        for ev in events:
+            key = (ev.device_id, ev.sequence)
+            if key in stored:
+                self.counts["duplicates"] += 1
+                continue
+            stored.add(key)
+            new.append(ev)
+
+        assign_attempts(new)
+        RaceEvent.objects.bulk_create(new, ignore_conflicts=True)
+
+        self.counts["events"] += len(new)
+        self.event_races.update(ev.race_id for ev in new)
+
+    def _race(self, record):
+        return self.races.get(_int(record["race"]))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.cache import cache
+
+
+def cache_version(key):
+    """
+    Current value of a version counter. Starts from a clock value so a
+    version key that was evicted never reuses an old number.
+    """
+    version = cache.get(key)
+
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+
+    return version
+
+#----------------------------------------------------------#
+
+def bump_cache_version(key):
+    """
+    Moves a version counter on, so every entry cached under the old
+    value is skipped from now on.
+    """
+    try:
+        cache.incr(key)
+    except ValueError:
+        # missing / evicted → any fresh value invalidates
+        cache.set(key, int(time.time() * 1000), None)
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from members.models import Member
+from races.cache_versions import bump_cache_version, cache_version
+from races.models import RegisteredBoat
+
+
+VERSION_KEY = "races:choices:version"
+
+
+def _choices_key(name, version):
+    return f"races:choices:{name}:{version}"
+
+
+def _cached(name, build):
+    key = _choices_key(name, choice_version())
+    choices = cache.get(key)
+
+    if choices is None:
+        choices = build()
+        cache.set(key, choices, settings.ENTRY_CHOICES_CACHE_TTL)
+
+    return choices
+
+#----------------------------------------------------------#
+
+def choice_version():
+    """
+    Changes when a member or boat is added or removed (read from the
+    database, so every worker sees it), or when this process bumped the
+    version for an edit.
+    """
+    members = Member.objects.aggregate(count=Count("id"), last=Max("id"))
+    boats = RegisteredBoat.objects.aggregate(count=Count("id"), last=Max("id"))
+
+    return (
+        f"{members['count']}-{members['last'] or 0}."
+        f"{boats['count']}-{boats['last'] or 0}."
+        f"{cache_version(VERSION_KEY)}"
+    )
+
+
+def bump_choice_version():
+    """
+    Called when a member, boat or boat type changes (see races.signals)
+    so the entry form's dropdowns are rebuilt.
+    """
+    bump_cache_version(VERSION_KEY)
+
+#----------------------------------------------------------#
+
+def member_choices():
+    """
+    (id, username) for every member, alphabetical by alias.
+    """
+    return _cached("members", lambda: list(
+        Member.objects.order_by("username").values_list("id", "username")
+    ))
+
+
+def boat_choices():
+    """
+    (id, label) for every registered boat.
+    """
+    return _cached("boats", lambda: [
+        (boat.id, str(boat))
+        for boat in RegisteredBoat.objects.select_related("boat_type").order_by("id")
+    ])
@@ -0,0 +1,66 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from races.cache_versions import bump_cache_version, cache_version
+from races.models import League, Race
+
+
+VERSION_KEY = "races:dashboard:version"
+
+
+def _leagues_key(version, today):
+    return f"races:dashboard:{version}:{today.isoformat()}"
+
+#----------------------------------------------------------#
+
+def dashboard_version():
+    return cache_version(VERSION_KEY)
+
+#----------------------------------------------------------#
+
+def bump_dashboard_version():
+    """
+    Called when a race or league changes (see races.signals), and after
+    bulk writes that skip signals, so the next dashboard read recounts.
+    """
+    bump_cache_version(VERSION_KEY)
+
+#----------------------------------------------------------#
+
+def get_active_leagues(today):
+    """
+    Leagues running on `today`, each with a <status>_count attribute per
+    race status. Shared by every dashboard view until the next race or
+    league change or DASHBOARD_CACHE_TTL, whichever comes first.
+    """
+    key = _leagues_key(dashboard_version(), today)
+    leagues = cache.get(key)
+
+    if leagues is None:
+        leagues = list(
+            League.objects
+            .filter(date_from__lte=today, date_to__gte=today)
+            .order_by("date_to")
+        )
+
+        # one grouped count instead of a filtered Count per status
+        counts = defaultdict(dict)
+        for league_id, status, total in (
+            Race.objects
+            .filter(league__in=leagues)
+            .values_list("league_id", "status")
+            .annotate(total=Count("id"))
+            .order_by()
+        ):
+            counts[league_id][status] = total
+
+        for league in leagues:
+            for status in Race.RaceStatus.values:
+                setattr(league, f"{status}_count", counts[league.id].get(status, 0))
+
+        cache.set(key, leagues, settings.DASHBOARD_CACHE_TTL)
+
+    return leagues
@@ -0,0 +1,745 @@
+import heapq
+import threading
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, Q
+from django.utils.module_loading import import_string
+
+from races.entry_cache import race_entry_meta, race_entry_version
+from races.models import RaceCheckpoint, RaceEvent
+from races.scoring import LiveRanking
+
+
+# order of each device's stream in the event log; streams are merged
+# by race time (merged_events)
+EVENT_ORDER = ("device_id", "sequence")
+
+# rows fetched per round trip while streaming a device's events
+STREAM_CHUNK_SIZE = 2000
+
+# how many (race, attempt) engines a process keeps warm
+MAX_LIVE_ENGINES = 64
+
+#----------------------------------------------------------#
+
+class RaceReplay:
+    """
+    Replayed state of one race attempt.
+
+    rebuild() replays the whole attempt; refresh() only applies events
+    that arrived since the last call and falls back to a rebuild when the
+    new events cannot simply be appended.
+
+    Every settings.RACE_CHECKPOINT_INTERVAL events the state is saved as
+    a RaceCheckpoint, and rebuild() starts from the latest one that still
+    matches the log.
+    """
+
+    def __init__(self, race_id, attempt=None):
+        self.race_id = race_id
+        self.attempt = attempt
+        self.lock = threading.Lock()
+
+        self.state = None
+        self.last_id = 0
+        self.last_key = None      # merge key of the last replayed event
+        self.device_sequences = {}  # device → highest sequence stored (all attempts)
+        self.device_clocks = {}     # device → race time reached in this attempt
+        self.device_positions = {}  # device → (last sequence, events) replayed in this attempt
+        self.current_attempt = 1
+        self.entries = {}
+        self.fleet = "0x0x00000000"
+        self.entries_version = None
+
+        # checkpoints
+        self.checkpoint_position = 0  # events replayed when the last one was taken
+        self.pending_checkpoints = []
+        self.until = None             # race time a replay of the past stops at
+
+        # delta bookkeeping for the current attempt
+        self.applied_ids = []     # event ids in replay order
+        self.boat_revs = {}       # entry id → len(applied_ids) when its row last changed
+        self.history_revs = []    # len(applied_ids) when each history point was added
+
+    # -------------------------------------------------
+    # INITIAL STATE
+    # -------------------------------------------------
+    def load_entries(self, fresh=False):
+        # shared by every replay of the race; see races.entry_cache
+        self.entries_version = race_entry_version(self.race_id)
+        self.entries = race_entry_meta(self.race_id, self.entries_version, fresh=fresh)
+
+        # cursors and checkpoints carry what the boats show, so a new
+        # entry, a renamed helm or a PY change makes both start over
+        digest = zlib.crc32(repr(sorted(self.entries.items())).encode())
+        self.fleet = f"{len(self.entries)}x{max(self.entries, default=0)}x{digest:08x}"
+
+    def reset(self, attempt, total_attempts):
+        self.state = {
+            "started": False,
+            "finished": False,
+            "race_time": 0,
+            "attempt": attempt,
+            "total_attempts": total_attempts,
+            "boats": {},
+            "history": [],   # ⭐ important
+        }
+
+        self.applied_ids = []
+        self.boat_revs = dict.fromkeys(self.entries, 0)
+        self.history_revs = []
+
+        for entry_id, meta in self.entries.items():
+            self.state["boats"][entry_id] = {
+                **meta,
+                "laps": 0,
+                "times": [],
+                "last": 0,
+                "corrected": None,
+            }
+
+        self.rank_boats()
+
+    def rank_boats(self):
+        """
+        Start the places over from the boats as they stand; the next
+        snapshot reports every boat whose place differs from its row.
+        """
+        boats = list(self.state["boats"].values())
+
+        self.ranked_boats = boats
+        self.ranked_index = {b["entry_id"]: i for i, b in enumerate(boats)}
+        self.dirty = set()     # boats whose laps changed since the last snapshot
+
+        self.ranking = LiveRanking(
+            [b["laps"] for b in boats],
+            [b["last"] for b in boats],
+            [b["py"] for b in boats],
+        )
+        self.ranking.corrected = [b["corrected"] for b in boats]
+        self.ranking.actual_pos = [b.get("actual_pos", 0) for b in boats]
+        self.ranking.corrected_pos = [b.get("corrected_pos", 0) for b in boats]
+
+    # -------------------------------------------------
+    # FULL REPLAY
+    # -------------------------------------------------
+    def rebuild(self, until=None, fresh_entries=False):
+        """
+        Replay the attempt from its nearest checkpoint. With `until` (race
+        seconds) stop at that moment of the race instead of the end; the
+        engine then shows the past and must not be refreshed. An event for
+        a boat missing from the cached fleet reloads it from the database.
+        """
+
+        events = RaceEvent.objects.filter(race_id=self.race_id)
+
+        # attempts are numbered on ingest (services.assign_attempts)
+        totals = events.aggregate(attempts=Max("attempt"), last_id=Max("id"))
+        total_attempts = totals["attempts"] or 1
+
+        attempt = self.attempt
+        if attempt is None or attempt > total_attempts:
+            attempt = total_attempts
+
+        self.load_entries(fresh=fresh_entries)
+        self.reset(attempt, total_attempts)
+        self.current_attempt = total_attempts
+
+        self.device_sequences = dict(
+            events.order_by().values_list("device_id").annotate(Max("sequence"))
+        )
+
+        self.device_clocks = {}
+        self.device_positions = {}
+        self.last_key = None
+        self.checkpoint_position = 0
+        self.pending_checkpoints = []
+        self.until = until
+
+        replay = events.filter(attempt=attempt).exclude(event_type="restart")
+
+        if settings.RACE_CHECKPOINT_INTERVAL:
+            self.restore_checkpoint(replay, until)
+
+        start = {
+            device_id: (sequence, self.device_clocks[device_id])
+            for device_id, (sequence, _) in self.device_positions.items()
+        }
+
+        for key, ev in merged_events(replay, start):
+            if until is not None and key[0] > until:
+                break
+
+            if ev.race_entry_id and ev.race_entry_id not in self.entries:
+                # cached fleet is stale; a boat still missing was removed
+                if not fresh_entries:
+                    return self.rebuild(until, fresh_entries=True)
+                continue
+
+            self.advance(key, ev)
+
+        self.last_id = totals["last_id"] or 0
+
+        self.save_checkpoints()
+
+        return self
+
+    # -------------------------------------------------
+    # INCREMENTAL REPLAY
+    # -------------------------------------------------
+    def refresh(self):
+
+        if self.state is None:
+            return self.rebuild()
+
+        # an entry was added, edited or removed
+        if race_entry_version(self.race_id) != self.entries_version:
+            return self.rebuild()
+
+        new_events = list(
+            RaceEvent.objects.filter(race_id=self.race_id, id__gt=self.last_id)
+            .order_by(*EVENT_ORDER)
+        )
+
+        if not new_events:
+            return self
+
+        for ev in new_events:
+            # a boat entered after we loaded the fleet
+            if ev.race_entry_id and ev.race_entry_id not in self.entries:
+                return self.rebuild()
+
+            # late offline queue: lands inside a device's replayed stream
+            # (and a late restart renumbers that device's attempts)
+            if ev.sequence < self.device_sequences.get(ev.device_id, ev.sequence):
+                return self.rebuild()
+
+        latest = max(ev.attempt for ev in new_events)
+
+        if latest > self.current_attempt:
+            self.current_attempt = latest
+            self.state["total_attempts"] = latest
+
+            # following the latest attempt → start from scratch
+            if self.attempt is None or self.attempt >= latest:
+                self.reset(latest, latest)
+                self.device_clocks = {}
+                self.device_positions = {}
+                self.last_key = None
+                self.checkpoint_position = 0
+
+        clocks = dict(self.device_clocks)
+        keyed = []
+
+        for ev in new_events:
+            if ev.attempt != self.state["attempt"] or ev.event_type == "restart":
+                continue
+
+            clocks[ev.device_id] = max(clocks.get(ev.device_id, 0), ev.race_seconds or 0)
+            keyed.append(((clocks[ev.device_id], ev.device_id, ev.sequence), ev))
+
+        keyed.sort(key=lambda pair: pair[0])
+
+        # another device's event lands before what we've replayed
+        if keyed and self.last_key is not None and keyed[0][0] < self.last_key:
+            return self.rebuild()
+
+        for key, ev in keyed:
+            self.advance(key, ev)
+
+        self.save_checkpoints()
+
+        for ev in new_events:
+            self.device_sequences[ev.device_id] = max(
+                self.device_sequences.get(ev.device_id, ev.sequence), ev.sequence
+            )
+            self.last_id = max(self.last_id, ev.id)
+
+        return self
+
+    def advance(self, key, ev):
+        """
+        Apply the next event in merge order and note where its device's
+        stream is up to; queue a checkpoint when one is due.
+        """
+        _, count = self.device_positions.get(ev.device_id, (0, 0))
+
+        self.device_clocks[ev.device_id] = key[0]
+        self.device_positions[ev.device_id] = (ev.sequence, count + 1)
+        self.last_key = key
+        self.apply(ev)
+
+        interval = settings.RACE_CHECKPOINT_INTERVAL
+        position = len(self.applied_ids)
+
+        # a replay of the past stops short, so it saves none
+        if interval and self.until is None and position - self.checkpoint_position >= interval:
+            self.pending_checkpoints.append(RaceCheckpoint(
+                race_id=self.race_id,
+                attempt=self.state["attempt"],
+                position=position,
+                race_seconds=key[0],
+                fleet=self.fleet,
+                last_key=list(key),
+                devices={
+                    device_id: [sequence, self.device_clocks[device_id], count]
+                    for device_id, (sequence, count) in self.device_positions.items()
+                },
+                state=self.dump_checkpoint(self.checkpoint_position),
+            ))
+            self.checkpoint_position = position
+
+    # -------------------------------------------------
+    # CHECKPOINTS
+    # -------------------------------------------------
+    def save_checkpoints(self):
+        # another worker may have saved the same ones from the same log
+        RaceCheckpoint.objects.bulk_create(self.pending_checkpoints, ignore_conflicts=True)
+        self.pending_checkpoints = []
+
+    def checkpoint_matches(self, replay, checkpoint):
+        """
+        True when the log still replays through `checkpoint` unchanged:
+        each device's stream up to it holds the same events, and nothing
+        left to replay sorts before it (merged_events keys).
+        """
+        if checkpoint.fleet != self.fleet:
+            return False
+
+        devices = checkpoint.devices
+        replayed = reduce(or_, (
+            Q(device_id=device_id, sequence__lte=sequence)
+            for device_id, (sequence, _, _) in devices.items()
+        ))
+
+        counts = {}
+        heads = []
+
+        for device_id, count, head in (
+            replay.order_by().values_list("device_id").annotate(
+                count=Count("id", filter=replayed),
+                head=Min("sequence", filter=~replayed),
+            )
+        ):
+            if count:
+                counts[device_id] = count
+            if head is not None:
+                heads.append(Q(device_id=device_id, sequence=head))
+
+        if counts != {device_id: count for device_id, (_, _, count) in devices.items()}:
+            return False
+
+        if not heads:
+            return True
+
+        last_key = tuple(checkpoint.last_key)
+
+        for device_id, sequence, race_seconds in (
+            replay.filter(reduce(or_, heads))
+            .values_list("device_id", "sequence", "race_seconds")
+        ):
+            clock = devices[device_id][1] if device_id in devices else 0
+
+            if (max(clock, race_seconds or 0), device_id, sequence) < last_key:
+                return False
+
+        return True
+
+    def restore_checkpoint(self, replay, until=None):
+        """
+        Load the latest checkpoint of this attempt that still matches the
+        log (and is no later than `until`). Checkpoints that don't match
+        are deleted: once the log changes under one, every later one is
+        stale too, so the matching ones are a prefix and are found by
+        binary search.
+        """
+        checkpoints = list(
+            RaceCheckpoint.objects.filter(race_id=self.race_id, attempt=self.state["attempt"])
+            .order_by("position")
+            .only("position", "race_seconds", "fleet", "last_key", "devices")
+        )
+
+        if not checkpoints:
+            return
+
+        bound = len(checkpoints)
+        if until is not None:
+            bound = bisect_right([c.race_seconds for c in checkpoints], until)
+
+        # first checkpoint before the bound that doesn't match
+        lo, hi = 0, bound
+        while lo < hi:
+            mid = (lo + hi) // 2
+
+            if self.checkpoint_matches(replay, checkpoints[mid]):
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < bound:
+            RaceCheckpoint.objects.filter(
+                race_id=self.race_id,
+                attempt=self.state["attempt"],
+                position__gte=checkpoints[lo].position,
+            ).delete()
+
+        if not lo:
+            return
+
+        checkpoint = checkpoints[lo - 1]
+        chain = list(
+            RaceCheckpoint.objects.filter(
+                race_id=self.race_id,
+                attempt=self.state["attempt"],
+                position__lte=checkpoint.position,
+            )
+            .order_by("position")
+            .values_list("position", "state")
+        )
+
+        # every checkpoint carries the events since the one before it;
+        # a gap (workers saving at different intervals) → start over
+        position = 0
+        for end, state in chain:
+            if len(state["applied_ids"]) != end - position:
+                RaceCheckpoint.objects.filter(
+                    race_id=self.race_id, attempt=self.state["attempt"]
+                ).delete()
+                return
+            position = end
+
+        self.load_checkpoint([state for _, state in chain])
+
+        self.device_clocks = {}
+        self.device_positions = {}
+        for device_id, (sequence, clock, count) in checkpoint.devices.items():
+            self.device_clocks[device_id] = clock
+            self.device_positions[device_id] = (sequence, count)
+
+        self.last_key = tuple(checkpoint.last_key)
+        self.checkpoint_position = checkpoint.position
+
+    def dump_checkpoint(self, start):
+        """
+        JSON-ready state after the events replayed so far, one list per
+        field in `entries` order; history, event ids and their revisions
+        only from event `start` on (the previous checkpoint has the rest).
+        """
+        state = self.state
+        boats = list(state["boats"].values())
+        first_point = bisect_right(self.history_revs, start)
+        points = state["history"][first_point:]
+
+        return {
+            "started": state["started"],
+            "finished": state["finished"],
+            "race_time": state["race_time"],
+            "entries": [b["entry_id"] for b in boats],
+            "laps": [b["laps"] for b in boats],
+            "times": [list(b["times"]) for b in boats],
+            "last": [b["last"] for b in boats],
+            "corrected": [b["corrected"] for b in boats],
+            "actual_pos": [b.get("actual_pos") for b in boats],
+            "corrected_pos": [b.get("corrected_pos") for b in boats],
+            "boat_revs": [self.boat_revs[b["entry_id"]] for b in boats],
+            "applied_ids": self.applied_ids[start:],
+            "history_revs": self.history_revs[first_point:],
+            "history_time": [point["time"] for point in points],
+            # [entry_id, actual_pos, corrected_pos] per boat that moved
+            "history_moves": [
+                [
+                    [entry_id, places["actual_pos"], places["corrected_pos"]]
+                    for entry_id, places in point["boats"].items()
+                ]
+                for point in points
+            ],
+        }
+
+    def load_checkpoint(self, chain):
+        """
+        Inverse of dump_checkpoint, given every checkpoint of the attempt
+        up to the one to resume from.
+        """
+        state = self.state
+        last = chain[-1]
+        entries = last["entries"]
+
+        state["started"] = last["started"]
+        state["finished"] = last["finished"]
+        state["race_time"] = last["race_time"]
+
+        for entry_id, laps, times, last_time, corrected, actual_pos, corrected_pos, rev in zip(
+            entries, last["laps"], last["times"], last["last"], last["corrected"],
+            last["actual_pos"], last["corrected_pos"], last["boat_revs"],
+        ):
+            b = state["boats"][entry_id]
+            b["laps"] = laps
+            b["times"] = times
+            b["last"] = last_time
+            b["corrected"] = corrected
+
+            if actual_pos is not None:
+                b["actual_pos"] = actual_pos
+                b["corrected_pos"] = corrected_pos
+
+            self.boat_revs[entry_id] = rev
+
+        for checkpoint in chain:
+            self.applied_ids.extend(checkpoint["applied_ids"])
+            self.history_revs.extend(checkpoint["history_revs"])
+
+            for time_value, moves in zip(checkpoint["history_time"], checkpoint["history_moves"]):
+                state["history"].append({
+                    "time": time_value,
+                    "boats": {
+                        entry_id: {"actual_pos": actual_pos, "corrected_pos": corrected_pos}
+                        for entry_id, actual_pos, corrected_pos in moves
+                    },
+                })
+
+        # places as of the last snapshot; an undo since is re-placed on
+        # the next one
+        self.rank_boats()
+
+    # -------------------------------------------------
+    # SNAPSHOT FUNCTION
+    # -------------------------------------------------
+    def snapshot(self, time_value):
+
+        state = self.state
+        boats = self.ranked_boats
+        ranking = self.ranking
+        rev = len(self.applied_ids)
+
+        # corrected and places at this moment: only the boats that sailed
+        # a lap (or had one undone) since the last one move
+        moved, recorrected = ranking.update({
+            self.ranked_index[entry_id]: (
+                state["boats"][entry_id]["laps"], state["boats"][entry_id]["last"]
+            )
+            for entry_id in self.dirty
+        })
+        self.dirty.clear()
+
+        for i in recorrected:
+            boats[i]["corrected"] = ranking.corrected[i]
+
+        for i in moved:
+            boats[i]["actual_pos"] = ranking.actual_pos[i]
+            boats[i]["corrected_pos"] = ranking.corrected_pos[i]
+
+        for i in moved | recorrected:
+            self.boat_revs[boats[i]["entry_id"]] = rev
+
+        # ⭐ append (do NOT reset!) – only the boats whose places changed;
+        # the others are where the previous point had them
+        self.history_revs.append(rev)
+        state["history"].append({
+            "time": time_value,
+            "boats": {
+                boats[i]["entry_id"]: {
+                    "actual_pos": boats[i]["actual_pos"],
+                    "corrected_pos": boats[i]["corrected_pos"],
+                }
+                for i in sorted(moved)
+            }
+        })
+
+    # -------------------------------------------------
+    # APPLY ONE EVENT
+    # -------------------------------------------------
+    def apply(self, ev):
+
+        state = self.state
+
+        self.applied_ids.append(ev.id)
+        rev = len(self.applied_ids)
+
+        if ev.event_type == "start":
+            state["started"] = True
+
+        elif ev.event_type == "lap" and ev.race_entry_id:
+            b = state["boats"][ev.race_entry_id]
+
+            b["laps"] += 1
+            b["times"].append(ev.race_seconds)
+            b["last"] = ev.race_seconds
+            self.boat_revs[ev.race_entry_id] = rev
+            self.dirty.add(ev.race_entry_id)
+
+            state["race_time"] = max(state["race_time"], ev.race_seconds or 0)
+
+            self.snapshot(state["race_time"])  # ⭐ magic moment
+
+        elif ev.event_type == "undo" and ev.race_entry_id:
+            b = state["boats"][ev.race_entry_id]
+            if b["laps"] > 0:
+                b["laps"] -= 1
+                b["times"].pop()
+                b["last"] = b["times"][-1] if b["times"] else 0
+                self.boat_revs[ev.race_entry_id] = rev
+                self.dirty.add(ev.race_entry_id)
+
+        elif ev.event_type == "finish":
+            state["finished"] = True
+
+    # -------------------------------------------------
+    # EXPORT
+    # -------------------------------------------------
+    def cursor(self):
+        """
+        Where a client is in this attempt's replay. Built only from the
+        event log, so any worker can check it.
+        """
+        last_id = self.applied_ids[-1] if self.applied_ids else 0
+        return (
+            f"{self.state['attempt']}:{len(self.applied_ids)}:{last_id}:{self.fleet}"
+        )
+
+    def parse_cursor(self, since):
+        """
+        Number of events the client has seen, or None when the cursor
+        does not describe this replay any more (restart, late event,
+        fleet change).
+        """
+        try:
+            attempt, seen, last_id, fleet = since.split(":")
+            attempt, seen, last_id = int(attempt), int(seen), int(last_id)
+        except (AttributeError, ValueError):
+            return None
+
+        if attempt != self.state["attempt"] or fleet != self.fleet:
+            return None
+
+        if not 0 <= seen <= len(self.applied_ids):
+            return None
+
+        if seen and self.applied_ids[seen - 1] != last_id:
+            return None
+
+        return seen
+
+    def export(self, since=None):
+        """
+        Copy of the state that is safe to serialise after the lock is
+        released (history points are never mutated once appended).
+
+        With a valid `since` cursor only the boats and history points
+        that changed after it are included ("delta": true).
+        """
+        seen = self.parse_cursor(since) if since else None
+
+        if seen is None:
+            boats = self.state["boats"]
+            history = self.state["history"]
+        else:
+            boats = {
+                entry_id: b
+                for entry_id, b in self.state["boats"].items()
+                if self.boat_revs.get(entry_id, 0) > seen
+            }
+            history = self.state["history"][bisect_right(self.history_revs, seen):]
+
+        return {
+            **self.state,
+            "boats": {
+                entry_id: {**b, "times": list(b["times"])}
+                for entry_id, b in boats.items()
+            },
+            "history": list(history),
+            "delta": seen is not None,
+            "cursor": self.cursor(),
+        }
+
+#----------------------------------------------------------#
+
+def _device_stream(events, clock=0):
+    """
+    (key, event) for one device's sequence-ordered events. The key's
+    time is the race time the device has reached, so a stream is always
+    in key order even when an event (undo, start) carries an earlier
+    race_seconds or none at all.
+    """
+
+    for ev in events:
+        clock = max(clock, ev.race_seconds or 0)
+        yield (clock, ev.device_id, ev.sequence), ev
+
+
+def merged_events(events, start=None):
+    """
+    Events of one race attempt in race time order: a k-way merge of each
+    device's sequence-ordered stream, each read through its own cursor
+    so a long log is never held in memory.
+
+    `start` maps a device to the (sequence, clock) already replayed from
+    it, to carry on from a checkpoint.
+
+    Duplicates within a device can't reach the log: (device_id,
+    sequence) is unique and ingest reports repeats as "duplicate".
+    """
+    devices = list(
+        events.order_by("device_id").values_list("device_id", flat=True).distinct()
+    )
+
+    start = start or {}
+    streams = []
+
+    for device_id in devices:
+        sequence, clock = start.get(device_id, (None, 0))
+        stream = events.filter(device_id=device_id)
+
+        if sequence is not None:
+            stream = stream.filter(sequence__gt=sequence)
+
+        streams.append(_device_stream(
+            stream.order_by("sequence").iterator(chunk_size=STREAM_CHUNK_SIZE),
+            clock,
+        ))
+
+    yield from heapq.merge(*streams, key=lambda pair: pair[0])
+
+#----------------------------------------------------------#
+
+def race_engine_class():
+    """
+    Replay engine chosen by settings.RACE_STATE_ENGINE.
+    """
+    return import_string(settings.RACE_STATE_ENGINE)
+
+#----------------------------------------------------------#
+
+_live_engines = OrderedDict()
+_live_engines_lock = threading.Lock()
+
+
+def get_live_race_state(race_id, attempt=None, since=None):
+    """
+    Race state for the live views, kept warm per (race, attempt) so each
+    poll only replays the events added since the previous one.
+
+    `since` is the cursor from an earlier response; see RaceReplay.export.
+    """
+
+    key = (race_id, attempt)
+
+    with _live_engines_lock:
+        engine = _live_engines.get(key)
+
+        if engine is None:
+            engine = race_engine_class()(race_id, attempt)
+            _live_engines[key] = engine
+
+        _live_engines.move_to_end(key)
+
+        while len(_live_engines) > MAX_LIVE_ENGINES:
+            _live_engines.popitem(last=False)
+
+    with engine.lock:
+        engine.refresh()
+        return engine.export(since)
@@ -0,0 +1,341 @@
+import math
+from bisect import bisect_right
+
+import numpy as np
+
+from races.engine import RaceReplay
+from races.scoring import NO_TIME
+
+#----------------------------------------------------------#
+
+def _seconds(race_seconds):
+    """
+    A lap time as it is kept in the arrays: NaN when the lap has none.
+    """
+    return math.nan if race_seconds is None else race_seconds
+
+
+def _race_seconds(column):
+    """
+    Lap times from the arrays as RaceReplay holds them: ints, None for
+    a lap with no time.
+    """
+    return [None if math.isnan(t) else int(t) for t in column.tolist()]
+
+#----------------------------------------------------------#
+
+class ColumnarRaceReplay(RaceReplay):
+    """
+    RaceReplay that keeps the fleet in parallel NumPy arrays indexed by
+    entry (laps, last time, PY, corrected, positions) and the history as
+    a position matrix. Positions come from a vectorised argsort, and the
+    nested dicts are only built in export() at the API boundary.
+
+    Produces the same output as RaceReplay.
+    """
+
+    # history rows allocated up front; doubled when full
+    INITIAL_HISTORY = 256
+
+    # -------------------------------------------------
+    # INITIAL STATE
+    # -------------------------------------------------
+    def load_entries(self, fresh=False):
+        super().load_entries(fresh=fresh)
+
+        self.entry_ids = list(self.entries)
+        self.index = {entry_id: i for i, entry_id in enumerate(self.entry_ids)}
+        self.py = np.array(
+            [meta["py"] for meta in self.entries.values()], dtype=np.float64
+        )
+
+    def reset(self, attempt, total_attempts):
+        n = len(self.entry_ids)
+
+        # status only; the fleet lives in the arrays below
+        self.state = {
+            "started": False,
+            "finished": False,
+            "race_time": 0,
+            "attempt": attempt,
+            "total_attempts": total_attempts,
+        }
+
+        self.laps = np.zeros(n, dtype=np.int32)
+        self.last = np.zeros(n, dtype=np.float64)   # NaN: a lap with no time
+        self.corrected = np.full(n, np.nan)
+        self.actual_pos = np.zeros(n, dtype=np.int32)
+        self.corrected_pos = np.zeros(n, dtype=np.int32)
+        self.times = [[] for _ in range(n)]
+
+        # history: time per point + (point, actual/corrected, boat) matrix
+        self.history_len = 0
+        self.history_time = np.zeros(self.INITIAL_HISTORY, dtype=np.int64)
+        self.history_pos = np.zeros((self.INITIAL_HISTORY, 2, n), dtype=np.int32)
+
+        self.applied_ids = []
+        self.boat_revs = np.zeros(n, dtype=np.int64)
+        self.history_revs = []
+
+    # -------------------------------------------------
+    # SNAPSHOT FUNCTION
+    # -------------------------------------------------
+    def snapshot(self, time_value):
+
+        n = len(self.entry_ids)
+        rev = len(self.applied_ids)
+
+        old_corrected = self.corrected
+        old_actual = self.actual_pos.copy()
+        old_corrected_pos = self.corrected_pos.copy()
+
+        # corrected at this moment
+        max_laps = self.laps.max() if n else 0
+        sailed = (self.laps > 0) & (self.py != 0)
+
+        corrected = np.full(n, np.nan)
+        corrected[sailed] = (
+            self.last[sailed] * (max_laps / self.laps[sailed]) * 1000
+            / self.py[sailed]
+        )
+        self.corrected = corrected
+
+        ranks = np.arange(1, n + 1, dtype=np.int32)
+
+        # actual: most laps, then earliest last lap (stable like sorted())
+        last_key = np.where((self.last == 0) | np.isnan(self.last), NO_TIME, self.last)
+        self.actual_pos[np.lexsort((last_key, -self.laps))] = ranks
+
+        # corrected
+        corrected_key = np.where(np.isnan(corrected), NO_TIME, corrected)
+        self.corrected_pos[np.argsort(corrected_key, kind="stable")] = ranks
+
+        changed = (
+            (old_actual != self.actual_pos)
+            | (old_corrected_pos != self.corrected_pos)
+            | ~((old_corrected == corrected)
+                | (np.isnan(old_corrected) & np.isnan(corrected)))
+        )
+        self.boat_revs[changed] = rev
+
+        # ⭐ append (do NOT reset!)
+        if self.history_len == len(self.history_time):
+            # full → double the capacity
+            self.history_time = np.concatenate(
+                [self.history_time, np.zeros_like(self.history_time)]
+            )
+            self.history_pos = np.concatenate(
+                [self.history_pos, np.zeros_like(self.history_pos)]
+            )
+
+        self.history_time[self.history_len] = time_value
+        self.history_pos[self.history_len, 0] = self.actual_pos
+        self.history_pos[self.history_len, 1] = self.corrected_pos
+        self.history_len += 1
+        self.history_revs.append(rev)
+
+    # -------------------------------------------------
+    # APPLY ONE EVENT
+    # -------------------------------------------------
+    def apply(self, ev):
+
+        state = self.state
+
+        self.applied_ids.append(ev.id)
+        rev = len(self.applied_ids)
+
+        if ev.event_type == "start":
+            state["started"] = True
+
+        elif ev.event_type == "lap" and ev.race_entry_id:
+            i = self.index[ev.race_entry_id]
+
+            self.laps[i] += 1
+            self.times[i].append(ev.race_seconds)
+            self.last[i] = _seconds(ev.race_seconds)
+            self.boat_revs[i] = rev
+
+            state["race_time"] = max(state["race_time"], ev.race_seconds or 0)
+
+            self.snapshot(state["race_time"])  # ⭐ magic moment
+
+        elif ev.event_type == "undo" and ev.race_entry_id:
+            i = self.index[ev.race_entry_id]
+            if self.laps[i] > 0:
+                self.laps[i] -= 1
+                self.times[i].pop()
+                self.last[i] = _seconds(self.times[i][-1]) if self.times[i] else 0
+                self.boat_revs[i] = rev
+
+        elif ev.event_type == "finish":
+            state["finished"] = True
+
+    def history_moves(self, first_point):
+        """
+        (time, [(entry_id, actual_pos, corrected_pos), ...]) for each
+        history point from `first_point` on, listing only the boats whose
+        places changed since the point before, as RaceReplay records them.
+        """
+        stop = self.history_len
+
+        if first_point >= stop:
+            return []
+
+        points = self.history_pos[first_point:stop]
+        before = self.history_pos[max(first_point - 1, 0):stop - 1]
+
+        moved = (points[len(points) - len(before):] != before).any(axis=1)
+        if not first_point:
+            # the first point places every boat
+            moved = np.concatenate([np.ones((1, len(self.entry_ids)), dtype=bool), moved])
+
+        result = []
+
+        for time_value, mask, (actual_row, corrected_row) in zip(
+            self.history_time[first_point:stop].tolist(), moved, points
+        ):
+            columns = np.flatnonzero(mask)
+            result.append((time_value, list(zip(
+                [self.entry_ids[i] for i in columns.tolist()],
+                actual_row[columns].tolist(),
+                corrected_row[columns].tolist(),
+            ))))
+
+        return result
+
+    # -------------------------------------------------
+    # CHECKPOINTS (same format as RaceReplay's)
+    # -------------------------------------------------
+    def dump_checkpoint(self, start):
+
+        first_point = bisect_right(self.history_revs, start)
+        positioned = self.history_len > 0
+        n = len(self.entry_ids)
+
+        return {
+            "started": self.state["started"],
+            "finished": self.state["finished"],
+            "race_time": self.state["race_time"],
+            "entries": list(self.entry_ids),
+            "laps": self.laps.tolist(),
+            "times": [list(times) for times in self.times],
+            "last": _race_seconds(self.last),
+            "corrected": [
+                None if math.isnan(c) else c for c in self.corrected.tolist()
+            ],
+            "actual_pos": self.actual_pos.tolist() if positioned else [None] * n,
+            "corrected_pos": self.corrected_pos.tolist() if positioned else [None] * n,
+            "boat_revs": self.boat_revs.tolist(),
+            "applied_ids": self.applied_ids[start:],
+            "history_revs": self.history_revs[first_point:],
+            "history_time": self.history_time[first_point:self.history_len].tolist(),
+            "history_moves": [
+                [list(move) for move in moves] for _, moves in self.history_moves(first_point)
+            ],
+        }
+
+    def load_checkpoint(self, chain):
+
+        last = chain[-1]
+        n = len(self.entry_ids)
+
+        for name in ("started", "finished", "race_time"):
+            self.state[name] = last[name]
+
+        # checkpoint order → array index
+        columns = [self.index[entry_id] for entry_id in last["entries"]]
+
+        self.laps[columns] = last["laps"]
+        self.last[columns] = [_seconds(t) for t in last["last"]]
+        self.corrected[columns] = [
+            math.nan if c is None else c for c in last["corrected"]
+        ]
+        self.actual_pos[columns] = [p or 0 for p in last["actual_pos"]]
+        self.corrected_pos[columns] = [p or 0 for p in last["corrected_pos"]]
+        self.boat_revs[columns] = last["boat_revs"]
+
+        for i, times in zip(columns, last["times"]):
+            self.times[i] = times
+
+        points = sum(len(checkpoint["history_time"]) for checkpoint in chain)
+        capacity = max(self.INITIAL_HISTORY, points)
+
+        self.history_time = np.zeros(capacity, dtype=np.int64)
+        self.history_pos = np.zeros((capacity, 2, n), dtype=np.int32)
+        self.history_len = 0
+
+        for checkpoint in chain:
+            for time_value, moves in zip(checkpoint["history_time"], checkpoint["history_moves"]):
+                row = self.history_len
+
+                # boats that didn't move keep the previous point's places
+                if row:
+                    self.history_pos[row] = self.history_pos[row - 1]
+
+                self.history_time[row] = time_value
+                for entry_id, actual_pos, corrected_pos in moves:
+                    self.history_pos[row, :, self.index[entry_id]] = (actual_pos, corrected_pos)
+
+                self.history_len += 1
+
+            self.applied_ids.extend(checkpoint["applied_ids"])
+            self.history_revs.extend(checkpoint["history_revs"])
+
+    # -------------------------------------------------
+    # EXPORT (arrays → JSON-ready dicts)
+    # -------------------------------------------------
+    def export(self, since=None):
+
+        seen = self.parse_cursor(since) if since else None
+
+        if seen is None:
+            rows = range(len(self.entry_ids))
+            first_point = 0
+        else:
+            rows = np.flatnonzero(self.boat_revs > seen).tolist()
+            first_point = bisect_right(self.history_revs, seen)
+
+        laps = self.laps.tolist()
+        last = _race_seconds(self.last)
+        corrected = [
+            None if math.isnan(c) else c for c in self.corrected.tolist()
+        ]
+        actual_pos = self.actual_pos.tolist()
+        corrected_pos = self.corrected_pos.tolist()
+        positioned = self.history_len > 0
+
+        boats = {}
+
+        for i in rows:
+            entry_id = self.entry_ids[i]
+            boat = {
+                **self.entries[entry_id],
+                "laps": laps[i],
+                "times": list(self.times[i]),
+                "last": last[i],
+                "corrected": corrected[i],
+            }
+            if positioned:
+                boat["actual_pos"] = actual_pos[i]
+                boat["corrected_pos"] = corrected_pos[i]
+
+            boats[entry_id] = boat
+
+        history = [
+            {
+                "time": time_value,
+                "boats": {
+                    entry_id: {"actual_pos": a, "corrected_pos": c}
+                    for entry_id, a, c in moves
+                },
+            }
+            for time_value, moves in self.history_moves(first_point)
+        ]
+
+        return {
+            **self.state,
+            "boats": boats,
+            "history": history,
+            "delta": seen is not None,
+            "cursor": self.cursor(),
+        }
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from races.cache_versions import bump_cache_version, cache_version
+from races.choice_cache import VERSION_KEY as CHOICES_VERSION_KEY
+from races.models import RaceEntry
+
+
+def _version_key(race_id):
+    return f"races:entries:{race_id}:version"
+
+
+def _entries_key(race_id, version):
+    return f"races:entries:{race_id}:{version}"
+
+#----------------------------------------------------------#
+
+def race_entry_version(race_id):
+    """
+    Changes when an entry of the race changes, or a member, boat or boat
+    class does (they show in the helm, sail and class columns). Entries
+    added or removed are counted in the database, so every worker sees
+    them; edits bump the cached counters.
+    """
+    fleet = RaceEntry.objects.filter(race_id=race_id).aggregate(
+        count=Count("id"), last=Max("id")
+    )
+    return (
+        f"{fleet['count']}-{fleet['last'] or 0}."
+        f"{cache_version(_version_key(race_id))}.{cache_version(CHOICES_VERSION_KEY)}"
+    )
+
+#----------------------------------------------------------#
+
+def bump_race_entry_version(race_ids):
+    """
+    Called when entries are added, edited or removed (see races.signals,
+    and after bulk writes that skip signals).
+    """
+    for race_id in set(race_ids):
+        bump_cache_version(_version_key(race_id))
+
+#----------------------------------------------------------#
+
+def race_entry_meta(race_id, version=None, fresh=False):
+    """
+    {entry_id: {entry_id, helm, sail, py, boat_class}} for a race, as the
+    replay engine shows each boat. One query, then shared by every replay
+    and poll of the race until race_entry_version() moves on or
+    RACE_ENTRY_CACHE_TTL runs out. `fresh` skips the cached copy.
+    """
+    if version is None:
+        version = race_entry_version(race_id)
+
+    key = _entries_key(race_id, version)
+    entries = None if fresh else cache.get(key)
+
+    if entries is None:
+        entries = {
+            e.id: {
+                "entry_id": e.id,
+                "helm": e.helm.get_short_name(),
+                "sail": e.boat.sail_number,
+                "py": float(e.py_used or 0),
+                "boat_class": e.boat.boat_type.name,
+            }
+            for e in RaceEntry.objects.filter(race_id=race_id).select_related(
+                "helm", "boat__boat_type"
+            )
+        }
+        cache.set(key, entries, settings.RACE_ENTRY_CACHE_TTL)
+
+    return entries
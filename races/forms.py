@@ -1,6 +1,7 @@
 from django import forms
 from .models import BoatType, RegisteredBoat, League, RaceEntry, Race, Event
 from members.models import Member
+from .choice_cache import boat_choices, member_choices
 from django.core.exceptions import ValidationError
 from django.db import models
 
@@ -63,6 +64,16 @@ class RaceEntryForm(forms.ModelForm):
 
         self.fields["boat"].queryset = RegisteredBoat.objects.select_related("boat_type")
 
+        # dropdowns from the cache; the querysets above only validate
+        for name, choices in [
+            ("helm", member_choices()),
+            ("crew", member_choices()),
+            ("boat", boat_choices()),
+        ]:
+            field = self.fields[name]
+            blank = [("", field.empty_label)] if field.empty_label is not None else []
+            field.choices = blank + choices
+
         def clean(self):
             cleaned = super().clean()
 
@@ -0,0 +1,56 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+
+from races.engine import get_live_race_state, race_engine_class
+from races.entry_cache import race_entry_version
+from races.models import RaceEvent
+
+
+def _state_key(race_id, attempt, version, since, at=None):
+    moment = "now" if at is None else at
+    return f"races:live:{race_id}:{attempt or 'latest'}:{version}:{since or 'full'}:{moment}"
+
+#----------------------------------------------------------#
+
+def live_state_version(race_id):
+    """
+    Version of a race's live state: the size and last id of its event
+    log, and its entry version. Read from the database rather than
+    bumped on write, so an event recorded by another worker changes it
+    in every process. The live state ETag is built from it as well.
+    """
+    log = RaceEvent.objects.filter(race_id=race_id).aggregate(
+        count=Count("id"),
+        last=Max("id"),
+    )
+    return f"{log['count']}-{log['last'] or 0}-{race_entry_version(race_id)}"
+
+#----------------------------------------------------------#
+
+def get_live_state_payload(race_id, attempt=None, since=None, at=None):
+    """
+    JSON body for the live state API, shared by every viewer until the
+    next event or entry change, or LIVE_STATE_CACHE_TTL, whichever
+    comes first.
+
+    Viewers polling in step send the same `since` cursor, so deltas are
+    shared as well. With `at` (race seconds) it is the state at that
+    moment, replayed from the nearest checkpoint before it.
+    """
+    key = _state_key(race_id, attempt, live_state_version(race_id), since, at)
+    payload = cache.get(key)
+
+    if payload is None:
+        if at is None:
+            state = get_live_race_state(race_id, attempt, since)
+        else:
+            state = race_engine_class()(race_id, attempt).rebuild(until=at).export()
+
+        payload = json.dumps(state, cls=DjangoJSONEncoder)
+        cache.set(key, payload, settings.LIVE_STATE_CACHE_TTL)
+
+    return payload
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from races.archive import ARCHIVE_FORMATS, archive_records
+from races.models import Race
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream races' event logs, entries and result sets as NDJSON or "
+        "CSV (see races.archive), for import_race_log."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--race", type=int, action="append", help="Race id (repeatable).",
+        )
+        parser.add_argument(
+            "--league", type=int, action="append", help="League id (repeatable).",
+        )
+        parser.add_argument("--format", choices=ARCHIVE_FORMATS, default="ndjson")
+        parser.add_argument("--output", help="File to write. Defaults to stdout.")
+
+    def handle(self, *args, **options):
+        if not options["race"] and not options["league"]:
+            raise CommandError("Give at least one --race or --league.")
+
+        races = Race.objects.none()
+        if options["race"]:
+            races = races | Race.objects.filter(id__in=options["race"])
+        if options["league"]:
+            races = races | Race.objects.filter(league_id__in=options["league"])
+
+        lines, _ = ARCHIVE_FORMATS[options["format"]]
+
+        if options["output"]:
+            with open(options["output"], "w", newline="") as f:
+                f.writelines(lines(archive_records(races)))
+        else:
+            sys.stdout.writelines(lines(archive_records(races)))
@@ -0,0 +1,344 @@
+import random
+import time
+from datetime import date, datetime, time as time_of_day, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from members.models import Member
+from races.models import (
+    BoatType, RegisteredBoat, League, Event, Race, RaceEntry, RaceEvent,
+    ResultSet, ResultSetEntry,
+)
+from races.choice_cache import bump_choice_version
+from races.dashboard_cache import bump_dashboard_version
+from races.projection import rebuild_race_projection
+from races.services import assign_attempts, refresh_league_standings
+
+
+# (name, PY) picked from for the generated fleet
+BOAT_CLASSES = [
+    ("Laser", 1100),
+    ("Laser Radial", 1147),
+    ("RS Aero 7", 1065),
+    ("Solo", 1142),
+    ("Topper", 1365),
+    ("RS200", 1046),
+    ("Wayfarer", 1102),
+    ("GP14", 1130),
+    ("Mirror", 1390),
+    ("Enterprise", 1122),
+    ("Comet", 1210),
+    ("RS Feva XL", 1240),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic club season (leagues, fleet, members, races, "
+        "entries, timer event logs and published results) into the "
+        "configured database. The same --seed always gives the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--prefix", default="synth",
+            help="Prefix for names, emails and device ids (must be unused).",
+        )
+        parser.add_argument("--leagues", type=int, default=2)
+        parser.add_argument("--races", type=int, default=20, help="Races per league.")
+        parser.add_argument("--boats", type=int, default=60, help="Registered boats in the club.")
+        parser.add_argument("--entries", type=int, default=25, help="Entries per race.")
+        parser.add_argument("--laps", type=int, default=6, help="Laps sailed per boat.")
+        parser.add_argument("--devices", type=int, default=2, help="Timer devices per race.")
+        parser.add_argument(
+            "--undo-rate", type=float, default=0.02,
+            help="Chance a lap is mistimed, undone and timed again.",
+        )
+        parser.add_argument(
+            "--restart-rate", type=float, default=0.1,
+            help="Chance a race is restarted after a general recall.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options["entries"] > options["boats"]:
+            raise CommandError("--entries cannot be more than --boats.")
+
+        if League.objects.filter(name__startswith=f"{options['prefix']} ").exists():
+            raise CommandError(f"Prefix {options['prefix']!r} is already used.")
+
+        self.rng = random.Random(options["seed"])
+        self.options = options
+        self.prefix = options["prefix"]
+        self.batch_size = options["batch_size"]
+
+        # per-device sequence numbers carry across races, like a real timer
+        self.sequences = [0] * options["devices"]
+        self.pending_events = []
+        self.event_count = 0
+
+        started = time.monotonic()
+
+        with transaction.atomic():
+            members, boats = self.create_club()
+            leagues = self.create_leagues()
+
+            for league in leagues:
+                self.create_races(league, members, boats)
+
+            self.flush_events()
+
+            for race_id in Race.objects.filter(league__in=leagues).values_list("id", flat=True):
+                rebuild_race_projection(race_id)
+
+            for league in leagues:
+                refresh_league_standings(league)
+
+            # bulk_create skips the signals that keep these caches fresh
+            transaction.on_commit(bump_dashboard_version)
+            transaction.on_commit(bump_choice_version)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(leagues)} leagues, {len(boats)} boats, "
+            f"{self.event_count} race events in {time.monotonic() - started:.1f}s"
+        ))
+
+    # -------------------------------------------------
+    # CLUB
+    # -------------------------------------------------
+    def create_club(self):
+        prefix = self.prefix
+        count = self.options["boats"]
+
+        boat_types = BoatType.objects.bulk_create([
+            BoatType(name=f"{prefix} {name}", py=py)
+            for name, py in BOAT_CLASSES
+        ])
+
+        # every boat has an owner who helms it; a second pool crews
+        password = make_password(None)
+        members = Member.objects.bulk_create([
+            Member(
+                username=f"{prefix}-{i}",
+                email=f"{prefix}-{i}@example.com",
+                full_name=f"Sailor {prefix} {i}",
+                email_verified=True,
+                password=password,
+            )
+            for i in range(count * 2)
+        ], batch_size=self.batch_size)
+
+        boats = RegisteredBoat.objects.bulk_create([
+            RegisteredBoat(
+                sail_number=str(100000 + i),
+                boat_type=self.rng.choice(boat_types),
+            )
+            for i in range(count)
+        ], batch_size=self.batch_size)
+
+        return members, boats
+
+    def create_leagues(self):
+        year = timezone.now().year
+
+        return League.objects.bulk_create([
+            League(
+                name=f"{self.prefix} league {i + 1}",
+                date_from=date(year, 1, 1),
+                date_to=date(year, 12, 31),
+            )
+            for i in range(self.options["leagues"])
+        ])
+
+    # -------------------------------------------------
+    # RACES
+    # -------------------------------------------------
+    def create_races(self, league, members, boats):
+        opts = self.options
+        count = opts["races"]
+        officer = members[-1]
+
+        # weekly races ending today; the most recent one is still running
+        first_day = timezone.now().date() - timedelta(weeks=count - 1)
+        tz = timezone.get_current_timezone()
+
+        events = Event.objects.bulk_create([
+            Event(
+                start_datetime=datetime.combine(
+                    first_day + timedelta(weeks=i), time_of_day(14), tzinfo=tz
+                ),
+                type=Event.EventType.RACE,
+                created_by=officer,
+            )
+            for i in range(count)
+        ])
+
+        races = Race.objects.bulk_create([
+            Race(
+                event=event,
+                league=league,
+                race_officer=officer,
+                status=(
+                    Race.RaceStatus.RUNNING if i == count - 1
+                    else Race.RaceStatus.FINISHED
+                ),
+            )
+            for i, event in enumerate(events)
+        ])
+
+        fleet_size = len(boats)
+        entries = []
+
+        for race in races:
+            for i in self.rng.sample(range(fleet_size), opts["entries"]):
+                boat = boats[i]
+                crew = members[fleet_size + i] if self.rng.random() < 0.5 else None
+                entries.append(RaceEntry(
+                    race=race,
+                    helm=members[i],
+                    crew=crew,
+                    boat=boat,
+                    boat_type_name=boat.boat_type.name,
+                    py_used=boat.boat_type.py,
+                ))
+
+        entries = RaceEntry.objects.bulk_create(entries, batch_size=self.batch_size)
+
+        results = []
+
+        for n, race in enumerate(races):
+            race_entries = entries[n * opts["entries"]:(n + 1) * opts["entries"]]
+            finished = race.status == Race.RaceStatus.FINISHED
+            finish_times = self.create_event_log(race, race_entries, finished)
+
+            if finished:
+                results.append((race, finish_times))
+
+        self.create_results(results, officer)
+
+    def create_event_log(self, race, entries, finished):
+        """
+        Timer events for one race; returns {entry: (laps, last lap seconds)}
+        of the attempt that counted.
+        """
+        opts = self.options
+        rng = self.rng
+
+        self.add_signal(race, "start", seconds=0)
+
+        if rng.random() < opts["restart_rate"]:
+            # general recall a minute or two in
+            recall = rng.randint(60, 150)
+            for entry in rng.sample(entries, min(3, len(entries))):
+                self.add_event(race, "lap", entry, rng.randint(20, recall))
+            self.add_signal(race, "restart")
+            self.add_signal(race, "start", seconds=0)
+
+        base_lap = rng.randint(600, 900)
+        crossings = []
+
+        for entry in entries:
+            pace = base_lap * entry.py_used / 1000 * rng.uniform(0.95, 1.1)
+            elapsed = 0
+            for _ in range(opts["laps"]):
+                elapsed += int(pace * rng.uniform(0.93, 1.07))
+                crossings.append((elapsed, entry.id, entry))
+
+        crossings.sort()
+
+        # a running race has only got part way round
+        if not finished:
+            crossings = crossings[:rng.randint(1, max(1, len(crossings) - 1))]
+
+        result = {}
+
+        for seconds, _, entry in crossings:
+            if rng.random() < opts["undo_rate"]:
+                self.add_event(race, "lap", entry, seconds)
+                self.add_event(race, "undo", entry, seconds)
+
+            self.add_event(race, "lap", entry, seconds)
+
+            laps, _ = result.get(entry, (0, 0))
+            result[entry] = (laps + 1, seconds)
+
+        if finished:
+            self.add_signal(race, "finish", seconds=crossings[-1][0] if crossings else 0)
+
+        return result
+
+    def add_signal(self, race, event_type, seconds=None):
+        """
+        Start / restart / finish: every timer records it on its own clock.
+        """
+        for device in range(len(self.sequences)):
+            self.add_event(race, event_type, seconds=seconds, device=device)
+
+    def add_event(self, race, event_type, entry=None, seconds=None, device=None):
+        if device is None:
+            device = self.rng.randrange(len(self.sequences))
+        self.sequences[device] += 1
+
+        # ids rather than instances: skips the related descriptors
+        self.pending_events.append(RaceEvent(
+            race_id=race.id,
+            device_id=f"{self.prefix}-timer-{device + 1}",
+            sequence=self.sequences[device],
+            event_type=event_type,
+            race_entry_id=entry.id if entry else None,
+            race_seconds=seconds,
+        ))
+
+        if len(self.pending_events) >= self.batch_size:
+            self.flush_events()
+
+    def flush_events(self):
+        assign_attempts(self.pending_events)
+        RaceEvent.objects.bulk_create(self.pending_events, batch_size=self.batch_size)
+        self.event_count += len(self.pending_events)
+        self.pending_events = []
+
+    # -------------------------------------------------
+    # RESULTS
+    # -------------------------------------------------
+    def create_results(self, results, officer):
+        now = timezone.now()
+
+        result_sets = ResultSet.objects.bulk_create([
+            ResultSet(
+                race=race,
+                created_by=officer,
+                source=ResultSet.Source.TIMED,
+                state=ResultSet.State.PUBLISHED,
+                published_at=now,
+            )
+            for race, _ in results
+        ])
+
+        rows = []
+
+        for result_set, (race, finish_times) in zip(result_sets, results):
+            max_laps = max((laps for laps, _ in finish_times.values()), default=0)
+            corrected = sorted(
+                (
+                    (last * (max_laps / laps) * 1000 / entry.py_used, entry, laps, last)
+                    for entry, (laps, last) in finish_times.items()
+                ),
+                key=lambda row: (row[0], row[1].id),
+            )
+
+            for position, (seconds, entry, laps, last) in enumerate(corrected, 1):
+                rows.append(ResultSetEntry(
+                    result_set=result_set,
+                    race_entry=entry,
+                    laps=laps,
+                    elapsed_seconds=last,
+                    corrected_seconds=seconds,
+                    finish_position=position,
+                ))
+
+        ResultSetEntry.objects.bulk_create(rows, batch_size=self.batch_size)
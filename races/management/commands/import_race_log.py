@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from races.archive import ArchiveImporter, read_csv, read_ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        "Import an export_race_log archive. Events already stored (same "
+        "device_id and sequence) are skipped, so re-running is safe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format", choices=["ndjson", "csv"],
+            help="Defaults to the file extension.",
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "ndjson")
+        reader = read_csv if fmt == "csv" else read_ndjson
+
+        with open(path, newline="") as f:
+            counts = ArchiveImporter(options["batch_size"]).run(reader(f))
+
+        self.stdout.write(", ".join(f"{name}: {count}" for name, count in counts.items()))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from races.models import League
+from races.services import refresh_league_standings
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored league tables from published result sets."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--league",
+            type=int,
+            action="append",
+            help="League id to rebuild (repeatable). Defaults to all leagues.",
+        )
+
+    def handle(self, *args, **options):
+        leagues = League.objects.order_by("id")
+
+        if options["league"]:
+            leagues = leagues.filter(id__in=options["league"])
+
+        for league in leagues:
+            refresh_league_standings(league)
+            self.stdout.write(f"{league}: {league.standings.count()} sailors")
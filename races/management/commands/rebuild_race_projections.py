@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from races.models import Race
+from races.projection import rebuild_race_projection
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-entry race projections from the event log."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--race",
+            type=int,
+            action="append",
+            help="Race id to rebuild (repeatable). Defaults to all races.",
+        )
+        parser.add_argument(
+            "--league",
+            type=int,
+            action="append",
+            help="Only races in this league (repeatable).",
+        )
+
+    def handle(self, *args, **options):
+        races = Race.objects.order_by("id")
+
+        if options["race"]:
+            races = races.filter(id__in=options["race"])
+        if options["league"]:
+            races = races.filter(league_id__in=options["league"])
+
+        count = 0
+
+        for race_id in races.values_list("id", flat=True).iterator():
+            # the same row lock ingest takes, so no batch lands mid-rebuild
+            with transaction.atomic():
+                Race.objects.select_for_update().filter(id=race_id).exists()
+                rebuild_race_projection(race_id)
+            count += 1
+
+        self.stdout.write(f"{count} races rebuilt")
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.28 on 2026-10-18 10:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('races', '0014_resultsetentry_tied'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeagueStanding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('race_points', models.JSONField(default=dict)),
+                ('sailed', models.IntegerField(default=0)),
+                ('counted', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='races.league')),
+                ('sailor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='league_standings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['league', '-total'], name='standing_league_total_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='leaguestanding',
+            constraint=models.UniqueConstraint(fields=('league', 'sailor'), name='unique_standing_per_league_sailor'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.28 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0015_leaguestanding_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='raceevent',
+            index=models.Index(fields=['race', 'device_id', 'sequence'], name='raceevent_race_replay_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='raceevent',
+            index=models.Index(fields=['race', 'id'], name='raceevent_race_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='raceevent',
+            index=models.Index(condition=models.Q(('event_type__in', ['start', 'finish', 'restart'])), fields=['race', 'event_type'], name='raceevent_race_marker_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resultset',
+            index=models.Index(fields=['race', 'state'], name='resultset_race_state_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.28 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+def number_attempts(apps, schema_editor):
+    """
+    Existing events default to attempt 1; only races with a restart need
+    renumbering. As services.assign_attempts does it: 1 + the restarts
+    the event's device sent up to and including it, in sequence order.
+    """
+    RaceEvent = apps.get_model("races", "RaceEvent")
+
+    race_ids = (
+        RaceEvent.objects.filter(event_type="restart")
+        .values_list("race_id", flat=True)
+        .distinct()
+    )
+
+    for race_id in race_ids:
+        attempts = {}
+        attempt = 1
+        device = None
+
+        for event_id, device_id, event_type in (
+            RaceEvent.objects.filter(race_id=race_id)
+            .order_by("device_id", "sequence")
+            .values_list("id", "device_id", "event_type")
+        ):
+            if device_id != device:
+                device = device_id
+                attempt = 1
+
+            if event_type == "restart":
+                attempt += 1
+            attempts.setdefault(attempt, []).append(event_id)
+
+        for attempt, ids in attempts.items():
+            if attempt > 1:
+                RaceEvent.objects.filter(id__in=ids).update(attempt=attempt)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0016_race_access_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='raceevent',
+            name='attempt',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='raceevent',
+            index=models.Index(fields=['race', 'attempt', 'device_id', 'sequence'], name='raceevent_attempt_replay_idx'),
+        ),
+        migrations.RunPython(number_attempts, migrations.RunPython.noop),
+    ]
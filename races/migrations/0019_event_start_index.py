@@ -0,0 +1,17 @@
+# Generated by Django 4.2.28 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0017_raceevent_attempt'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['start_datetime', 'id'], name='event_start_idx'),
+        ),
+    ]
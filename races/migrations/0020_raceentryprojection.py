@@ -0,0 +1,25 @@
+# Generated by Django 4.2.28 on 2026-10-18 11:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0019_event_start_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RaceEntryProjection',
+            fields=[
+                ('race_entry', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='projection', serialize=False, to='races.raceentry')),
+                ('attempt', models.PositiveIntegerField(default=1)),
+                ('laps', models.PositiveIntegerField(default=0)),
+                ('last_seconds', models.IntegerField(default=0)),
+                ('lap_times', models.JSONField(default=list)),
+                ('race', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entry_projections', to='races.race')),
+            ],
+        ),
+    ]
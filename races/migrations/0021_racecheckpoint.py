@@ -0,0 +1,32 @@
+# Generated by Django 4.2.28 on 2026-10-18 11:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0020_raceentryprojection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RaceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempt', models.PositiveIntegerField()),
+                ('position', models.PositiveIntegerField()),
+                ('race_seconds', models.IntegerField()),
+                ('fleet', models.CharField(max_length=64)),
+                ('last_key', models.JSONField()),
+                ('devices', models.JSONField()),
+                ('state', models.JSONField()),
+                ('race', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='races.race')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='racecheckpoint',
+            constraint=models.UniqueConstraint(fields=('race', 'attempt', 'position'), name='unique_checkpoint_per_position'),
+        ),
+    ]
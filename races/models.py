@@ -55,6 +55,15 @@ class Event(models.Model):
 
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # race list: newest first, seeking from a (start, id) cursor
+            models.Index(
+                fields=["start_datetime", "id"],
+                name="event_start_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.get_type_display()} @ {self.start_datetime}"
     
@@ -192,11 +201,100 @@ class RaceEvent(models.Model):
     # seconds from race start
     race_seconds = models.IntegerField(null=True, blank=True)
 
+    # 1 + restarts this event's device sent up to it (by sequence); set
+    # on ingest by services.assign_attempts (a restart opens the attempt
+    # it numbers)
+    attempt = models.PositiveIntegerField(default=1)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ("device_id", "sequence")
         ordering = ["sequence"]
+        indexes = [
+            # replay: one race in event order
+            models.Index(
+                fields=["race", "device_id", "sequence"],
+                name="raceevent_race_replay_idx",
+            ),
+            # replay of a single attempt
+            models.Index(
+                fields=["race", "attempt", "device_id", "sequence"],
+                name="raceevent_attempt_replay_idx",
+            ),
+            # incremental replay: one race, ids after the last seen
+            models.Index(fields=["race", "id"], name="raceevent_race_id_idx"),
+            # "has this race started / finished" probes; markers are a
+            # handful of rows per race, so the index stays tiny. Postgres
+            # only: SQLite can't match a partial index against a bound
+            # parameter and searches by race instead.
+            models.Index(
+                fields=["race", "event_type"],
+                condition=models.Q(event_type__in=["start", "finish", "restart"]),
+                name="raceevent_race_marker_idx",
+            ),
+        ]
+
+class RaceEntryProjection(models.Model):
+    """
+    Where one entry stands in its race's latest attempt, kept in step
+    with the event log as events are recorded (races.projection).
+    """
+    race_entry = models.OneToOneField(
+        RaceEntry,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="projection",
+    )
+    race = models.ForeignKey(
+        Race,
+        on_delete=models.CASCADE,
+        related_name="entry_projections",
+    )
+
+    attempt = models.PositiveIntegerField(default=1)
+    laps = models.PositiveIntegerField(default=0)
+    # race_seconds of the last lap still standing (0 = none)
+    last_seconds = models.IntegerField(default=0)
+    lap_times = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"{self.race_entry_id}: {self.laps} laps"
+
+class RaceCheckpoint(models.Model):
+    """
+    Replay state of a race attempt after its first `position` events,
+    saved by the replay engine so later replays start from here
+    (RaceReplay.restore_checkpoint).
+    """
+    race = models.ForeignKey(
+        Race,
+        on_delete=models.CASCADE,
+        related_name="checkpoints",
+    )
+
+    attempt = models.PositiveIntegerField()
+    # events replayed, in merge order
+    position = models.PositiveIntegerField()
+    # race time of the last event replayed (its merge key's clock)
+    race_seconds = models.IntegerField()
+
+    # fleet the state was built for (RaceReplay.fleet)
+    fleet = models.CharField(max_length=64)
+    # merge key of the last event replayed: [clock, device_id, sequence]
+    last_key = models.JSONField()
+    # device → [last sequence, clock, events] replayed from its stream
+    devices = models.JSONField()
+    # RaceReplay.dump_checkpoint
+    state = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["race", "attempt", "position"], name="unique_checkpoint_per_position"),
+        ]
+
+    def __str__(self):
+        return f"{self.race_id} attempt {self.attempt} @ {self.position}"
 
 class ResultSet(models.Model):
 
@@ -237,11 +335,15 @@ class ResultSet(models.Model):
 
     class Meta:
         constraints = [
+            # also serves the (race, source, created_by) lookups
             models.UniqueConstraint(
                 fields=["race", "created_by", "source"],
                 name="unique_resultset_per_user_source"
             )
         ]
+        indexes = [
+            models.Index(fields=["race", "state"], name="resultset_race_state_idx"),
+        ]
 
 
     def __str__(self):
@@ -267,4 +369,43 @@ class ResultSetEntry(models.Model):
     corrected_seconds = models.FloatField(null=True, blank=True)
 
 
+class LeagueStanding(models.Model):
+    """
+    Materialised league table row, rebuilt for a league whenever one of
+    its races has a result set published or unpublished.
+    """
+
+    league = models.ForeignKey(
+        League,
+        on_delete=models.CASCADE,
+        related_name="standings"
+    )
+
+    sailor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="league_standings"
+    )
+
+    # {race_id: points}
+    race_points = models.JSONField(default=dict)
+
+    sailed = models.IntegerField(default=0)
+    counted = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["league", "sailor"],
+                name="unique_standing_per_league_sailor"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["league", "-total"], name="standing_league_total_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.league} - {self.sailor} - {self.total}"
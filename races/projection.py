@@ -0,0 +1,225 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db.models import Case, F, FloatField, Max, Q, Subquery, Value, When, Window
+from django.db.models.functions import Cast, Coalesce, Rank
+
+from races.engine import merged_events
+from races.models import RaceEntry, RaceEntryProjection, RaceEvent
+
+
+def _apply(row, ev):
+    """
+    One lap / undo on a projection row, as RaceReplay.apply does it.
+    """
+    if ev.event_type == "lap":
+        row.laps += 1
+        row.lap_times.append(ev.race_seconds)
+        row.last_seconds = ev.race_seconds or 0
+
+    elif ev.event_type == "undo" and row.laps > 0:
+        row.laps -= 1
+        row.lap_times.pop()
+        row.last_seconds = (row.lap_times[-1] or 0) if row.lap_times else 0
+
+#----------------------------------------------------------#
+
+def rebuild_race_projection(race_id):
+    """
+    Replay the race's latest attempt from the event log into fresh
+    projection rows, one per entry.
+    """
+    events = RaceEvent.objects.filter(race_id=race_id)
+    attempt = events.aggregate(attempt=Max("attempt"))["attempt"] or 1
+
+    rows = {
+        entry_id: RaceEntryProjection(race_entry_id=entry_id, race_id=race_id, attempt=attempt)
+        for entry_id in RaceEntry.objects.filter(race_id=race_id).values_list("id", flat=True)
+    }
+
+    if rows:
+        for _, ev in merged_events(events.filter(attempt=attempt).exclude(event_type="restart")):
+            if ev.race_entry_id in rows:
+                _apply(rows[ev.race_entry_id], ev)
+
+    RaceEntryProjection.objects.filter(race_id=race_id).delete()
+    RaceEntryProjection.objects.bulk_create(rows.values())
+
+#----------------------------------------------------------#
+
+def project_race_events(events):
+    """
+    Bring the projections of the races in `events` up to date. Call in
+    the transaction that inserted the events, after assign_attempts.
+
+    Events that sort after everything already projected are applied to
+    the rows in place. A restart, a late event from a device's offline
+    queue, or one that sorts before another device's projected events
+    rebuilds that race from its log instead: the rules
+    RaceReplay.refresh follows.
+    """
+    by_race = defaultdict(list)
+
+    for ev in events:
+        by_race[ev.race_id].append(ev)
+
+    for race_id, new in by_race.items():
+        if not _project_in_place(race_id, new):
+            rebuild_race_projection(race_id)
+
+
+def _project_in_place(race_id, new):
+    """
+    Apply `new` to the race's rows; False when the race needs a rebuild.
+    """
+    if any(ev.event_type == "restart" for ev in new):
+        return False
+
+    rows = {
+        row.race_entry_id: row
+        for row in RaceEntryProjection.objects.filter(race_id=race_id)
+    }
+    attempts = {row.attempt for row in rows.values()}
+
+    # never projected, or out of step
+    if len(attempts) != 1:
+        return False
+
+    attempt = attempts.pop()
+
+    if any(ev.attempt > attempt for ev in new):
+        return False
+
+    # what was stored before this batch, per device
+    new_keys = defaultdict(list)
+    for ev in new:
+        new_keys[ev.device_id].append(ev.sequence)
+
+    in_attempt = Q(attempt=attempt) & ~Q(event_type="restart")
+
+    devices = {}
+    latest_attempt = attempt
+
+    for device_id, sequence, last_attempt, clock, attempt_sequence in (
+        RaceEvent.objects.filter(race_id=race_id)
+        .exclude(reduce(or_, (
+            Q(device_id=device_id, sequence__in=sequences)
+            for device_id, sequences in new_keys.items()
+        )))
+        .order_by()
+        .values_list("device_id")
+        .annotate(
+            last_sequence=Max("sequence"),
+            last_attempt=Max("attempt"),
+            clock=Max(Coalesce("race_seconds", 0), filter=in_attempt),
+            attempt_sequence=Max("sequence", filter=in_attempt),
+        )
+    ):
+        devices[device_id] = (sequence, clock, attempt_sequence)
+        latest_attempt = max(latest_attempt, last_attempt)
+
+    if latest_attempt != attempt:
+        return False
+
+    # late offline queue: lands inside a device's stored stream
+    for ev in new:
+        if ev.device_id in devices and ev.sequence < devices[ev.device_id][0]:
+            return False
+
+    last_key = max(
+        (
+            (clock, device_id, attempt_sequence)
+            for device_id, (_, clock, attempt_sequence) in devices.items()
+            if clock is not None
+        ),
+        default=None,
+    )
+
+    clocks = {device_id: clock or 0 for device_id, (_, clock, _) in devices.items()}
+    keyed = []
+
+    for ev in sorted(new, key=lambda ev: (ev.device_id, ev.sequence)):
+        if ev.attempt != attempt:
+            continue
+
+        clocks[ev.device_id] = max(clocks.get(ev.device_id, 0), ev.race_seconds or 0)
+        keyed.append(((clocks[ev.device_id], ev.device_id, ev.sequence), ev))
+
+    keyed.sort(key=lambda pair: pair[0])
+
+    # another device's event lands before what is projected
+    if keyed and last_key is not None and keyed[0][0] < last_key:
+        return False
+
+    changed = {}
+    created = {}
+
+    for _, ev in keyed:
+        if ev.event_type not in ("lap", "undo") or not ev.race_entry_id:
+            continue
+
+        row = rows.get(ev.race_entry_id)
+
+        # entered after the race was last projected
+        if row is None:
+            row = rows[ev.race_entry_id] = created[ev.race_entry_id] = RaceEntryProjection(
+                race_entry_id=ev.race_entry_id, race_id=race_id, attempt=attempt
+            )
+
+        _apply(row, ev)
+
+        if ev.race_entry_id not in created:
+            changed[ev.race_entry_id] = row
+
+    RaceEntryProjection.objects.bulk_update(
+        changed.values(), ["laps", "last_seconds", "lap_times"]
+    )
+    RaceEntryProjection.objects.bulk_create(created.values())
+
+    return True
+
+#----------------------------------------------------------#
+
+def projected_standings(race_id):
+    """
+    The race's projection rows with laps and a last lap time, each with
+    its corrected time and place on it, in one query.
+
+    Corrected time is worked out like races.scoring (same operations,
+    same order, so the same floats). Places come from RANK() OVER the
+    corrected time: equal times share a place, and boats with no PY come
+    last with a place each.
+    """
+    valid = RaceEntryProjection.objects.filter(
+        race_id=race_id, laps__gt=0, last_seconds__gt=0
+    )
+
+    max_laps = valid.order_by().values("race").annotate(max_laps=Max("laps")).values("max_laps")
+
+    corrected = Case(
+        When(
+            race_entry__py_used__gt=0,
+            then=(
+                F("last_seconds")
+                * (Cast(Subquery(max_laps), FloatField()) / F("laps"))
+                * Value(1000.0)
+                / F("race_entry__py_used")
+            ),
+        ),
+        output_field=FloatField(),
+    )
+
+    return (
+        valid
+        .select_related("race_entry__helm", "race_entry__boat")
+        .annotate(corrected=corrected)
+        .annotate(position=Window(
+            Rank(),
+            order_by=[
+                F("corrected").asc(nulls_last=True),
+                Case(When(corrected__isnull=True, then=F("race_entry_id"))),
+            ],
+        ))
+        .order_by("position", "race_entry_id")
+    )
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+
+class RaceEventHub:
+    """
+    In-process fan-out of "race X has new events" to the live streams
+    waiting in this worker's event loop.
+
+    Notifications carry no data: each stream wakes up, refreshes its
+    race state and works out what to send itself, so bursts of events
+    collapse into one wake-up.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, race_id):
+        """
+        Must be called from inside the event loop that will wait on the
+        returned asyncio.Event.
+        """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+
+        with self._lock:
+            self._subscribers[race_id].add(waiter)
+
+        return waiter
+
+    def unsubscribe(self, race_id, waiter):
+        with self._lock:
+            self._subscribers[race_id].discard(waiter)
+            if not self._subscribers[race_id]:
+                del self._subscribers[race_id]
+
+    def publish(self, race_id):
+        """
+        Safe to call from any thread (sync views run in a thread pool
+        under ASGI).
+        """
+        with self._lock:
+            waiters = list(self._subscribers.get(race_id, ()))
+
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # loop already closed → stream is gone
+                self.unsubscribe(race_id, (loop, event))
+
+
+race_event_hub = RaceEventHub()
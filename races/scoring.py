@@ -0,0 +1,256 @@
+from bisect import bisect_left
+from math import inf
+
+
+# sort key for boats with no time / no corrected time: after every boat
+# that has one
+NO_TIME = inf
+
+# tie policies for score_fleet()
+# every boat its own place, equal times in input order (live positions)
+TIES_NONE = "none"
+# equal corrected times share a place, the next place is skipped (1, 1, 3)
+TIES_EQUAL = "equal"
+
+
+def calculate_points(position, max_points=14):
+    """
+    Convert finishing position into points.
+    """
+    if not position:
+        return 0
+
+    points = max_points - (position - 1)
+    return max(points, 0)
+
+#----------------------------------------------------------#
+
+class FleetScore:
+    """
+    Result of scoring a fleet: parallel lists indexed like the input,
+    plus `order`, the input indexes from first to last place.
+
+    `tied` marks a boat sharing the place of the boat ranked above it.
+    """
+    __slots__ = ("corrected", "position", "tied", "points", "order")
+
+    def __init__(self, corrected, position, tied, points, order):
+        self.corrected = corrected
+        self.position = position
+        self.tied = tied
+        self.points = points
+        self.order = order
+
+    def ranked(self):
+        """
+        (index, position, corrected, tied, points), first place first.
+        """
+        for i in self.order:
+            yield i, self.position[i], self.corrected[i], self.tied[i], self.points[i]
+
+#----------------------------------------------------------#
+
+# Corrected = (Elapsed × (max_laps / boat_laps)) × 1000 / PY
+def corrected_times(laps, elapsed, py):
+    """
+    Corrected time per boat, projected to the most laps sailed in the
+    fleet; None when a boat has no laps, no time or no PY.
+    """
+    max_laps = max(laps, default=0)
+
+    return [
+        e * (max_laps / l) * 1000 / p if l and p and e is not None else None
+        for l, e, p in zip(laps, elapsed, py)
+    ]
+
+
+def score_fleet(laps, elapsed, py, ties=TIES_NONE, max_points=14):
+    """
+    Rank a fleet on corrected time in one pass. Takes parallel sequences
+    (laps, elapsed seconds, PY per boat); boats that can't be corrected
+    come last, in input order.
+    """
+    corrected = corrected_times(laps, elapsed, py)
+    keys = [NO_TIME if c is None else c for c in corrected]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+
+    n = len(order)
+    position = [0] * n
+    tied = [False] * n
+
+    if ties == TIES_EQUAL:
+        previous = None
+        place = 0
+
+        for rank, i in enumerate(order, 1):
+            key = keys[i]
+
+            if key == previous and key != NO_TIME:
+                tied[i] = True
+            else:
+                place = rank
+
+            position[i] = place
+            previous = key
+    else:
+        for rank, i in enumerate(order, 1):
+            position[i] = rank
+
+    # calculate_points() for every place, inlined
+    points = [max(max_points + 1 - place, 0) for place in position]
+
+    return FleetScore(corrected, position, tied, points, order)
+
+
+def score_finish_order(tied, max_points=14):
+    """
+    Places for boats already in finishing order, where tied[i] says boat
+    i dead-heated with the boat before it (1, 1, 3).
+    """
+    n = len(tied)
+    position = [0] * n
+    flags = [False] * n
+    points = [0] * n
+
+    place = 0
+
+    for i, tie in enumerate(tied):
+        if tie and i:
+            flags[i] = True
+        else:
+            place = i + 1
+
+        position[i] = place
+        points[i] = calculate_points(place, max_points)
+
+    return FleetScore([None] * n, position, flags, points, list(range(n)))
+
+
+def water_positions(laps, elapsed):
+    """
+    Places on the water: most laps first, then earliest last lap.
+    """
+    keys = [(-l, e or NO_TIME) for l, e in zip(laps, elapsed)]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+
+    position = [0] * len(order)
+    for rank, i in enumerate(order, 1):
+        position[i] = rank
+
+    return position
+
+#----------------------------------------------------------#
+
+class LiveRanking:
+    """
+    Water and corrected places of a fleet that changes a few boats at a
+    time (a lap, an undo). Both orders are kept in sorted lists of
+    (key..., index); a changed boat is moved with bisect and only the
+    stretch of places between its old and new slot is rescanned.
+
+    Places and corrected times are the same as water_positions() and
+    score_fleet(). When the most laps sailed changes every corrected
+    time changes with it, so that order is rebuilt.
+
+    corrected / actual_pos / corrected_pos hold what update() last
+    reported; a new ranking reports every boat on its first update.
+    """
+    __slots__ = (
+        "laps", "elapsed", "py", "max_laps",
+        "water", "water_keys", "by_corrected", "corrected_keys",
+        "corrected", "actual_pos", "corrected_pos", "stale",
+    )
+
+    def __init__(self, laps, elapsed, py):
+        self.laps = list(laps)
+        self.elapsed = list(elapsed)
+        self.py = list(py)
+
+        self.water_keys = [
+            (-l, e or NO_TIME, i) for i, (l, e) in enumerate(zip(self.laps, self.elapsed))
+        ]
+        self.water = sorted(self.water_keys)
+        self.max_laps = -self.water[0][0] if self.water else 0
+
+        n = len(self.laps)
+        self.corrected = [None] * n
+        self.corrected_keys = [(NO_TIME, i) for i in range(n)]
+        self.by_corrected = list(self.corrected_keys)
+        self.actual_pos = [0] * n
+        self.corrected_pos = [0] * n
+        self.stale = True
+
+    @staticmethod
+    def _move(order, old, new):
+        """
+        Swap key `old` for `new` in the sorted list; the slots touched.
+        """
+        a = bisect_left(order, old)
+        del order[a]
+        b = bisect_left(order, new)
+        order.insert(b, new)
+        return min(a, b), max(a, b)
+
+    @staticmethod
+    def _scan(order, places, lo, hi, moved):
+        for rank in range(lo, hi + 1):
+            i = order[rank][-1]
+
+            if places[i] != rank + 1:
+                places[i] = rank + 1
+                moved.add(i)
+
+    def update(self, changes):
+        """
+        Apply {index: (laps, elapsed)} and re-place the fleet. Returns
+        (moved, recorrected): indexes whose places changed and indexes
+        whose corrected time changed.
+        """
+        moved = set()
+        recorrected = set()
+        n = len(self.laps)
+
+        # water: most laps, then earliest last lap
+        lo, hi = n, -1
+        for i, (l, e) in changes.items():
+            self.laps[i] = l
+            self.elapsed[i] = e
+
+            key = (-l, e or NO_TIME, i)
+            if key != self.water_keys[i]:
+                a, b = self._move(self.water, self.water_keys[i], key)
+                self.water_keys[i] = key
+                lo, hi = min(lo, a), max(hi, b)
+
+        if self.stale:
+            lo, hi = 0, n - 1
+        self._scan(self.water, self.actual_pos, lo, hi, moved)
+
+        max_laps = -self.water[0][0] if n else 0
+        rescore = self.stale or max_laps != self.max_laps
+        self.max_laps = max_laps
+
+        # corrected: same sum as corrected_times()
+        lo, hi = n, -1
+        for i in (range(n) if rescore else changes):
+            l, e, p = self.laps[i], self.elapsed[i], self.py[i]
+            c = e * (max_laps / l) * 1000 / p if l and p and e is not None else None
+
+            if c != self.corrected[i]:
+                self.corrected[i] = c
+                recorrected.add(i)
+
+            key = (NO_TIME if c is None else c, i)
+            if key != self.corrected_keys[i]:
+                if not rescore:
+                    a, b = self._move(self.by_corrected, self.corrected_keys[i], key)
+                    lo, hi = min(lo, a), max(hi, b)
+                self.corrected_keys[i] = key
+
+        if rescore:
+            self.by_corrected = sorted(self.corrected_keys)
+            lo, hi = 0, n - 1
+        self._scan(self.by_corrected, self.corrected_pos, lo, hi, moved)
+
+        self.stale = False
+        return moved, recorrected
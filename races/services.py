@@ -1,51 +1,71 @@
+from bisect import bisect_right
 from collections import defaultdict
 from math import ceil
-from races.models import RaceEvent, RaceEntry, ResultSet, ResultSetEntry, RaceEntry
+from races.models import LeagueStanding, Race, RaceEvent, RaceEntry, ResultSet, ResultSetEntry, RaceEntry
+from races.engine import race_engine_class
+from races.projection import project_race_events
+from races.pubsub import race_event_hub
+from races.scoring import TIES_EQUAL, calculate_points, score_fleet
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
 from django.utils import timezone
 
 
-def calculate_points(position, max_points=14):
+def points_expression(position="finish_position", max_points=14):
     """
-    Convert finishing position into points.
+    calculate_points() as a database expression over a position column.
     """
-    if not position:
-        return 0
-
-    points = max_points - (position - 1)
-    return max(points, 0)
+    return Case(
+        When(**{f"{position}__gte": 1}, then=Greatest(
+            Value(max_points + 1) - F(position), Value(0)
+        )),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
 
 #----------------------------------------------------------#
 
-def calculate_league_table(league):
-
+def league_race_points(league):
     """
-    Returns sorted standings for a league.
+    (sailor_id, race_id, points) for every helm and crew in the league's
+    published result sets, best score first for each sailor.
+
+    One query: helms UNION ALL crews, points worked out by the database.
     """
 
-    entries = (
-        league.races
-        .filter(status="finished")
-        .prefetch_related("entries__helm", "entries__crew")
+    published = ResultSetEntry.objects.filter(
+        result_set__race__league=league,
+        result_set__state=ResultSet.State.PUBLISHED,
     )
 
-    sailor_points = defaultdict(list)
+    helms = published.annotate(
+        sailor=F("race_entry__helm_id"),
+        race=F("result_set__race_id"),
+        points=points_expression(),
+    ).values_list("sailor", "race", "points")
 
-    # Collect points
-    for race in entries:
-        for e in race.entries.all():
-            if hasattr(e, "points"):
-                pts = e.points
-            else:
-                # fallback
-                if not e.finish_position:
-                    pts = 0
-                else:
-                    pts = max(14 - (e.finish_position - 1), 0)
+    crews = published.filter(race_entry__crew__isnull=False).annotate(
+        sailor=F("race_entry__crew_id"),
+        race=F("result_set__race_id"),
+        points=points_expression(),
+    ).values_list("sailor", "race", "points")
+
+    return helms.union(crews, all=True).order_by("sailor", "-points")
 
-            sailor_points[e.helm].append(pts)
+#----------------------------------------------------------#
+
+def calculate_league_table(league):
+
+    """
+    Returns sorted standings for a league from its published result sets.
+    """
 
-            if e.crew:
-                sailor_points[e.crew].append(pts)
+    sailor_points = defaultdict(dict)
+
+    # rows arrive best first per sailor
+    for sailor_id, race_id, pts in league_race_points(league):
+        sailor_points[sailor_id].setdefault(race_id, pts)
 
     if not sailor_points:
         return []
@@ -55,15 +75,16 @@ def calculate_league_table(league):
 
     standings = []
 
-    for sailor, scores in sailor_points.items():
-        best = sorted(scores, reverse=True)[:discard_limit]
+    for sailor_id, race_points in sailor_points.items():
+        scores = list(race_points.values())
+        best = scores[:discard_limit]
 
         standings.append({
-            "sailor": sailor,
+            "sailor_id": sailor_id,
+            "race_points": race_points,
             "sailed": len(scores),
             "counted": len(best),
             "total": sum(best),
-            "scores": scores,
         })
 
     standings.sort(key=lambda x: x["total"], reverse=True)
@@ -72,6 +93,47 @@ def calculate_league_table(league):
 
 #----------------------------------------------------------#
 
+def refresh_league_standings(league):
+    """
+    Rebuild the stored LeagueStanding rows of one league.
+    """
+
+    table = calculate_league_table(league)
+
+    with transaction.atomic():
+        LeagueStanding.objects.filter(league=league).delete()
+        LeagueStanding.objects.bulk_create([
+            LeagueStanding(league=league, **row) for row in table
+        ])
+
+#----------------------------------------------------------#
+
+def save_result_set_state(result_set, state):
+    """
+    Save `result_set` in `state`. When it was or now is published, its
+    league's standings are rebuilt in the same transaction, so they
+    never count a set that isn't published (or miss one that is).
+    """
+    was_published = (
+        result_set.pk is not None
+        and ResultSet.objects.filter(pk=result_set.pk, state=ResultSet.State.PUBLISHED).exists()
+    )
+
+    with transaction.atomic():
+        if state != ResultSet.State.PUBLISHED:
+            result_set.published_at = None
+        elif not was_published:
+            result_set.published_at = timezone.now()
+
+        result_set.state = state
+        result_set.save()
+
+        league = result_set.race.league
+        if league and (was_published or state == ResultSet.State.PUBLISHED):
+            refresh_league_standings(league)
+
+#----------------------------------------------------------#
+
 # Corrected = (Elapsed × 1000 / PY) × (max_laps / boat_laps)
 def corrected_time(elapsed_seconds, py, laps, max_laps):
     if not elapsed_seconds or not py or not laps:
@@ -100,151 +162,218 @@ def format_seconds(total):
 #----------------------------------------------------------#
 
 def build_race_state(race_id, attempt=None):
+    """
+    Full replay of a race attempt from the event log.
+    """
+    return race_engine_class()(race_id, attempt).rebuild().export()
 
-    all_events = list(
-        RaceEvent.objects.filter(race_id=race_id)
-        .order_by("device_id", "sequence")
-    )
+#----------------------------------------------------------#
+
+def record_race_events(payloads):
+    """
+    Validate and insert a batch of timer events in one transaction.
+
+    Returns one result per payload, in the same order, keyed on
+    (device_id, sequence) with a status of "ok", "duplicate" or "error".
+    """
+
+    results = []
+    pending = []
+
+    # -------------------------------------------------
+    # PARSE
+    # -------------------------------------------------
+    for data in payloads:
+        result = {
+            "device_id": None,
+            "sequence": None,
+            "status": "error",
+        }
+        results.append(result)
+
+        if not isinstance(data, dict):
+            result["error"] = "Event must be an object"
+            continue
+
+        result["device_id"] = data.get("device_id")
+        result["sequence"] = data.get("sequence")
+
+        try:
+            event = RaceEvent(
+                race_id=int(data["race"]),
+                device_id=str(data["device_id"]),
+                sequence=int(data["sequence"]),
+                event_type=str(data["event_type"]),
+                race_entry_id=(
+                    int(data["race_entry"]) if data.get("race_entry") else None
+                ),
+                race_seconds=(
+                    int(data["race_seconds"])
+                    if data.get("race_seconds") is not None else None
+                ),
+            )
+        except KeyError as e:
+            result["error"] = f"Missing field: {e.args[0]}"
+            continue
+        except (TypeError, ValueError) as e:
+            result["error"] = str(e)
+            continue
+
+        pending.append((result, event))
+
+    if not pending:
+        return results
 
     # -------------------------------------------------
-    # FIND RESTART POINTS
+    # VALIDATE + INSERT
     # -------------------------------------------------
-    restart_indexes = [-1]
+    with transaction.atomic():
+
+        # row locks keep concurrent batches for a race from numbering
+        # attempts against the same set of restarts
+        known_races = set(
+            Race.objects.select_for_update().filter(
+                id__in={ev.race_id for _, ev in pending}
+            ).values_list("id", flat=True)
+        )
 
-    for i, ev in enumerate(all_events):
-        if ev.event_type == "restart":
-            restart_indexes.append(i)
+        entry_races = dict(
+            RaceEntry.objects.filter(
+                id__in={ev.race_entry_id for _, ev in pending if ev.race_entry_id}
+            ).values_list("id", "race_id")
+        )
 
-    total_attempts = len(restart_indexes)
+        existing = _stored_keys(ev for _, ev in pending)
 
-    if attempt is None or attempt > total_attempts:
-        attempt = total_attempts
+        to_create = []
+        created = []    # (result, event) for each event in to_create
 
-    start_index = restart_indexes[attempt - 1] + 1
-    end_index = (
-        restart_indexes[attempt]
-        if attempt < total_attempts
-        else len(all_events)
-    )
+        for result, ev in pending:
+            key = (ev.device_id, ev.sequence)
 
-    events = all_events[start_index:end_index]
+            if ev.race_id not in known_races:
+                result["error"] = "Race not found"
 
-    # -------------------------------------------------
-    # INITIAL STATE
-    # -------------------------------------------------
-    state = {
-        "started": False,
-        "finished": False,
-        "race_time": 0,
-        "attempt": attempt,
-        "total_attempts": total_attempts,
-        "boats": {},
-        "history": [],   # ⭐ important
-    }
-
-    entries = RaceEntry.objects.filter(race_id=race_id).select_related(
-        "helm", "boat"
+            elif ev.race_entry_id and entry_races.get(ev.race_entry_id) != ev.race_id:
+                result["error"] = "Race entry not found for this race"
+
+            elif key in existing:
+                # already stored → safe → treat as success
+                result["status"] = "duplicate"
+
+            else:
+                existing.add(key)
+                result["status"] = "ok"
+                created.append((result, ev))
+
+        to_create = _insert_race_events(created)
+        project_race_events(to_create)
+
+        if to_create:
+            race_ids = {ev.race_id for ev in to_create}
+            transaction.on_commit(lambda: race_events_committed(race_ids))
+
+    return results
+
+
+def _stored_keys(events):
+    """
+    The (device_id, sequence) keys of `events` already in the log (and
+    a few more: the two lists are matched separately).
+    """
+    events = list(events)
+    return set(
+        RaceEvent.objects.filter(
+            device_id__in={ev.device_id for ev in events},
+            sequence__in={ev.sequence for ev in events},
+        ).values_list("device_id", "sequence")
     )
 
-    for e in entries:
-        state["boats"][e.id] = {
-            "entry_id": e.id,
-            "helm": e.helm.get_short_name(),
-            "sail": e.boat.sail_number,
-            "py": float(e.py_used or 0),
-            "laps": 0,
-            "times": [],
-            "last": 0,
-            "corrected": None,
-            "boat_class": getattr(e.boat, "boat_type", None).name
-                if getattr(e.boat, "boat_type", None) else "",
-        }
 
-    # -------------------------------------------------
-    # SNAPSHOT FUNCTION
-    # -------------------------------------------------
-    def snapshot(time_value):
+def _insert_race_events(created):
+    """
+    Number and insert the events of `created` ((result, event) pairs).
+    A key stored by a concurrent request since `existing` was read (the
+    race lock doesn't stop that everywhere; SQLite ignores it) is
+    reported as "duplicate" and the rest are inserted again. Returns the
+    events inserted.
+    """
+    while True:
+        to_create = [ev for _, ev in created]
 
-        boats = list(state["boats"].values())
+        try:
+            with transaction.atomic():
+                assign_attempts(to_create)
+                RaceEvent.objects.bulk_create(to_create)
+            return to_create
 
-        # corrected at this moment
-        max_laps = max((b["laps"] for b in boats), default=0)
+        except IntegrityError:
+            taken = _stored_keys(to_create)
 
-        for b in boats:
-            if b["laps"] > 0 and b["py"]:
-                projected = b["last"] * (max_laps / b["laps"])
-                b["corrected"] = projected * 1000 / b["py"]
-            else:
-                b["corrected"] = None
+            # not a duplicate key after all
+            if not any((ev.device_id, ev.sequence) in taken for ev in to_create):
+                raise
 
-        # actual
-        actual = sorted(
-            boats,
-            key=lambda x: (-x["laps"], x["last"] or 999999)
-        )
-        for i, b in enumerate(actual, 1):
-            b["actual_pos"] = i
+            for result, ev in created:
+                if (ev.device_id, ev.sequence) in taken:
+                    result["status"] = "duplicate"
 
-        # corrected
-        corrected = sorted(
-            boats,
-            key=lambda x: x["corrected"] if x["corrected"] is not None else 999999
-        )
-        for i, b in enumerate(corrected, 1):
-            b["corrected_pos"] = i
-
-        # ⭐ append (do NOT reset!)
-        state["history"].append({
-            "time": time_value,
-            "boats": {
-                b["entry_id"]: {
-                    "actual_pos": b["actual_pos"],
-                    "corrected_pos": b["corrected_pos"],
-                }
-                for b in boats
-            }
-        })
+            created = [
+                (result, ev) for result, ev in created
+                if (ev.device_id, ev.sequence) not in taken
+            ]
 
-    # -------------------------------------------------
-    # REPLAY EVENTS
-    # -------------------------------------------------
-    for ev in events:
+#----------------------------------------------------------#
 
-        if ev.event_type == "start":
-            state["started"] = True
+def assign_attempts(events):
+    """
+    Set .attempt on unsaved events: 1 + the restarts their device sent
+    for the race up to and including them (a restart opens the attempt
+    it numbers). Each timer's clock restarts with its own restart, so
+    attempts are counted per device.
+
+    A restart that arrives late moves the device's later stored events
+    into the next attempt. Call inside the transaction that inserts the
+    events.
+    """
+    if not events:
+        return
 
-        elif ev.event_type == "lap" and ev.race_entry_id:
-            b = state["boats"][ev.race_entry_id]
+    restarts = defaultdict(list)
 
-            b["laps"] += 1
-            b["times"].append(ev.race_seconds)
-            b["last"] = ev.race_seconds
+    for race_id, device_id, sequence in RaceEvent.objects.filter(
+        race_id__in={ev.race_id for ev in events},
+        device_id__in={ev.device_id for ev in events},
+        event_type="restart",
+    ).values_list("race_id", "device_id", "sequence"):
+        restarts[race_id, device_id].append(sequence)
 
-            state["race_time"] = max(state["race_time"], ev.race_seconds or 0)
+    new_restarts = [ev for ev in events if ev.event_type == "restart"]
 
-            snapshot(state["race_time"])  # ⭐ magic moment
+    for ev in new_restarts:
+        restarts[ev.race_id, ev.device_id].append(ev.sequence)
 
-        elif ev.event_type == "undo" and ev.race_entry_id:
-            b = state["boats"][ev.race_entry_id]
-            if b["laps"] > 0:
-                b["laps"] -= 1
-                b["times"].pop()
-                b["last"] = b["times"][-1] if b["times"] else 0
+    for sequences in restarts.values():
+        sequences.sort()
 
-        elif ev.event_type == "finish":
-            state["finished"] = True
+    for ev in events:
+        ev.attempt = bisect_right(restarts[ev.race_id, ev.device_id], ev.sequence) + 1
 
-    # -------------------------------------------------
-    # FINAL POSITIONS (for table)
-    # -------------------------------------------------
-    if state["history"]:
-        final = state["history"][-1]["boats"]
-        for boat_id, b in state["boats"].items():
-            if boat_id in final:
-                b["actual_pos"] = final[boat_id]["actual_pos"]
-                b["corrected_pos"] = final[boat_id]["corrected_pos"]
+    for ev in new_restarts:
+        RaceEvent.objects.filter(
+            race_id=ev.race_id,
+            device_id=ev.device_id,
+            sequence__gt=ev.sequence,
+        ).update(attempt=F("attempt") + 1)
+
+#----------------------------------------------------------#
 
-    return state
+def race_events_committed(race_ids):
+    """
+    Tell the live streams that these races have new events.
+    """
+    for race_id in race_ids:
+        race_event_hub.publish(race_id)
 
 #----------------------------------------------------------#
 
@@ -283,6 +412,7 @@ def derive_race_state(race):
 
 #----------------------------------------------------------#
 
+@transaction.atomic
 def get_or_create_user_resultset(race, user, source):
     result_set, created = ResultSet.objects.get_or_create(
         race=race,
@@ -363,72 +493,54 @@ def populate_manual_position(result_set):
 #----------------------------------------------------------#
 
 def create_blank_entries(result_set):
-    entries = RaceEntry.objects.filter(race=result_set.race)
+    entry_ids = RaceEntry.objects.filter(
+        race=result_set.race
+    ).values_list("id", flat=True)
 
-    for e in entries:
-        ResultSetEntry.objects.create(
+    ResultSetEntry.objects.bulk_create([
+        ResultSetEntry(
             result_set=result_set,
-            race_entry=e
+            race_entry_id=entry_id
         )
+        for entry_id in entry_ids
+    ])
 
 #----------------------------------------------------------#
 
 def copy_entries(source, target):
-    for entry in source.entries.all():
-        ResultSetEntry.objects.create(
+    ResultSetEntry.objects.bulk_create([
+        ResultSetEntry(
             result_set=target,
-            race_entry=entry.race_entry,
+            race_entry_id=entry.race_entry_id,
             laps=entry.laps,
             elapsed_seconds=entry.elapsed_seconds,
             finish_position=entry.finish_position,
             corrected_seconds=entry.corrected_seconds,
         )
+        for entry in source.entries.all()
+    ])
 
 #----------------------------------------------------------#
 
 def build_manual_time_preview(entries):
-
-    max_laps = max(e.laps for e in entries)
-
-    temp = []
-
-    for e in entries:
-        corrected = (
-            e.elapsed_seconds * (max_laps / e.laps) * 1000 / e.py_used
-            if e.py_used else None
-        )
-
-        temp.append({
-            "entry": e,
-            "corrected_raw": corrected
-        })
-
-    ranked = sorted(
-        temp,
-        key=lambda x: x["corrected_raw"] if x["corrected_raw"] else 999999
+    """
+    Ranked preview rows for entries with laps and an elapsed time;
+    equal corrected times share a place.
+    """
+    score = score_fleet(
+        [e.laps for e in entries],
+        [e.elapsed_seconds for e in entries],
+        [e.py_used for e in entries],
+        ties=TIES_EQUAL,
     )
 
-    preview = []
-
-    last_corrected = None
-    display_position = 0
-
-    for index, r in enumerate(ranked, start=1):
-
-        if last_corrected is None:
-            display_position = 1
-        elif r["corrected_raw"] != last_corrected:
-            display_position = index
-
-        preview.append({
-            "entry": r["entry"],
-            "position": display_position,
-            "corrected": format_seconds(r["corrected_raw"]),
-            "corrected_raw": r["corrected_raw"],
-            "points": calculate_points(display_position),
-        })
-
-        last_corrected = r["corrected_raw"]
-
-    return preview
-
+    return [
+        {
+            "entry": entries[i],
+            "position": position,
+            "corrected": format_seconds(corrected),
+            "corrected_raw": corrected,
+            "points": points,
+        }
+        for i, position, corrected, _, points in score.ranked()
+    ]
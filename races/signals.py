@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .choice_cache import bump_choice_version
+from .dashboard_cache import bump_dashboard_version
+from .entry_cache import bump_race_entry_version
+from .models import BoatType, League, Race, RaceEntry, RegisteredBoat
+
+
+@receiver([post_save, post_delete], sender=Race)
+@receiver([post_save, post_delete], sender=League)
+def invalidate_dashboard(sender, **kwargs):
+    # after commit, so a read in between can't cache the old counts again
+    transaction.on_commit(bump_dashboard_version)
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+@receiver([post_save, post_delete], sender=RegisteredBoat)
+@receiver([post_save, post_delete], sender=BoatType)
+def invalidate_entry_choices(sender, update_fields=None, **kwargs):
+    # logging in saves last_login only; the dropdowns don't show it
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+
+    transaction.on_commit(bump_choice_version)
+
+
+@receiver([post_save, post_delete], sender=RaceEntry)
+def invalidate_race_entries(sender, instance, **kwargs):
+    # add_entry / edit_entry / delete_entry and the admin
+    transaction.on_commit(lambda: bump_race_entry_version([instance.race_id]))
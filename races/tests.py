@@ -1,3 +1,2044 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import expectedFailure, mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from members.models import Member
+from races.archive import ARCHIVE_FORMATS, ArchiveImporter, archive_records, read_csv, read_ndjson
+from races.choice_cache import boat_choices, member_choices
+from races.dashboard_cache import bump_dashboard_version
+from races.engine import EVENT_ORDER, RaceReplay, _live_engines
+from races.engine_columnar import ColumnarRaceReplay
+from races.entry_cache import bump_race_entry_version, race_entry_meta, race_entry_version
+from races.models import BoatType, RegisteredBoat, League, LeagueStanding, Event, Race, RaceCheckpoint, RaceEntry, RaceEntryProjection, RaceEvent, ResultSet, ResultSetEntry
+from races.pubsub import race_event_hub
+from races.projection import projected_standings, rebuild_race_projection
+from races.scoring import TIES_EQUAL, TIES_NONE, score_fleet, water_positions
+from races.views import MAX_EVENT_BATCH, RaceListView
+from races.views_api import race_stream
+from races import services
+from races.services import calculate_league_table, calculate_points, get_or_create_user_resultset, record_race_events, refresh_league_standings
+
+
+def make_race(fleet_size, prefix):
+    """
+    Race with `fleet_size` entries, each with its own helm and boat.
+    """
+    boat_type = BoatType.objects.create(name=f"{prefix} class", py=1000)
+    event = Event.objects.create(
+        start_datetime=timezone.now(),
+        type=Event.EventType.RACE,
+    )
+    race = Race.objects.create(event=event)
+
+    for i in range(fleet_size):
+        helm = Member.objects.create(
+            username=f"{prefix}-helm-{i}",
+            email=f"{prefix}-helm-{i}@example.com",
+            email_verified=True,
+        )
+        boat = RegisteredBoat.objects.create(
+            sail_number=f"{prefix}{i}", boat_type=boat_type
+        )
+        RaceEntry.objects.create(
+            race=race,
+            helm=helm,
+            boat=boat,
+            boat_type_name=boat_type.name,
+            py_used=boat_type.py,
+        )
+
+    return race
+
+#----------------------------------------------------------#
+
+class ResultSetQueryCountTests(TestCase):
+    """
+    Populating, copying and saving a result set must cost the same number
+    of queries whatever the fleet size.
+    """
+
+    def setUp(self):
+        self.user = Member.objects.create(
+            username="ro",
+            email="ro@example.com",
+            email_verified=True,
+        )
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        return len(ctx.captured_queries)
+
+    def populate(self, race, source):
+        return self.count_queries(
+            lambda: get_or_create_user_resultset(race, self.user, source)
+        )
+
+    def test_blank_population_is_constant(self):
+        small = make_race(3, "s")
+        large = make_race(30, "l")
+
+        small_count = self.populate(small, ResultSet.Source.MANUAL_TIME)
+        large_count = self.populate(large, ResultSet.Source.MANUAL_TIME)
+
+        self.assertEqual(small_count, large_count)
+        self.assertEqual(large.entries.count(), 30)
+        self.assertEqual(
+            ResultSet.objects.get(race=large).entries.count(), 30
+        )
+
+    def test_copy_population_is_constant(self):
+        counts = []
+
+        for size, prefix in ((3, "s"), (30, "l")):
+            race = make_race(size, prefix)
+            get_or_create_user_resultset(race, self.user, ResultSet.Source.MANUAL_TIME)
+            counts.append(self.populate(race, ResultSet.Source.MANUAL_POSITION))
+
+            copied = ResultSet.objects.get(
+                race=race, source=ResultSet.Source.MANUAL_POSITION
+            )
+            self.assertEqual(copied.entries.count(), size)
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_manual_position_save_is_constant(self):
+        self.client.force_login(self.user)
+        counts = []
+
+        for size, prefix in ((3, "s"), (30, "l")):
+            race = make_race(size, prefix)
+            url = reverse("race-results-manual", args=[race.pk])
+
+            # first GET creates and populates the result set
+            self.client.get(url)
+            result_set = ResultSet.objects.get(
+                race=race, source=ResultSet.Source.MANUAL_POSITION
+            )
+            rows = list(result_set.entries.order_by("id"))
+
+            data = {"action": "preview"}
+            for pos, row in enumerate(reversed(rows), 1):
+                data[f"pos_{row.id}"] = pos
+
+            counts.append(self.count_queries(lambda: self.client.post(url, data)))
+
+            positions = dict(result_set.entries.values_list("id", "finish_position"))
+            self.assertEqual(positions[rows[0].id], size)
+            self.assertEqual(positions[rows[-1].id], 1)
+
+        self.assertEqual(counts[0], counts[1])
+
+#----------------------------------------------------------#
+
+class IndexUsageTests(TestCase):
+    """
+    EXPLAIN the hot queries and check they search an index instead of
+    scanning the table. Postgres has seq scans turned off so the check
+    does not depend on the planner's view of a tiny test table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Member.objects.create(username="ix", email="ix@example.com")
+        cls.race = make_race(3, "ix")
+        entry = cls.race.entries.first()
+
+        RaceEvent.objects.bulk_create([
+            RaceEvent(race=cls.race, device_id="ix-timer", sequence=0, event_type="start"),
+            *[
+                RaceEvent(
+                    race=cls.race, device_id="ix-timer", sequence=i,
+                    event_type="lap", race_entry=entry, race_seconds=i * 60,
+                )
+                for i in range(1, 20)
+            ],
+        ])
+
+    def explain(self, queryset):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, table, **expected):
+        """
+        `expected` maps a database vendor to the index name its plan
+        must mention.
+        """
+        plan = self.explain(queryset)
+
+        if connection.vendor == "sqlite":
+            self.assertNotIn(f"SCAN {table}", plan)
+            self.assertIn("USING", plan)
+        elif connection.vendor == "postgresql":
+            self.assertNotIn(f"Seq Scan on {table}", plan)
+
+        if connection.vendor in expected:
+            self.assertIn(expected[connection.vendor], plan)
+
+    def test_replay(self):
+        self.assertUsesIndex(
+            RaceEvent.objects.filter(race=self.race).order_by(*EVENT_ORDER),
+            "races_raceevent",
+            sqlite="raceevent_race_replay_idx",
+            postgresql="raceevent_race_replay_idx",
+        )
+
+    def test_attempt_device_stream(self):
+        self.assertUsesIndex(
+            RaceEvent.objects.filter(race=self.race, attempt=1, device_id="ix-timer")
+            .exclude(event_type="restart")
+            .order_by("sequence"),
+            "races_raceevent",
+            sqlite="raceevent_attempt_replay_idx",
+            postgresql="raceevent_attempt_replay_idx",
+        )
+
+    def test_incremental_replay(self):
+        self.assertUsesIndex(
+            RaceEvent.objects.filter(race=self.race, id__gt=5),
+            "races_raceevent",
+            sqlite="raceevent_race_id_idx",
+            postgresql="raceevent_race_id_idx",
+        )
+
+    def test_marker_probe(self):
+        self.assertUsesIndex(
+            RaceEvent.objects.filter(race=self.race, event_type="start").order_by(),
+            "races_raceevent",
+            postgresql="raceevent_race_marker_idx",
+        )
+        self.assertUsesIndex(
+            Race.objects.annotate(has_events=Exists(
+                RaceEvent.objects.filter(race=OuterRef("pk"), event_type="start")
+            )),
+            "races_raceevent",
+            postgresql="raceevent_race_marker_idx",
+        )
+
+    def test_result_set_by_state(self):
+        self.assertUsesIndex(
+            ResultSet.objects.filter(race=self.race, state=ResultSet.State.PUBLISHED),
+            "races_resultset",
+            sqlite="resultset_race_state_idx",
+            postgresql="resultset_race_state_idx",
+        )
+
+    def test_result_set_by_user_source(self):
+        self.assertUsesIndex(
+            ResultSet.objects.filter(
+                race=self.race, source=ResultSet.Source.TIMED, created_by=self.user
+            ),
+            "races_resultset",
+            postgresql="unique_resultset_per_user_source",
+        )
+
+#----------------------------------------------------------#
+# VIEW BENCHMARKS
+#----------------------------------------------------------#
+
+# (races, boats per race, events in the featured race) per club size.
+# BENCHMARK_SCALE=full seeds production-sized clubs (slow).
+BENCHMARK_SIZES = {
+    "default": {
+        "small": (5, 10, 200),
+        "large": (20, 40, 2000),
+    },
+    "full": {
+        "small": (10, 20, 1000),
+        "large": (1000, 100, 10000),
+    },
+}
+
+# rows of the BENCHMARK_REPORT file, written once every benchmark has run
+benchmark_report = []
+
+# races in the dashboard benchmark's league, step by step
+DASHBOARD_RACE_STEPS = {
+    "default": (10, 500, 2000),
+    "full": (100, 10000, 50000),
+}
+
+
+def seed_club(label, races, boats, events):
+    """
+    A league of `races` finished races sharing the same `boats` entries,
+    each with a published result set, plus an event log of `events` laps
+    on the first race. Everything is bulk created.
+    """
+    today = timezone.now()
+
+    league = League.objects.create(
+        name=f"{label} league",
+        date_from=date(today.year, 1, 1),
+        date_to=date(today.year, 12, 31),
+    )
+
+    boat_types = BoatType.objects.bulk_create([
+        BoatType(name=f"{label} class {i}", py=1000 + i * 50) for i in range(3)
+    ])
+
+    helms = Member.objects.bulk_create([
+        Member(
+            username=f"{label}-helm-{i}",
+            email=f"{label}-helm-{i}@example.com",
+            email_verified=True,
+        )
+        for i in range(boats)
+    ])
+
+    registered = RegisteredBoat.objects.bulk_create([
+        RegisteredBoat(
+            sail_number=f"{label}{i}",
+            boat_type=boat_types[i % len(boat_types)],
+        )
+        for i in range(boats)
+    ])
+
+    events_ = Event.objects.bulk_create([
+        Event(start_datetime=today - timedelta(days=i), type=Event.EventType.RACE)
+        for i in range(races)
+    ])
+
+    race_rows = Race.objects.bulk_create([
+        Race(event=event, league=league, status=Race.RaceStatus.FINISHED)
+        for event in events_
+    ])
+
+    entries = RaceEntry.objects.bulk_create([
+        RaceEntry(
+            race=race,
+            helm=helm,
+            boat=boat,
+            boat_type_name=boat.boat_type.name,
+            py_used=boat.boat_type.py,
+        )
+        for race in race_rows
+        for helm, boat in zip(helms, registered)
+    ])
+
+    result_sets = ResultSet.objects.bulk_create([
+        ResultSet(
+            race=race,
+            created_by=helms[0],
+            source=ResultSet.Source.MANUAL_POSITION,
+            state=ResultSet.State.PUBLISHED,
+            published_at=today,
+        )
+        for race in race_rows
+    ])
+
+    ResultSetEntry.objects.bulk_create([
+        ResultSetEntry(
+            result_set=result_sets[i // boats],
+            race_entry=entry,
+            finish_position=i % boats + 1,
+        )
+        for i, entry in enumerate(entries)
+    ])
+
+    race = race_rows[0]
+    fleet = entries[:boats]
+    device = f"{label}-timer"
+
+    log = [RaceEvent(race=race, device_id=device, sequence=0, event_type="start")]
+    log += [
+        RaceEvent(
+            race=race,
+            device_id=device,
+            sequence=i,
+            event_type="lap",
+            race_entry=fleet[i % boats],
+            race_seconds=i * 5,
+        )
+        for i in range(1, events)
+    ]
+    RaceEvent.objects.bulk_create(log)
+
+    rebuild_race_projection(race.id)
+    refresh_league_standings(league)
+
+    return {"league": league, "race": race}
+
+#----------------------------------------------------------#
+
+class DashboardCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+        self.user = Member.objects.create(
+            username="officer",
+            email="officer@example.com",
+            email_verified=True,
+        )
+        self.client.force_login(self.user)
+
+        today = timezone.now()
+        self.league = League.objects.create(
+            name="Summer",
+            date_from=date(today.year, 1, 1),
+            date_to=date(today.year, 12, 31),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.race = Race.objects.create(
+                event=Event.objects.create(start_datetime=today, type=Event.EventType.RACE),
+                league=self.league,
+            )
+
+    def counts(self):
+        league, = self.client.get(reverse("active-leagues")).context["leagues"]
+        return {
+            status: getattr(league, f"{status}_count")
+            for status in Race.RaceStatus.values
+            if getattr(league, f"{status}_count")
+        }
+
+    def test_status_change_refreshes_counts(self):
+        self.assertEqual(self.counts(), {"draft": 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.race.status = Race.RaceStatus.FINISHED
+            self.race.save()
+
+        self.assertEqual(self.counts(), {"finished": 1})
+
+    def test_counts_are_cached(self):
+        self.counts()
+
+        with self.assertNumQueries(2):  # session + user
+            self.counts()
+
+
+class EntryChoicesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.race = make_race(2, "choice")
+
+    def test_additions_in_another_worker_show(self):
+        member_choices()
+        boat_choices()
+
+        # another worker: its on-commit bump never reaches this cache
+        helm = Member.objects.create(username="late-helm", email="late-helm@example.com")
+        boat = RegisteredBoat.objects.create(
+            sail_number="late", boat_type=BoatType.objects.get(name="choice class")
+        )
+
+        self.assertIn((helm.id, "late-helm"), member_choices())
+        self.assertIn((boat.id, str(boat)), boat_choices())
+
+    def test_choices_are_cached(self):
+        member_choices()
+
+        with self.assertNumQueries(2):  # the member and boat versions
+            member_choices()
+
+
+@mock.patch.object(RaceListView, "page_size", 3)
+class RaceListPagingTests(TestCase):
+
+    def setUp(self):
+        self.user = Member.objects.create(
+            username="officer",
+            email="officer@example.com",
+            email_verified=True,
+        )
+        self.client.force_login(self.user)
+
+        # runs of races with the same start straddle the page breaks
+        start = timezone.now().replace(microsecond=0)
+        for hours in (0, 0, 0, 1, 1, 2, 2, 2, 2, 3, 4):
+            Race.objects.create(
+                event=Event.objects.create(
+                    start_datetime=start - timedelta(hours=hours), type=Event.EventType.RACE
+                ),
+            )
+
+        self.newest_first = list(
+            Race.objects.order_by("-event__start_datetime", "-event__id").values_list("id", flat=True)
+        )
+
+    def page(self, **cursor):
+        context = self.client.get(reverse("races-list"), cursor).context
+        return [race.id for race in context["races"]], context["older_cursor"], context["newer_cursor"]
+
+    def test_walk_older_then_newer(self):
+        pages = []
+        races, older, newer = self.page()
+        self.assertIsNone(newer)
+
+        while True:
+            pages.append(races)
+            if older is None:
+                break
+            races, older, newer = self.page(after=older)
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+        self.assertEqual(sum(pages, []), self.newest_first)
+
+        # and back from the last page
+        back = [races]
+        while newer is not None:
+            races, older, newer = self.page(before=newer)
+            self.assertIsNotNone(older)
+            back.insert(0, races)
+
+        self.assertEqual(back, pages)
+
+
+class LeagueTableTests(TestCase):
+    """
+    Three helms in one league, the first with a crew, and result sets
+    scored by hand.
+    """
+
+    def setUp(self):
+        self.officer = Member.objects.create(
+            username="officer",
+            email="officer@example.com",
+            email_verified=True,
+        )
+        self.client.force_login(self.officer)
+
+        today = timezone.now()
+        self.league = League.objects.create(
+            name="Autumn",
+            date_from=date(today.year, 1, 1),
+            date_to=date(today.year, 12, 31),
+        )
+        boat_type = BoatType.objects.create(name="league class", py=1000)
+
+        self.helms = [
+            Member.objects.create(
+                username=f"league-helm-{i}",
+                email=f"league-helm-{i}@example.com",
+                email_verified=True,
+            )
+            for i in range(3)
+        ]
+        self.crew = Member.objects.create(
+            username="league-crew",
+            email="league-crew@example.com",
+            email_verified=True,
+        )
+        self.boats = [
+            RegisteredBoat.objects.create(sail_number=f"L{i}", boat_type=boat_type)
+            for i in range(3)
+        ]
+
+    def league_race(self, crewed=True):
+        race = Race.objects.create(
+            event=Event.objects.create(start_datetime=timezone.now(), type=Event.EventType.RACE),
+            league=self.league,
+        )
+        for i, (helm, boat) in enumerate(zip(self.helms, self.boats)):
+            RaceEntry.objects.create(
+                race=race,
+                helm=helm,
+                crew=self.crew if crewed and i == 0 else None,
+                boat=boat,
+                boat_type_name=boat.boat_type.name,
+                py_used=boat.boat_type.py,
+            )
+        return race
+
+    def result_set(self, race, positions, state=ResultSet.State.PUBLISHED, created_by=None,
+                   source=ResultSet.Source.MANUAL_POSITION):
+        """
+        positions: a finish position (or None) per helm, in helm order.
+        """
+        result_set = ResultSet.objects.create(
+            race=race,
+            source=source,
+            created_by=created_by or self.officer,
+            state=state,
+        )
+        entries = race.entries.order_by("id")
+        ResultSetEntry.objects.bulk_create([
+            ResultSetEntry(result_set=result_set, race_entry=entry, finish_position=position)
+            for entry, position in zip(entries, positions)
+        ])
+        return result_set
+
+    def standings(self):
+        return {
+            row.sailor_id: row.total
+            for row in LeagueStanding.objects.filter(league=self.league)
+        }
+
+    def test_publish_and_unpublish_update_the_standings(self):
+        h0, h1, h2 = self.helms
+        race = self.league_race()
+
+        first = self.result_set(race, [1, 2, 3], state=ResultSet.State.SAVED)
+        second = self.result_set(race, [2, 1, 3], state=ResultSet.State.SAVED, created_by=h0)
+
+        self.client.post(reverse("publish-result-set", args=[first.id]))
+        self.assertEqual(
+            self.standings(), {h0.id: 14, self.crew.id: 14, h1.id: 13, h2.id: 12}
+        )
+
+        # publishing another set unpublishes the first
+        self.client.post(reverse("publish-result-set", args=[second.id]))
+        self.assertEqual(
+            self.standings(), {h0.id: 13, self.crew.id: 13, h1.id: 14, h2.id: 12}
+        )
+
+        self.client.post(reverse("unpublish-result-set", args=[second.id]))
+        self.assertEqual(self.standings(), {})
+
+    def test_table_matches_hand_scoring(self):
+        h0, h1, h2 = self.helms
+
+        # None: DNF / DNS, no points; 16th is past the 14 points
+        races = [self.league_race() for _ in range(3)] + [self.league_race(crewed=False)]
+        for race, positions in zip(races, ([1, 2, None], [3, 1, 2], [2, None, 1], [16, 4, None])):
+            self.result_set(race, positions)
+
+        # only published sets count
+        self.result_set(races[0], [3, 2, 1], state=ResultSet.State.SAVED, created_by=h0)
+
+        r1, r2, r3, r4 = (race.id for race in races)
+        table = {row["sailor_id"]: row for row in calculate_league_table(self.league)}
+
+        # four races sailed at most: the best ceil(4 * 0.66) = 3 count
+        self.assertEqual(table[h0.id]["race_points"], {r1: 14, r2: 12, r3: 13, r4: 0})
+        self.assertEqual(table[h1.id]["race_points"], {r1: 13, r2: 14, r3: 0, r4: 11})
+        self.assertEqual(table[h2.id]["race_points"], {r1: 0, r2: 13, r3: 14, r4: 0})
+
+        # the crew scores with the helm, in the races they crewed
+        self.assertEqual(table[self.crew.id]["race_points"], {r1: 14, r2: 12, r3: 13})
+
+        self.assertEqual(
+            {sailor_id: (row["sailed"], row["counted"], row["total"]) for sailor_id, row in table.items()},
+            {
+                h0.id: (4, 3, 39),
+                self.crew.id: (3, 3, 39),
+                h1.id: (4, 3, 38),
+                h2.id: (4, 3, 27),
+            },
+        )
+        self.assertEqual(
+            [row["total"] for row in calculate_league_table(self.league)], [39, 39, 38, 27]
+        )
+
+    def published(self, race, source):
+        result_set = self.result_set(race, [1, 2, 3], source=source)
+        refresh_league_standings(self.league)
+        self.assertEqual(len(self.standings()), 4)
+        return result_set
+
+    def assertUnpublished(self, result_set):
+        result_set.refresh_from_db()
+        self.assertEqual(result_set.state, ResultSet.State.SAVED)
+        self.assertIsNone(result_set.published_at)
+        self.assertEqual(self.standings(), {})
+
+    def test_saving_a_published_set_refreshes_the_standings(self):
+        h0, h1, h2 = self.helms
+        race = self.league_race()
+        url = reverse("race-results-manual", args=[race.id])
+
+        # manual positions: a preview keeps the set published, with the
+        # new positions counted
+        result_set = self.published(race, ResultSet.Source.MANUAL_POSITION)
+        rows = list(result_set.entries.order_by("id"))
+        positions = {f"pos_{row.id}": position for row, position in zip(rows, (3, 1, 2))}
+
+        self.client.post(url, {"action": "preview", **positions})
+        self.assertEqual(
+            self.standings(), {h0.id: 12, self.crew.id: 12, h1.id: 14, h2.id: 13}
+        )
+
+        self.client.post(url, {"action": "save", **positions})
+        self.assertUnpublished(result_set)
+
+    def test_saving_published_times_refreshes_the_standings(self):
+        race = self.league_race()
+        entries = list(race.entries.order_by("id"))
+
+        result_set = self.published(race, ResultSet.Source.MANUAL_TIME)
+        self.client.post(reverse("race-results-manual-time", args=[race.id]), {
+            "action": "save",
+            **{f"laps_{entry.id}": 2 for entry in entries},
+            **{f"m_{entry.id}": 30 + i for i, entry in enumerate(entries)},
+        })
+        self.assertUnpublished(result_set)
+
+    def test_saving_a_published_timed_set_refreshes_the_standings(self):
+        race = self.league_race()
+        record_race_events([
+            {
+                "race": race.id,
+                "device_id": "league-timer",
+                "sequence": i,
+                "event_type": "lap",
+                "race_entry": entry.id,
+                "race_seconds": 600 + i,
+            }
+            for i, entry in enumerate(race.entries.order_by("id"))
+        ])
+
+        result_set = self.published(race, ResultSet.Source.TIMED)
+        self.client.post(reverse("race-results-timed", args=[race.id]))
+        self.assertUnpublished(result_set)
+
+    def test_publish_rolls_back_when_the_standings_fail(self):
+        race = self.league_race()
+        result_set = self.result_set(race, [1, 2, 3], state=ResultSet.State.SAVED)
+
+        with mock.patch("races.services.refresh_league_standings", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse("publish-result-set", args=[result_set.id]))
+
+        result_set.refresh_from_db()
+        self.assertEqual(result_set.state, ResultSet.State.SAVED)
+
+
+class EntryCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.race = make_race(3, "meta")
+        self.entry = self.race.entries.order_by("id").first()
+
+    def test_meta_is_cached(self):
+        with self.assertNumQueries(2):  # version + entries
+            meta = race_entry_meta(self.race.id)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(race_entry_meta(self.race.id), meta)
+
+        self.assertEqual(meta[self.entry.id]["boat_class"], "meta class")
+
+    def test_entry_change_refreshes_meta(self):
+        engine = RaceReplay(self.race.id).rebuild()
+        cursor = engine.cursor()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry.py_used = 1200
+            self.entry.save()
+
+        self.assertEqual(race_entry_meta(self.race.id)[self.entry.id]["py"], 1200.0)
+
+        # the warm engine reloads the fleet; old cursors get a full state
+        state = engine.refresh().export(cursor)
+        self.assertFalse(state["delta"])
+        self.assertEqual(state["boats"][self.entry.id]["py"], 1200.0)
+
+    def test_stale_meta_is_reloaded(self):
+        last = self.race.entries.order_by("id").last()
+        RaceEvent.objects.create(
+            race=self.race,
+            device_id="timer",
+            sequence=1,
+            event_type="lap",
+            race_entry=last,
+            race_seconds=300,
+        )
+
+        # a cached fleet that misses the boat, as a lagging cache would
+        meta = race_entry_meta(self.race.id)
+        del meta[last.id]
+        cache.set(f"races:entries:{self.race.id}:{race_entry_version(self.race.id)}", meta)
+
+        for engine_class in (RaceReplay, ColumnarRaceReplay):
+            with self.subTest(engine_class.__name__):
+                state = engine_class(self.race.id).rebuild().export()
+                self.assertEqual(state["boats"][last.id]["laps"], 1)
+
+
+@override_settings(PROFILING=True, PROFILING_SLOW_MS=60000, PROFILING_CPROFILE_URLS=[])
+class RequestProfilingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+        self.user = Member.objects.create(
+            username="officer",
+            email="officer@example.com",
+            email_verified=True,
+        )
+        self.client.force_login(self.user)
+        self.url = reverse("active-leagues")
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+
+        timing = re.fullmatch(
+            r'db;dur=([\d.]+);desc="(\d+) queries", tpl;dur=([\d.]+), total;dur=([\d.]+)',
+            response["Server-Timing"],
+        )
+        self.assertIsNotNone(timing, response["Server-Timing"])
+        _, queries, tpl, total = map(float, timing.groups())
+
+        # the view's queries; session and user are loaded by the
+        # middleware before this one
+        self.assertGreater(queries, 0)
+        self.assertLess(queries, len(ctx.captured_queries))
+
+        # the page's template render is timed
+        self.assertGreater(tpl, 0)
+        self.assertLessEqual(tpl, total)
+
+    @override_settings(PROFILING_SLOW_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs("members.middleware", "WARNING") as logs:
+            self.client.get(self.url)
+
+        self.assertIn(f"Slow request GET {self.url}", logs.output[0])
+
+    def test_sampled_requests_are_profiled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(
+                PROFILING_CPROFILE_URLS=["active-leagues"],
+                PROFILING_CPROFILE_SAMPLE=1,
+                PROFILING_CPROFILE_DIR=directory,
+            ):
+                self.client.get(self.url)
+                self.client.get(reverse("races-list"))
+
+            profiles = os.listdir(directory)
+
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].startswith("active-leagues-"))
+
+    @override_settings(PROFILING=False)
+    def test_off_by_default(self):
+        self.assertNotIn("Server-Timing", self.client.get(self.url))
+
+
+class GenerateSeasonTests(TestCase):
+
+    def generate(self, prefix, seed=7, **options):
+        call_command(
+            "generate_season",
+            seed=seed,
+            prefix=prefix,
+            leagues=1,
+            races=3,
+            boats=6,
+            entries=4,
+            laps=2,
+            undo_rate=0.2,
+            restart_rate=0.5,
+            stdout=io.StringIO(),
+            **options,
+        )
+
+    def season(self, prefix):
+        """
+        The generated rows with ids and the prefix taken out.
+        """
+        def strip(value):
+            return value.replace(prefix, "") if value else value
+
+        races = Race.objects.filter(league__name__startswith=f"{prefix} ").order_by("event__start_datetime")
+        season = []
+
+        for race in races:
+            entries = race.entries.order_by("id")
+            sails = {entry.id: entry.boat.sail_number for entry in entries}
+
+            season.append({
+                "status": race.status,
+                "entries": [
+                    (strip(entry.helm.username), strip(entry.crew and entry.crew.username),
+                     sails[entry.id], entry.boat_type_name.replace(prefix, ""), entry.py_used)
+                    for entry in entries
+                ],
+                "events": [
+                    (strip(ev.device_id), ev.sequence, ev.event_type, ev.attempt,
+                     sails.get(ev.race_entry_id), ev.race_seconds)
+                    for ev in race.raceevent_set.order_by("device_id", "sequence")
+                ],
+                "results": [
+                    (sails[row.race_entry_id], row.laps, row.elapsed_seconds, row.finish_position)
+                    for row in ResultSetEntry.objects.filter(result_set__race=race).order_by("finish_position")
+                ],
+            })
+
+        return season
+
+    def test_same_seed_same_season(self):
+        self.generate("first")
+        self.generate("second")
+        self.generate("third", seed=8)
+
+        first = self.season("first")
+        self.assertEqual(len(first), 3)
+        self.assertTrue(all(race["events"] for race in first))
+
+        self.assertEqual(self.season("second"), first)
+        self.assertNotEqual(self.season("third"), first)
+
+    def test_more_entries_than_boats(self):
+        with self.assertRaises(CommandError):
+            call_command("generate_season", boats=3, entries=4, stdout=io.StringIO())
+
+        self.assertFalse(Race.objects.exists())
+
+
+class EventBatchApiTests(TestCase):
+
+    def setUp(self):
+        self.race = make_race(2, "batch")
+        self.other = make_race(1, "other")
+        self.entry, _ = self.race.entries.order_by("id")
+
+        self.user = Member.objects.create(
+            username="timer",
+            email="timer@example.com",
+            email_verified=True,
+        )
+        self.client.force_login(self.user)
+
+    def event(self, sequence, **fields):
+        return {
+            "race": self.race.id,
+            "device_id": "timer-1",
+            "sequence": sequence,
+            "event_type": "lap",
+            "race_entry": self.entry.id,
+            "race_seconds": 60 * sequence,
+            **fields,
+        }
+
+    def post(self, events):
+        return self.client.post(
+            reverse("race_event_batch_api"),
+            json.dumps({"events": events}),
+            content_type="application/json",
+        )
+
+    def statuses(self, events):
+        response = self.post(events)
+        self.assertEqual(response.status_code, 200)
+        return [result["status"] for result in response.json()["results"]]
+
+    def test_ok_then_duplicate(self):
+        self.assertEqual(self.statuses([self.event(1), self.event(2)]), ["ok", "ok"])
+        self.assertEqual(self.statuses([self.event(2), self.event(3)]), ["duplicate", "ok"])
+        self.assertEqual(RaceEvent.objects.filter(race=self.race).count(), 3)
+
+    def test_duplicate_within_a_batch(self):
+        self.assertEqual(self.statuses([self.event(1), self.event(1)]), ["ok", "duplicate"])
+        self.assertEqual(RaceEvent.objects.filter(race=self.race).count(), 1)
+
+        # projected once
+        self.assertEqual(self.entry.projection.laps, 1)
+
+    def test_errors(self):
+        other_entry = self.other.entries.get()
+
+        response = self.post([
+            self.event(1, race=999999),
+            self.event(2, race_entry=other_entry.id),
+            {"race": self.race.id, "device_id": "timer-1"},
+            "lap",
+            self.event(3),
+        ])
+        results = response.json()["results"]
+
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["error", "error", "error", "error", "ok"],
+        )
+        self.assertEqual(results[0]["error"], "Race not found")
+        self.assertEqual(results[1]["error"], "Race entry not found for this race")
+        self.assertEqual(results[2]["error"], "Missing field: sequence")
+        self.assertEqual(RaceEvent.objects.count(), 1)
+
+    def concurrent_insert(self, sequence):
+        """
+        Another request stores timer-1's `sequence` after this one
+        checked which keys are stored.
+        """
+        stored_keys = services._stored_keys
+        calls = []
+
+        def racing(events):
+            keys = stored_keys(events)
+            if not calls:
+                calls.append(RaceEvent.objects.create(
+                    race=self.race,
+                    device_id="timer-1",
+                    sequence=sequence,
+                    event_type="lap",
+                    race_entry=self.entry,
+                    race_seconds=60,
+                ))
+            return keys
+
+        return mock.patch("races.services._stored_keys", side_effect=racing)
+
+    def test_concurrent_duplicate(self):
+        with self.concurrent_insert(1):
+            self.assertEqual(self.statuses([self.event(1), self.event(2)]), ["duplicate", "ok"])
+
+        self.assertEqual(RaceEvent.objects.filter(race=self.race).count(), 2)
+
+        # each stored lap projected once
+        self.assertEqual(self.entry.projection.laps, 2)
+
+    def test_concurrent_duplicate_single_event(self):
+        with self.concurrent_insert(1):
+            response = self.client.post(
+                reverse("race_event_api"),
+                json.dumps(self.event(1)),
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "duplicate"})
+
+    def test_batch_limit(self):
+        events = [self.event(i) for i in range(1, MAX_EVENT_BATCH + 2)]
+
+        response = self.post(events)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RaceEvent.objects.exists())
+
+        self.assertEqual(set(self.statuses(events[:MAX_EVENT_BATCH])), {"ok"})
+
+
+class EventLogTestCase(TestCase):
+    """
+    A four boat race and a helper to time it from one or more devices.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+        self.race = make_race(4, "proj")
+        self.entries = list(self.race.entries.values_list("id", flat=True))
+        self.sequence = {}
+
+    def send(self, device, event_type, entry=None, seconds=None, hold=False):
+        sequence = self.sequence[device] = self.sequence.get(device, 0) + 1
+        event = {
+            "race": self.race.id,
+            "device_id": device,
+            "sequence": sequence,
+            "event_type": event_type,
+            "race_entry": entry,
+            "race_seconds": seconds,
+        }
+        if not hold:
+            record_race_events([event])
+        return event
+
+
+class RefreshTests(EventLogTestCase):
+    """
+    refresh() applies in-order events in place and rebuilds when the log
+    changed under it, ending where a fresh replay of the log does.
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        self.send("timer", "start", seconds=0)
+        self.send("timer", "lap", self.entries[0], 300)
+
+        self.engine = RaceReplay(self.race.id).rebuild()
+
+    def assertRefreshed(self, rebuilt):
+        with mock.patch.object(self.engine, "rebuild", wraps=self.engine.rebuild) as rebuild:
+            self.engine.refresh()
+
+        self.assertEqual(rebuild.called, rebuilt)
+        self.assertEqual(
+            self.engine.export(), RaceReplay(self.race.id).rebuild().export()
+        )
+
+    def test_plain_laps_are_applied_in_place(self):
+        a, b, c, d = self.entries
+
+        self.send("timer", "lap", b, 310)
+        self.send("phone", "lap", c, 320)
+        self.assertRefreshed(rebuilt=False)
+
+        # an undo in order pops the lap where it stands
+        self.send("timer", "undo", b, 325)
+        self.send("timer", "lap", d, 330)
+        self.assertRefreshed(rebuilt=False)
+
+    def test_late_events_rebuild(self):
+        a, b, c, d = self.entries
+
+        held = self.send("timer", "lap", b, 310, hold=True)
+        self.send("timer", "lap", c, 320)
+        self.engine.refresh()
+
+        # the timer's queued lap lands inside its replayed stream
+        record_race_events([held])
+        self.assertRefreshed(rebuilt=True)
+
+        # another device's lap (and undo) from before the last replayed one
+        self.send("phone", "lap", d, 305)
+        self.assertRefreshed(rebuilt=True)
+
+        self.send("phone", "undo", d, 306)
+        self.assertRefreshed(rebuilt=True)
+
+    def test_restart_starts_over(self):
+        a, b, c, d = self.entries
+
+        self.send("timer", "lap", b, 310)
+        self.engine.refresh()
+
+        self.send("timer", "restart")
+        self.send("timer", "lap", c, 100)
+
+        with mock.patch.object(self.engine, "reset", wraps=self.engine.reset) as reset:
+            self.assertRefreshed(rebuilt=False)
+
+        reset.assert_called_once_with(2, 2)
+        self.assertEqual(self.engine.state["attempt"], 2)
+        self.assertEqual(self.engine.state["boats"][a]["laps"], 0)
+        self.assertEqual(self.engine.state["boats"][c]["laps"], 1)
+
+
+class DeltaExportTests(EventLogTestCase):
+    """
+    A delta applied to the previous export gives the full export, and a
+    cursor that no longer describes the replay gets a full one.
+    """
+
+    def merge(self, previous, delta):
+        """
+        What the live page does with a delta.
+        """
+        self.assertTrue(delta["delta"])
+        return {
+            **delta,
+            "boats": {**previous["boats"], **delta["boats"]},
+            "history": previous["history"] + delta["history"],
+            "delta": False,
+        }
+
+    def test_deltas_add_up_to_the_full_export(self):
+        random.seed(6)
+        engine = RaceReplay(self.race.id)
+
+        self.send("timer", "start", seconds=0)
+        state = engine.refresh().export()
+
+        for step in range(1, 40):
+            for _ in range(random.randint(1, 3)):
+                event_type = "undo" if random.random() < 0.2 else "lap"
+                self.send("timer", event_type, random.choice(self.entries), 60 * step)
+
+            delta = engine.refresh().export(since=state["cursor"])
+            state = self.merge(state, delta)
+
+            self.assertEqual(state, engine.export())
+
+    def assertStale(self, engine, cursor):
+        state = engine.refresh().export(since=cursor)
+        self.assertFalse(state["delta"])
+        self.assertEqual(state, engine.export())
+
+    def test_stale_cursors_get_a_full_export(self):
+        a, b, c, d = self.entries
+        engine = RaceReplay(self.race.id)
+
+        self.send("timer", "lap", a, 300)
+        cursor = engine.refresh().export()["cursor"]
+        self.send("timer", "lap", b, 310)
+
+        attempt, seen, last_id, fleet = cursor.split(":")
+        self.assertTrue(engine.refresh().export(since=cursor)["delta"])
+        self.assertStale(engine, f"2:{seen}:{last_id}:{fleet}")
+        self.assertStale(engine, f"{attempt}:{seen}:{last_id}:1x1x00000000")
+        self.assertStale(engine, f"{attempt}:{seen}:{int(last_id) + 1000}:{fleet}")
+        self.assertStale(engine, "garbage")
+
+        # a late event from before the cursor's last event
+        cursor = engine.export()["cursor"]
+        self.send("phone", "lap", c, 305)
+        self.assertStale(engine, cursor)
+
+        # an edited entry
+        cursor = engine.export()["cursor"]
+        RaceEntry.objects.filter(id=d).update(py_used=1200)
+        bump_race_entry_version([self.race.id])
+        self.assertStale(engine, cursor)
+
+        # a restart
+        cursor = engine.export()["cursor"]
+        self.send("timer", "restart")
+        self.send("timer", "lap", a, 100)
+        self.assertStale(engine, cursor)
+
+
+@override_settings(RACE_CHECKPOINT_INTERVAL=7)
+class EngineParityTests(EventLogTestCase):
+    """
+    ColumnarRaceReplay exports what RaceReplay does, full and delta, for
+    random logs from several devices with undos, restarts, laps with no
+    time and queues that arrive late.
+    """
+
+    def random_log(self, seed, steps=120):
+        """
+        Yields after each batch is recorded.
+        """
+        rng = random.Random(seed)
+        devices = ("timer", "phone", "tablet")
+        clocks = dict.fromkeys(devices, 0)
+        queued = []
+
+        for step in range(steps):
+            device = rng.choice(devices)
+            clocks[device] += rng.randint(0, 15)
+            roll = rng.random()
+
+            if roll < 0.03:
+                clocks = dict.fromkeys(devices, 0)
+                event = self.send(device, "restart", hold=True)
+            elif roll < 0.15:
+                event = self.send(device, "undo", rng.choice(self.entries), clocks[device], hold=True)
+            elif roll < 0.22:
+                event = self.send(device, "lap", rng.choice(self.entries), None, hold=True)
+            else:
+                event = self.send(device, "lap", rng.choice(self.entries), clocks[device], hold=True)
+
+            queued.append(event)
+
+            # most batches arrive at once, some sit in an offline queue
+            if rng.random() < 0.6:
+                batch = [ev for ev in queued if rng.random() < 0.85]
+                queued = [ev for ev in queued if ev not in batch]
+
+                if batch:
+                    record_race_events(batch)
+                    yield
+
+        record_race_events(queued)
+        yield
+
+    def test_engines_export_the_same(self):
+        for seed in range(4):
+            with self.subTest(seed=seed):
+                RaceEvent.objects.filter(race=self.race).delete()
+                RaceCheckpoint.objects.filter(race=self.race).delete()
+                self.sequence = {}
+
+                engines = (RaceReplay(self.race.id), ColumnarRaceReplay(self.race.id))
+                cursor = None
+
+                for _ in self.random_log(seed):
+                    dict_engine, columnar = (engine.refresh() for engine in engines)
+
+                    self.assertEqual(dict_engine.export(), columnar.export())
+                    self.assertEqual(
+                        dict_engine.export(since=cursor), columnar.export(since=cursor)
+                    )
+                    cursor = dict_engine.export()["cursor"]
+
+                # and from scratch (through the checkpoints), for each attempt
+                attempts = dict_engine.state["total_attempts"]
+                for attempt in range(1, attempts + 1):
+                    self.assertEqual(
+                        RaceReplay(self.race.id, attempt).rebuild().export(),
+                        ColumnarRaceReplay(self.race.id, attempt).rebuild().export(),
+                    )
+
+
+class ProjectionTests(EventLogTestCase):
+    """
+    Projection rows kept on ingest match a replay of the event log.
+    """
+
+    def assertMatchesReplay(self):
+        state = RaceReplay(self.race.id).rebuild().state
+        rows = {
+            row.race_entry_id: (row.attempt, row.laps, row.lap_times, row.last_seconds)
+            for row in RaceEntryProjection.objects.filter(race=self.race)
+        }
+
+        for entry_id, boat in state["boats"].items():
+            self.assertEqual(
+                rows.get(entry_id, (state["attempt"], 0, [], 0)),
+                (state["attempt"], boat["laps"], boat["times"], boat["last"] or 0),
+            )
+
+    def test_laps_undo_and_late_events(self):
+        a, b, c, d = self.entries
+
+        self.send("timer", "start", seconds=0)
+        self.send("timer", "lap", a, 300)
+        self.send("timer", "lap", b, 310)
+        self.send("timer", "undo", b, 312)
+        self.assertMatchesReplay()
+
+        # an offline device's queue arrives after the timer moved on
+        held = [
+            self.send("phone", "lap", c, 305, hold=True),
+            self.send("phone", "lap", d, 305, hold=True),
+        ]
+        self.send("timer", "lap", b, 320)
+        record_race_events(held)
+        self.assertMatchesReplay()
+
+        self.send("timer", "restart")
+        self.send("timer", "lap", a, 290)
+        self.assertMatchesReplay()
+
+    def test_standings_rank_in_the_database(self):
+        a, b, c, d = self.entries
+
+        for entry, seconds in ((a, 300), (b, 300), (c, 250)):
+            self.send("timer", "lap", entry, seconds)
+
+        standings = [
+            (row.race_entry_id, row.position, row.corrected)
+            for row in projected_standings(self.race.id)
+        ]
+        self.assertEqual(standings, [(c, 1, 250.0), (a, 2, 300.0), (b, 2, 300.0)])
+
+@override_settings(RACE_CHECKPOINT_INTERVAL=3)
+class CheckpointTests(EventLogTestCase):
+    """
+    Replays that start from a saved checkpoint end where a replay of the
+    whole log does.
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        for i in range(10):
+            self.send("timer", "lap", self.entries[i % 4], 100 + 10 * i)
+
+    def replay(self, until=None):
+        with self.settings(RACE_CHECKPOINT_INTERVAL=0):
+            return RaceReplay(self.race.id).rebuild(until=until).export()
+
+    def positions(self):
+        return list(
+            RaceCheckpoint.objects.filter(race=self.race)
+            .order_by("position").values_list("position", flat=True)
+        )
+
+    def test_rebuild_resumes_from_checkpoint(self):
+        RaceReplay(self.race.id).rebuild()
+        self.assertEqual(self.positions(), [3, 6, 9])
+
+        engine = RaceReplay(self.race.id).rebuild()
+        self.assertEqual(engine.checkpoint_position, 9)
+        self.assertEqual(engine.export(), self.replay())
+
+    def test_late_event_drops_later_checkpoints(self):
+        RaceReplay(self.race.id).rebuild()
+
+        # a second timer's lap from before the fourth event on the first
+        self.send("phone", "lap", self.entries[0], 125)
+
+        engine = RaceReplay(self.race.id).rebuild()
+        self.assertEqual(engine.export(), self.replay())
+
+        # 6 and 9 saved again from the new log
+        late = RaceEvent.objects.get(device_id="phone").id
+        self.assertEqual(self.positions(), [3, 6, 9])
+        self.assertIn(late, RaceCheckpoint.objects.get(race=self.race, position=6).state["applied_ids"])
+
+    def test_state_at_a_moment(self):
+        RaceReplay(self.race.id).rebuild()
+
+        response = self.client.get(
+            reverse("live_state", args=[self.race.id]), {"at": 165}
+        )
+        state = json.loads(response.content)
+
+        self.assertEqual(state["race_time"], 160)
+        self.assertEqual(state, json.loads(json.dumps(self.replay(until=165))))
+
+
+class LiveStateCacheTests(EventLogTestCase):
+    """
+    The cached live state body changes with its ETag, whichever worker
+    wrote the event.
+    """
+
+    def poll(self, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(reverse("live_state", args=[self.race.id]), **headers)
+
+    def laps(self, response):
+        return {
+            int(entry_id): boat["laps"]
+            for entry_id, boat in json.loads(response.content)["boats"].items()
+        }
+
+    def test_event_written_by_another_worker(self):
+        a, b, c, d = self.entries
+
+        self.send("timer", "lap", a, 300)
+        first = self.poll()
+        self.assertEqual(self.laps(first)[b], 0)
+
+        # no ingest in this process, so nothing here is bumped
+        RaceEvent.objects.create(
+            race=self.race,
+            device_id="timer",
+            sequence=2,
+            event_type="lap",
+            race_entry_id=b,
+            race_seconds=310,
+        )
+
+        second = self.poll(first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertEqual(self.laps(second)[b], 1)
+
+        third = self.poll(second["ETag"])
+        self.assertEqual(third.status_code, 304)
+
+    def test_entry_added_by_another_worker(self):
+        self.send("timer", "lap", self.entries[0], 300)
+        first = self.poll()
+
+        # entered and timed elsewhere; this process's counters don't move
+        entry = RaceEntry.objects.create(
+            race=self.race,
+            helm=Member.objects.create(username="late", email="late@example.com"),
+            boat=RegisteredBoat.objects.create(
+                sail_number="late", boat_type=BoatType.objects.get(name="proj class")
+            ),
+            boat_type_name="proj class",
+            py_used=1000,
+        )
+        RaceEvent.objects.create(
+            race=self.race,
+            device_id="timer",
+            sequence=2,
+            event_type="lap",
+            race_entry=entry,
+            race_seconds=320,
+        )
+
+        second = self.poll(first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(self.laps(second)[entry.id], 1)
+
+
+class LiveStreamTests(EventLogTestCase):
+    """
+    The live SSE stream, driven the way ASGI drives it: full state, then
+    a delta per committed batch, and full state again after a restart.
+    """
+
+    def setUp(self):
+        super().setUp()
+        _live_engines.clear()
+
+    def record(self, *events):
+        # the hub is told on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            record_race_events(list(events))
+
+    def event(self, device, event_type, entry=None, seconds=None):
+        return self.send(device, event_type, entry, seconds, hold=True)
+
+    @staticmethod
+    def message(text):
+        event, data = text.strip("\n").split("\n")
+        return event.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+    def test_state_then_deltas(self):
+        a, b, c, d = self.entries
+        record = sync_to_async(self.record)
+
+        self.send("timer", "start", seconds=0)
+        self.send("timer", "lap", a, 300)
+
+        async def watch():
+            stream = race_stream(self.race.id, None)
+            received = [await anext(stream)]
+
+            for events in (
+                [],
+                [self.event("timer", "lap", b, 310), self.event("timer", "lap", b, 320)],
+                [self.event("timer", "restart"), self.event("timer", "lap", c, 100)],
+            ):
+                if events:
+                    await record(*events)
+                received.append(self.message(await anext(stream)))
+
+            await stream.aclose()
+            return received
+
+        retry, first, delta, restarted = async_to_sync(watch)()
+
+        self.assertEqual(retry, "retry: 2000\n\n")
+
+        event, state = first
+        self.assertEqual(event, "state")
+        self.assertFalse(state["delta"])
+        self.assertEqual(
+            {int(entry_id): boat["laps"] for entry_id, boat in state["boats"].items()},
+            {a: 1, b: 0, c: 0, d: 0},
+        )
+
+        # one wake-up for the batch: only b changed
+        event, state = delta
+        self.assertEqual(event, "delta")
+        self.assertTrue(state["delta"])
+        self.assertEqual(state["boats"][str(b)]["laps"], 2)
+        self.assertNotIn(str(c), state["boats"])
+
+        event, state = restarted
+        self.assertEqual(event, "state")
+        self.assertFalse(state["delta"])
+        self.assertEqual(state["attempt"], 2)
+        self.assertEqual(len(state["boats"]), 4)
+        self.assertEqual(state["boats"][str(a)]["laps"], 0)
+        self.assertEqual(state["boats"][str(c)]["laps"], 1)
+
+        # closing the stream unsubscribes it
+        self.assertNotIn(self.race.id, race_event_hub._subscribers)
+
+    def test_wsgi_falls_back_to_polling(self):
+        response = self.client.get(reverse("live_stream", args=[self.race.id]))
+        self.assertEqual(response.status_code, 204)
+
+
+class ArchiveTests(EventLogTestCase):
+    """
+    A league race exported and imported into a database that already
+    has races of its own, one of them with the archived race's id.
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        self.league = League.objects.create(
+            name="Winter",
+            description="Sundays",
+            date_from=date(2026, 11, 1),
+            date_to=date(2027, 2, 28),
+        )
+        self.race.league = self.league
+        self.race.save()
+
+        a, b, c, d = self.entries
+        self.send("timer", "start", seconds=0)
+        self.send("timer", "lap", a, 300)
+        self.send("timer", "lap", b, 310)
+        self.send("timer", "undo", b, 312)
+
+        self.result_set = ResultSet.objects.create(
+            race=self.race,
+            source=ResultSet.Source.MANUAL_POSITION,
+            created_by=RaceEntry.objects.get(id=a).helm,
+            state=ResultSet.State.PUBLISHED,
+        )
+        ResultSetEntry.objects.bulk_create([
+            ResultSetEntry(result_set=self.result_set, race_entry_id=entry_id, finish_position=i + 1)
+            for i, entry_id in enumerate(self.entries)
+        ])
+
+        self.local = make_race(2, "local")
+        RaceEvent.objects.create(
+            race=self.local, device_id="local-timer", sequence=1, event_type="start", race_seconds=0,
+        )
+
+    def export(self, fmt):
+        """
+        The archive as another database would have written it: its race
+        has the id of an unrelated race here, and neither the race nor
+        its league exist here.
+        """
+        local = self.local
+        records = []
+        for record in archive_records(Race.objects.filter(id=self.race.id)):
+            if record["type"] == "race":
+                record["id"] = local.id
+            elif "race" in record:
+                record["race"] = local.id
+            records.append(record)
+
+        write, _ = ARCHIVE_FORMATS[fmt]
+        lines = list(write(records))
+
+        RaceEvent.objects.filter(race=self.race).delete()
+        self.result_set.delete()
+        self.race.event.delete()
+        self.league.delete()
+
+        return local, lines
+
+    def test_round_trip_into_a_database_with_races(self):
+        for fmt, read in (("ndjson", read_ndjson), ("csv", read_csv)):
+            with self.subTest(fmt=fmt):
+                expected = RaceReplay(self.race.id).rebuild().export()
+                local, lines = self.export(fmt)
+
+                counts = ArchiveImporter(batch_size=2).run(read(lines))
+                self.assertEqual(
+                    {name: counts[name] for name in ("leagues", "races", "entries", "events")},
+                    {"leagues": 1, "races": 1, "entries": 4, "events": 4},
+                )
+
+                # the local race with the archived id is left alone
+                self.assertEqual(local.entries.count(), 2)
+                self.assertEqual(RaceEvent.objects.filter(race=local).count(), 1)
+
+                league = League.objects.get(name="Winter")
+                self.assertEqual(
+                    (league.description, league.date_from, league.date_to),
+                    ("Sundays", date(2026, 11, 1), date(2027, 2, 28)),
+                )
+
+                race = Race.objects.get(league=league)
+                self.assertEqual(race.event.start_datetime, self.race.event.start_datetime)
+                self.assertEqual(race.entries.count(), 4)
+                self.assertEqual(league.standings.count(), 4)
+
+                state = RaceReplay(race.id).rebuild().export()
+                self.assertEqual(
+                    [(b["helm"], b["laps"], b["times"]) for b in state["boats"].values()],
+                    [(b["helm"], b["laps"], b["times"]) for b in expected["boats"].values()],
+                )
+
+                # importing it again finds the race by start and league
+                counts = ArchiveImporter().run(read(lines))
+                self.assertEqual(
+                    (counts["leagues"], counts["races"], counts["entries"], counts["events"]),
+                    (0, 0, 0, 0),
+                )
+                self.assertEqual(counts["duplicates"], 4)
+
+                self.race = race
+                self.result_set = race.result_sets.get()
+                self.league = league
+
+
+class ViewBenchmarkTests(TestCase):
+    """
+    Seeds a small and a large club, requests each view against both and
+    fails when the query count grows with the data.
+
+    Set BENCHMARK_REPORT to a file path to get a JSON report of query
+    counts and timings to compare between runs.
+
+    Views with a known N+1 are marked expectedFailure; drop the marker
+    when the view is fixed (the run reports an unexpected success).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        scale = os.environ.get("BENCHMARK_SCALE", "default")
+        sizes = BENCHMARK_SIZES[scale]
+
+        cls.scale = scale
+        cls.sizes = sizes
+        cls.clubs = {
+            name: seed_club(name, *size) for name, size in sizes.items()
+        }
+        cls.user = Member.objects.create(
+            username="bench",
+            email="bench@example.com",
+            email_verified=True,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+        cache.clear()
+        _live_engines.clear()
+
+    def measure(self, name, url_for, warm=False):
+        """
+        Requests url_for(club) for each club size, records the result and
+        checks the query count stayed the same. With warm, an untimed
+        request first fills any caches the view reads.
+        """
+        counts = {}
+
+        for size, club in self.clubs.items():
+            url = url_for(club)
+
+            if warm:
+                self.client.get(url)
+
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = self.client.get(url)
+                elapsed = time.perf_counter() - started
+
+            self.assertEqual(response.status_code, 200, url)
+
+            counts[size] = len(ctx.captured_queries)
+            benchmark_report.append({
+                "view": name,
+                "size": size,
+                "races": self.sizes[size][0],
+                "boats": self.sizes[size][1],
+                "events": self.sizes[size][2],
+                "queries": counts[size],
+                "seconds": round(elapsed, 4),
+            })
+
+        self.assertEqual(
+            counts["small"], counts["large"],
+            f"{name}: query count grows with data size {counts}",
+        )
+
+    def test_race_list(self):
+        self.measure("races-list", lambda club: reverse("races-list"))
+
+    def test_race_entries(self):
+        self.measure(
+            "race-entries",
+            lambda club: reverse("race-entries", args=[club["race"].pk]),
+            warm=True,
+        )
+
+    def test_dashboard(self):
+        def uncached(club):
+            # recount on every request, so both sizes do the same work
+            bump_dashboard_version()
+            return reverse("active-leagues")
+
+        self.measure("active-leagues", uncached)
+
+    def test_dashboard_cached(self):
+        """
+        Once cached, the dashboard costs the same queries, none of them
+        on races, however many races the league holds.
+        """
+        url = reverse("active-leagues")
+        league = self.clubs["large"]["league"]
+        counts = {}
+        added = 0
+
+        for total in DASHBOARD_RACE_STEPS[self.scale]:
+            events_ = Event.objects.bulk_create([
+                Event(start_datetime=timezone.now(), type=Event.EventType.RACE)
+                for _ in range(total - added)
+            ])
+            Race.objects.bulk_create([
+                Race(event=event, league=league, status=Race.RaceStatus.DRAFT)
+                for event in events_
+            ])
+            added = total
+
+            # bulk_create skips the signals
+            bump_dashboard_version()
+            self.client.get(url)
+
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = self.client.get(url)
+                elapsed = time.perf_counter() - started
+
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(
+                [q["sql"] for q in ctx.captured_queries if "races_race" in q["sql"]]
+            )
+
+            counts[total] = len(ctx.captured_queries)
+            benchmark_report.append({
+                "view": "active-leagues (cached)",
+                "races": total,
+                "queries": counts[total],
+                "seconds": round(elapsed, 4),
+            })
+
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_league_list(self):
+        self.measure("leagues-list", lambda club: reverse("leagues-list"))
+
+    def test_league_table(self):
+        self.measure(
+            "league-table",
+            lambda club: reverse("league-table", args=[club["league"].pk]),
+        )
+
+    def test_timed_results(self):
+        self.measure(
+            "race-results-timed",
+            lambda club: reverse("race-results-timed", args=[club["race"].pk]),
+        )
+
+    # preview rows read race_entry / boat / helm per row
+    @expectedFailure
+    def test_select_result_set(self):
+        self.measure(
+            "select-result-set",
+            lambda club: reverse("select-result-set", args=[club["race"].pk]),
+        )
+
+    def test_race_timer(self):
+        self.measure(
+            "race-timer",
+            lambda club: reverse("race-timer", args=[club["race"].pk]),
+        )
+
+    def test_live_page(self):
+        self.measure(
+            "race-live",
+            lambda club: reverse("race-live", args=[club["race"].pk]),
+        )
+
+    # the first replay of the large race also saves a checkpoint (one
+    # insert per RACE_CHECKPOINT_INTERVAL events), which is not per boat
+    @override_settings(RACE_CHECKPOINT_INTERVAL=0)
+    def test_live_state(self):
+        self.measure(
+            "live_state",
+            lambda club: reverse("live_state", args=[club["race"].pk]),
+        )
+
+
+# boats per fleet in the scoring benchmark
+SCORING_FLEETS = (10, 50, 100, 500)
+
+
+def sorted_ranking(laps, elapsed, py):
+    """
+    Places and points the way the views used to score: sorted() with the
+    corrected time recomputed in the key, then again for each row.
+    """
+    max_laps = max(laps)
+
+    def corrected(i):
+        return elapsed[i] * (max_laps / laps[i]) * 1000 / py[i] if py[i] else None
+
+    ranked = sorted(
+        range(len(laps)),
+        key=lambda i: corrected(i) if py[i] else 999999,
+    )
+
+    position = [0] * len(laps)
+    for rank, i in enumerate(ranked, 1):
+        position[i] = rank
+        corrected(i)
+        calculate_points(rank)
+    return position
+
+
+class ScoringBenchmarkTests(SimpleTestCase):
+    """
+    Throughput of races.scoring for fleets of 10–500 boats, against the
+    sorted() ranking it replaced. Results go in the BENCHMARK_REPORT.
+    """
+
+    def fleet(self, size):
+        rng = random.Random(size)
+        laps = [rng.randint(3, 6) for _ in range(size)]
+        elapsed = [rng.randint(2400, 4800) for _ in range(size)]
+        py = [rng.choice([0, 1046, 1100, 1142, 1365]) for _ in range(size)]
+        return laps, elapsed, py
+
+    def throughput(self, size, rank):
+        laps, elapsed, py = self.fleet(size)
+        repeats = max(20, 20000 // size)
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            rank(laps, elapsed, py)
+        elapsed_time = time.perf_counter() - started
+
+        return round(size * repeats / elapsed_time)
+
+    def test_matches_sorted_ranking(self):
+        for size in SCORING_FLEETS:
+            laps, elapsed, py = self.fleet(size)
+            self.assertEqual(
+                score_fleet(laps, elapsed, py).position,
+                sorted_ranking(laps, elapsed, py),
+            )
+
+    def test_equal_times_share_a_place(self):
+        score = score_fleet([2, 2, 2, 1], [100, 90, 100, 40], [1000, 1000, 1000, 0], ties=TIES_EQUAL)
+
+        self.assertEqual(score.position, [2, 1, 2, 4])
+        self.assertEqual(score.tied, [False, False, True, False])
+        self.assertEqual(score.points, [13, 14, 13, 11])
+
+    def test_throughput(self):
+        for size in SCORING_FLEETS:
+            for ties in (TIES_NONE, TIES_EQUAL):
+                benchmark_report.append({
+                    "benchmark": "scoring",
+                    "boats": size,
+                    "ties": ties,
+                    "boats_per_second": self.throughput(
+                        size, lambda *fleet: score_fleet(*fleet, ties=ties)
+                    ),
+                    "sorted_boats_per_second": self.throughput(size, sorted_ranking),
+                })
+
+
+# fleets (boats, laps) in the replay benchmark
+REPLAY_RACES = ((10, 20), (50, 20), (100, 20))
+
+
+class FullSortReplay(RaceReplay):
+    """
+    RaceReplay as it placed boats before LiveRanking: every snapshot
+    re-scores and re-sorts the whole fleet and records every boat.
+    """
+
+    def snapshot(self, time_value):
+        state = self.state
+        boats = list(state["boats"].values())
+        rev = len(self.applied_ids)
+        before = {
+            b["entry_id"]: (b["corrected"], b.get("actual_pos"), b.get("corrected_pos"))
+            for b in boats
+        }
+
+        laps = [b["laps"] for b in boats]
+        last = [b["last"] for b in boats]
+
+        score = score_fleet(laps, last, [b["py"] for b in boats])
+        actual = water_positions(laps, last)
+
+        for b, corrected, actual_pos, corrected_pos in zip(
+            boats, score.corrected, actual, score.position
+        ):
+            b["corrected"] = corrected
+            b["actual_pos"] = actual_pos
+            b["corrected_pos"] = corrected_pos
+
+        for b in boats:
+            if before[b["entry_id"]] != (b["corrected"], b["actual_pos"], b["corrected_pos"]):
+                self.boat_revs[b["entry_id"]] = rev
+
+        self.history_revs.append(rev)
+        state["history"].append({
+            "time": time_value,
+            "boats": {
+                b["entry_id"]: {
+                    "actual_pos": b["actual_pos"],
+                    "corrected_pos": b["corrected_pos"],
+                }
+                for b in boats
+            }
+        })
+
+
+class ReplayBenchmarkTests(SimpleTestCase):
+    """
+    Replay of synthetic races (no database) with LiveRanking's bisect
+    updates against re-sorting the fleet on every lap. Results go in the
+    BENCHMARK_REPORT.
+    """
+
+    def race(self, boats, laps):
+        rng = random.Random(boats * laps)
+        py = [rng.choice([0, 1046, 1100, 1142, 1365]) for _ in range(boats)]
+        pace = [rng.uniform(240, 360) for _ in range(boats)]
+
+        entries = {
+            entry_id: {"entry_id": entry_id, "helm": f"helm {entry_id}", "sail": str(entry_id),
+                       "py": float(py[entry_id - 1]), "boat_class": ""}
+            for entry_id in range(1, boats + 1)
+        }
+
+        crossings = sorted(
+            (round(pace[i] * lap * rng.uniform(0.95, 1.05)), i + 1)
+            for i in range(boats)
+            for lap in range(1, laps + 1)
+        )
+
+        events = []
+        for seconds, entry_id in crossings:
+            events.append(SimpleNamespace(
+                id=len(events) + 1, event_type="lap", race_entry_id=entry_id, race_seconds=seconds
+            ))
+            # the odd mistimed lap, taken back straight away
+            if rng.random() < 0.02:
+                events.append(SimpleNamespace(
+                    id=len(events) + 1, event_type="undo", race_entry_id=entry_id, race_seconds=seconds
+                ))
+
+        return entries, events
+
+    def replay(self, engine_class, entries, events):
+        engine = engine_class(0)
+        engine.entries = entries
+        engine.reset(1, 1)
+
+        for ev in events:
+            engine.apply(ev)
+
+        return engine.state
+
+    def test_matches_full_sort(self):
+        for boats, laps in REPLAY_RACES:
+            entries, events = self.race(boats, laps)
+
+            live = self.replay(RaceReplay, entries, events)
+            full = self.replay(FullSortReplay, entries, events)
+
+            self.assertEqual(live["boats"], full["boats"])
+
+            # carry the boats that didn't move forward
+            places = {}
+            for point, expected in zip(live["history"], full["history"], strict=True):
+                places.update(point["boats"])
+                self.assertEqual(places, expected["boats"])
+
+    def test_throughput(self):
+        for boats, laps in REPLAY_RACES:
+            entries, events = self.race(boats, laps)
+            result = {"benchmark": "replay", "boats": boats, "laps": laps}
+
+            for name, engine_class in (("ranked", RaceReplay), ("sorted", FullSortReplay)):
+                started = time.perf_counter()
+                state = self.replay(engine_class, entries, events)
+                elapsed = time.perf_counter() - started
+
+                result[f"{name}_events_per_second"] = round(len(events) / elapsed)
+                result[f"{name}_history_boats"] = sum(len(h["boats"]) for h in state["history"])
+
+            benchmark_report.append(result)
+
+
+def tearDownModule():
+    path = os.environ.get("BENCHMARK_REPORT")
+
+    if path and benchmark_report:
+        scale = os.environ.get("BENCHMARK_SCALE", "default")
+
+        with open(path, "w") as f:
+            json.dump({
+                "generated_at": timezone.now().isoformat(),
+                "database": connection.vendor,
+                "scale": scale,
+                "sizes": BENCHMARK_SIZES[scale],
+                "results": benchmark_report,
+            }, f, indent=2)
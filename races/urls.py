@@ -1,7 +1,7 @@
 from django.urls import path
-from .views import BoatTypeCreateView, BoatTypeUpdateView, BoatTypeListView, delete_entry, edit_entry, manual_results, reopen_results, league_table, active_leagues, timed_results, timed_results_edit, race_timer, race_event_api, live_race_page, unpublish_result_set
+from .views import BoatTypeCreateView, BoatTypeUpdateView, BoatTypeListView, delete_entry, edit_entry, manual_results, reopen_results, league_table, active_leagues, timed_results, timed_results_edit, race_timer, race_event_api, race_event_batch_api, live_race_page, unpublish_result_set
 from .views import RegisteredBoatListView, RegisteredBoatCreateView, RegisteredBoatUpdateView,LeagueListView, LeagueCreateView, LeagueUpdateView, RaceEntryListView, RaceCreateView, RaceListView ,add_entry, boat_py, manual_time_results, manual_results, select_result_set, publish_result_set
-from .views_api import live_race_state
+from .views_api import live_race_state, live_race_stream, race_archive, league_archive
 
 urlpatterns = [
     path("dashboard", active_leagues, name="dashboard"),
@@ -41,10 +41,14 @@ urlpatterns = [
     path("<int:pk>/timer/", race_timer, name="race-timer"),
 
     path("api/race-event/", race_event_api, name="race_event_api"),
+    path("api/race-events/", race_event_batch_api, name="race_event_batch_api"),
 
     path("api/race/<int:race_id>/live/", live_race_state),
     path("<int:race_id>/live/", live_race_page, name="race-live"),
     path("<int:race_id>/live/state/", live_race_state, name="live_state"),
+    path("<int:race_id>/live/stream/", live_race_stream, name="live_stream"),
+    path("<int:race_id>/archive/", race_archive, name="race-archive"),
+    path("leagues/<int:pk>/archive/", league_archive, name="league-archive"),
     path("races/<int:race_id>/results/manual-time/", manual_time_results, name="race-results-manual-time"),
 
 
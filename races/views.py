@@ -2,27 +2,32 @@ from django.urls import reverse_lazy, reverse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.http import JsonResponse
 from django.views.generic import CreateView, UpdateView, ListView, DetailView, FormView
-from .models import BoatType, RegisteredBoat, League, Race, RaceEntry, RaceResult, Event, Race, RaceEvent, ResultSet, ResultSetEntry
+from .models import BoatType, RegisteredBoat, League, LeagueStanding, Race, RaceEntry, RaceResult, Event, Race, RaceEvent, ResultSet, ResultSetEntry
 from members.models import Member
 from .forms import BoatTypeForm, RegisteredBoatForm, LeagueForm, RaceEntryForm, RaceEntry, RaceCreateForm, Race
 from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.db.models import Exists, OuterRef
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django import forms
 from django.views.decorators.http import require_http_methods
-from django.db.models import F, Count, Q
+from django.db.models import F, Max, Q
 from .services import calculate_points, corrected_time
-from .services import calculate_league_table, format_seconds, build_manual_time_preview
+from .services import format_seconds, build_manual_time_preview, save_result_set_state
 from django.utils.timezone import now
 from django.contrib import messages
 import json
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.db import IntegrityError
+from django.db import transaction
 
-from races.models import Race, RaceEntry, ResultSet, ResultSetEntry
+from races.models import Race, RaceEntry, RaceEntryProjection, ResultSet, ResultSetEntry
 from races.services import build_race_state, corrected_time, format_seconds 
-from races.services import get_or_create_user_resultset, calculate_points
+from races.services import get_or_create_user_resultset, calculate_points, record_race_events
+from races.services import create_blank_entries
+from races.scoring import TIES_EQUAL, score_finish_order, score_fleet
+from races.projection import projected_standings
+from races.dashboard_cache import get_active_leagues
 
 
 
@@ -148,27 +153,35 @@ class LeagueUpdateView(PermissionRequiredMixin, UpdateView):
         return context
 
 #----------------------------------------------------------#   
+def race_entries_context(race, form, editing_entry=None):
+    """
+    Everything races/race_entries.html needs, in a fixed number of
+    queries: the entries with their boat types, and who / which boats
+    are already sailing (bar the entry being edited) taken from the same
+    rows. The form's dropdowns come from races.choice_cache.
+    """
+    entries = list(race.entries.select_related("helm", "crew", "boat__boat_type"))
+    others = [e for e in entries if e != editing_entry]
+
+    return {
+        "race": race,
+        "form": form,
+        "entries": entries,
+        "editing_entry": editing_entry,
+        "existing_helms": [e.helm_id for e in others],
+        "existing_crew": [e.crew_id for e in others],
+        "existing_boats": [e.boat_id for e in others],
+    }
+
+
 class RaceEntryListView(DetailView):
-    model = Race
+    queryset = Race.objects.select_related("event")
     template_name = "races/race_entries.html"
     context_object_name = "race"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["entries"] = self.object.entries.select_related("helm", "crew", "boat")
-        context["form"] = RaceEntryForm(race=self.object)
-
-        context["existing_helms"] = list(
-            self.object.entries.values_list("helm_id", flat=True)
-        )
-        context["existing_crew"] = list(
-            self.object.entries.values_list("crew_id", flat=True)
-        )
-
-        context["existing_boats"] = list(
-            self.object.entries.values_list("boat_id", flat=True)
-        )
-
+        context.update(race_entries_context(self.object, RaceEntryForm(race=self.object)))
         return context
 
 #----------------------------------------------------------#
@@ -200,15 +213,41 @@ class RaceCreateView(FormView):
         return context
 
 #----------------------------------------------------------#
-# -event__start_datetime
+
+# race list cursors count microseconds from here
+CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def race_cursor(race):
+    """
+    Position of a race in the list: its start time and event id.
+    """
+    micros = (race.event.start_datetime - CURSOR_EPOCH) // timedelta(microseconds=1)
+    return f"{micros}:{race.event_id}"
+
+
+def parse_race_cursor(value):
+    try:
+        micros, event_id = value.split(":")
+        return CURSOR_EPOCH + timedelta(microseconds=int(micros)), int(event_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
 class RaceListView(ListView):
+    """
+    Newest races first, a page at a time. Pages are keyset cursors
+    (?after= / ?before= a race's start and event id) rather than page
+    numbers, so a page deep in the history costs the same as the first.
+    """
     model = Race
     template_name = "races/race_list.html"
     context_object_name = "races"
-    ordering = ["-event__start_datetime"]
+
+    page_size = 50
 
     def get_queryset(self):
-        qs = super().get_queryset().select_related("league")
+        qs = super().get_queryset().select_related("event", "league")
 
         league_id = self.request.GET.get("league")
         status = self.request.GET.get("status")
@@ -219,9 +258,29 @@ class RaceListView(ListView):
         if status and status != "all":
             qs = qs.filter(status=status)
 
+        after = parse_race_cursor(self.request.GET.get("after"))
+        before = parse_race_cursor(self.request.GET.get("before"))
+
+        if before:
+            # newer page: seek forwards from the cursor, flipped below
+            start, event_id = before
+            qs = qs.filter(
+                Q(event__start_datetime__gt=start) | Q(event__id__gt=event_id),
+                event__start_datetime__gte=start,
+            ).order_by("event__start_datetime", "event__id")
+        else:
+            if after:
+                start, event_id = after
+                # the plain bound lets the (start, id) index seek
+                qs = qs.filter(
+                    Q(event__start_datetime__lt=start) | Q(event__id__lt=event_id),
+                    event__start_datetime__lte=start,
+                )
+            qs = qs.order_by("-event__start_datetime", "-event__id")
+
+        # only the page's races are probed (marker index)
         qs = qs.annotate(
             has_events=Exists(
-                # RaceEvent.objects.filter(race=OuterRef("pk"))
                 RaceEvent.objects.filter(
                     race=OuterRef("pk"),
                     event_type="start"
@@ -229,20 +288,34 @@ class RaceListView(ListView):
             )
         )
 
-        return qs
+        races = list(qs[:self.page_size + 1])
+        more = len(races) > self.page_size
+        races = races[:self.page_size]
+
+        if before:
+            races.reverse()
+
+        self.older = more if not before else True
+        self.newer = more if before else after is not None
+
+        return races
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        races = context["races"]
 
         context["leagues"] = League.objects.order_by("name")
+        context["statuses"] = Race.RaceStatus.choices
         context["selected_league"] = self.request.GET.get("league", "all")
         context["selected_status"] = self.request.GET.get("status", "all")
+        context["older_cursor"] = race_cursor(races[-1]) if races and self.older else None
+        context["newer_cursor"] = race_cursor(races[0]) if races and self.newer else None
 
         return context
 #----------------------------------------------------------#
 
 def add_entry(request, pk):
-    race = get_object_or_404(Race, pk=pk)
+    race = get_object_or_404(Race.objects.select_related("event"), pk=pk)
 
     if request.method == "POST":
         form = RaceEntryForm(request.POST, race=race)
@@ -261,11 +334,7 @@ def add_entry(request, pk):
     else:
         form = RaceEntryForm(race=race)
 
-    return render(request, "races/race_entries.html", {
-        "race": race,
-        "form": form,
-        "entries": race.entries.select_related("helm", "crew", "boat"),
-    })
+    return render(request, "races/race_entries.html", race_entries_context(race, form))
 #----------------------------------------------------------#
 
 def boat_py(request, pk):
@@ -281,8 +350,10 @@ def delete_entry(request, race_pk, entry_pk):
 #----------------------------------------------------------#
 
 def edit_entry(request, race_pk, entry_pk):
-    race = get_object_or_404(Race, pk=race_pk)
-    entry = get_object_or_404(RaceEntry, pk=entry_pk, race=race)
+    race = get_object_or_404(Race.objects.select_related("event"), pk=race_pk)
+    entry = get_object_or_404(
+        RaceEntry.objects.select_related("helm"), pk=entry_pk, race=race
+    )
 
     if request.method == "POST":
         form = RaceEntryForm(request.POST, instance=entry, race=race)
@@ -294,16 +365,9 @@ def edit_entry(request, race_pk, entry_pk):
     else:
         form = RaceEntryForm(instance=entry, race=race)
 
-    other_entries = race.entries.exclude(pk=entry.pk)
-    return render(request, "races/race_entries.html", {
-        "race": race,
-        "form": form,
-        "entries": race.entries.select_related("helm", "crew", "boat"),
-        "editing_entry": entry,
-        "existing_helms": list(other_entries.values_list("helm_id", flat=True)),
-        "existing_crew": list(other_entries.values_list("crew_id", flat=True)),
-        "existing_boats": list(other_entries.values_list("boat_id", flat=True)),
-    })
+    return render(
+        request, "races/race_entries.html", race_entries_context(race, form, entry)
+    )
 #----------------------------------------------------------#
 
 def reopen_results(request, pk):
@@ -316,7 +380,13 @@ def reopen_results(request, pk):
 def league_table(request, pk):
     league = get_object_or_404(League, pk=pk)
 
-    table = calculate_league_table(league)
+    # kept up to date by publish / unpublish
+    table = (
+        LeagueStanding.objects
+        .filter(league=league)
+        .select_related("sailor")
+        .order_by("-total", "id")
+    )
 
     return render(request, "races/league_table.html", {
         "league": league,
@@ -325,21 +395,8 @@ def league_table(request, pk):
 #----------------------------------------------------------#
 
 def active_leagues(request):
-    today = now().date()
-
-    leagues = (
-        League.objects
-        .filter(date_from__lte=today, date_to__gte=today)
-        .annotate(
-            draft_count=Count("races", filter=Q(races__status="draft")),
-            open_count=Count("races", filter=Q(races__status="open")),
-            running_count=Count("races", filter=Q(races__status="running")),
-            finished_count=Count("races", filter=Q(races__status="finished")),
-            verified_count=Count("races", filter=Q(races__status="verified")),
-            locked_count=Count("races", filter=Q(races__status="locked")),
-        )
-        .order_by("date_to")
-    )
+    # status counts are cached and refreshed when a race changes
+    leagues = get_active_leagues(now().date())
 
     return render(request, "races/active_leagues.html", {
         "leagues": leagues,
@@ -526,7 +583,7 @@ def active_leagues(request):
 
 def race_timer(request, pk):
     race = get_object_or_404(Race, pk=pk)
-    entries = race.entries.all()
+    entries = race.entries.select_related("helm", "boat__boat_type")
     # print(request.user)
     existing = ResultSet.objects.filter(
         race=race,
@@ -561,8 +618,6 @@ def race_timer(request, pk):
                 "race": race,
             })
 
-        entries = race.entries.all()
-
         return render(request, "races/race_timer.html", {
             "race": race,
             "entries": entries,
@@ -598,35 +653,46 @@ def race_event_api(request):
 
     try:
         data = json.loads(request.body)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-        race_id = data["race"]
-        device_id = data["device_id"]
-        sequence = data["sequence"]
-        event_type = data["event_type"]
-        race_seconds = data.get("race_seconds")
-        entry_id = data.get("race_entry")
-
-        entry = None
-        if entry_id:
-            entry = RaceEntry.objects.get(id=entry_id)
-
-        RaceEvent.objects.create(
-            race_id=race_id,
-            device_id=device_id,
-            sequence=sequence,
-            event_type=event_type,
-            race_entry=entry,
-            race_seconds=race_seconds,
-        )
+    result = record_race_events([data])[0]
+
+    if result["status"] == "error":
+        return JsonResponse({"error": result["error"]}, status=400)
 
-        return JsonResponse({"status": "ok"})
+    # duplicate → safe → treat as success
+    return JsonResponse({"status": result["status"]})
+#----------------------------------------------------------#
 
-    except IntegrityError:
-        # duplicate → safe → treat as success
-        return JsonResponse({"status": "duplicate"})
+MAX_EVENT_BATCH = 500
 
-    except Exception as e:
-        return JsonResponse({"error": str(e)}, status=400)
+@csrf_exempt
+def race_event_batch_api(request):
+    """
+    Ingest a queued list of timer events in one request.
+
+    Body: {"events": [...]} using the same event shape as race_event_api.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only"}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        events = data["events"]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Expected {\"events\": [...]}"}, status=400)
+
+    if not isinstance(events, list):
+        return JsonResponse({"error": "events must be a list"}, status=400)
+
+    if len(events) > MAX_EVENT_BATCH:
+        return JsonResponse(
+            {"error": f"At most {MAX_EVENT_BATCH} events per batch"},
+            status=400,
+        )
+
+    return JsonResponse({"results": record_race_events(events)})
 #----------------------------------------------------------#
 
 def live_race_page(request, race_id):
@@ -651,13 +717,16 @@ def timed_results_edit(request, race_id):
 
     if request.method == "POST":
 
+        entries = list(entries)
+
         for row in entries:
             laps = request.POST.get(f"laps_{row.id}")
             elapsed = request.POST.get(f"elapsed_{row.id}")
 
             row.laps = int(laps) if laps else None
             row.elapsed_seconds = int(elapsed) if elapsed else None
-            row.save()
+
+        ResultSetEntry.objects.bulk_update(entries, ["laps", "elapsed_seconds"])
 
         messages.success(request, "Timed result set updated.")
         return redirect("race-results-timed",
@@ -676,47 +745,46 @@ def manual_results(request, pk):
     race = get_object_or_404(Race, pk=pk)
     user = request.user
 
-    result_set, created = ResultSet.objects.get_or_create(
-        race=race,
-        created_by=user,
-        source=ResultSet.Source.MANUAL_POSITION,
-    )
-
-    # -------------------------------------------------
-    # Populate defaults if new
-    # -------------------------------------------------
-    if created:
-        base_set = ResultSet.objects.filter(
+    with transaction.atomic():
+        result_set, created = ResultSet.objects.get_or_create(
             race=race,
             created_by=user,
-            source=ResultSet.Source.MANUAL_TIME
-        ).first()
+            source=ResultSet.Source.MANUAL_POSITION,
+        )
 
-        if not base_set:
+        # -------------------------------------------------
+        # Populate defaults if new
+        # -------------------------------------------------
+        if created:
             base_set = ResultSet.objects.filter(
                 race=race,
                 created_by=user,
-                source=ResultSet.Source.TIMED
+                source=ResultSet.Source.MANUAL_TIME
             ).first()
 
-        if base_set:
-            for entry in base_set.entries.all():
-                ResultSetEntry.objects.create(
-                    result_set=result_set,
-                    race_entry=entry.race_entry,
-                    finish_position=entry.finish_position,
-                    tied=getattr(entry, "tied", False),
-                )
-        else:
-            for e in race.entries.all():
-                ResultSetEntry.objects.create(
-                    result_set=result_set,
-                    race_entry=e
-                )
+            if not base_set:
+                base_set = ResultSet.objects.filter(
+                    race=race,
+                    created_by=user,
+                    source=ResultSet.Source.TIMED
+                ).first()
+
+            if base_set:
+                ResultSetEntry.objects.bulk_create([
+                    ResultSetEntry(
+                        result_set=result_set,
+                        race_entry_id=entry.race_entry_id,
+                        finish_position=entry.finish_position,
+                        tied=entry.tied,
+                    )
+                    for entry in base_set.entries.all()
+                ])
+            else:
+                create_blank_entries(result_set)
 
     entries = list(
         result_set.entries
-        .select_related("race_entry__boat", "race_entry__helm")
+        .select_related("race_entry__boat__boat_type", "race_entry__helm")
         .order_by("finish_position", "id")
     )
 
@@ -733,45 +801,42 @@ def manual_results(request, pk):
             pos = request.POST.get(f"pos_{row.id}")
             row.finish_position = int(pos) if pos else None
             row.tied = request.POST.get(f"tie_{row.id}") == "on"
-            row.save()
+
+        with transaction.atomic():
+            ResultSetEntry.objects.bulk_update(entries, ["finish_position", "tied"])
+
+            # saving moves a published set back to saved; a preview
+            # keeps its state but still changes its positions
+            save_result_set_state(
+                result_set,
+                ResultSet.State.SAVED if action == "save" else result_set.state,
+            )
 
         # Reload sorted after save
         entries = list(
             result_set.entries
-            .select_related("race_entry__boat", "race_entry__helm")
+            .select_related("race_entry__boat__boat_type", "race_entry__helm")
             .order_by("finish_position", "id")
         )
 
         if action == "save":
-            result_set.state = ResultSet.State.SAVED
-            result_set.save()
             messages.success(request, "Manual positions saved.")
             # return redirect("race-results-manual", pk=race.pk)
             return redirect("select-result-set", race_id=race.pk)
 
         if action == "preview":
 
-            preview = []
-
-            display_position = 0
-            skip = 0
-
-            for index, row in enumerate(entries, start=1):
+            # a ticked row dead-heated with the row above
+            score = score_finish_order([row.tied for row in entries])
 
-                if index == 1:
-                    display_position = 1
-                else:
-                    if row.tied:
-                        skip += 1
-                    else:
-                        display_position = display_position + 1 + skip
-                        skip = 0
-
-                preview.append({
-                    "row": row,
-                    "position": display_position,
-                    "points": calculate_points(display_position)
-                })
+            preview = [
+                {
+                    "row": entries[i],
+                    "position": position,
+                    "points": points,
+                }
+                for i, position, _, _, points in score.ranked()
+            ]
     # print("VIEW REACHED")
     return render(request, "races/manual_results.html", {
         "race": race,
@@ -873,21 +938,22 @@ def manual_time_results(request, race_id):
         # SAVE RESULT SET
         if action == "save" and preview:
 
-            result_set.entries.all().delete()
-
-            for row in preview:
-
-                ResultSetEntry.objects.create(
-                    result_set=result_set,
-                    race_entry=row["entry"],
-                    laps=row["entry"].laps,
-                    elapsed_seconds=row["entry"].elapsed_seconds,
-                    corrected_seconds=row["corrected_raw"],
-                    finish_position=row["position"],
-                )
+            with transaction.atomic():
+                result_set.entries.all().delete()
+
+                ResultSetEntry.objects.bulk_create([
+                    ResultSetEntry(
+                        result_set=result_set,
+                        race_entry=row["entry"],
+                        laps=row["entry"].laps,
+                        elapsed_seconds=row["entry"].elapsed_seconds,
+                        corrected_seconds=row["corrected_raw"],
+                        finish_position=row["position"],
+                    )
+                    for row in preview
+                ])
 
-            result_set.state = ResultSet.State.SAVED
-            result_set.save()
+                save_result_set_state(result_set, ResultSet.State.SAVED)
 
             messages.success(request, "Manual timed results saved.")
             # return redirect("race-results-manual-time", race_id=race.id)
@@ -957,45 +1023,65 @@ def timed_results(request, race_id):
     attempt = request.GET.get("attempt")
     attempt = int(attempt) if attempt else None
 
-    state = build_race_state(race.id, attempt=attempt)
-    attempt_numbers = range(1, state["total_attempts"] + 1)
+    projected = RaceEntryProjection.objects.filter(race=race).aggregate(
+        attempt=Max("attempt")
+    )["attempt"]
 
-    boats = list(state["boats"].values())
+    if projected and attempt in (None, projected):
+        # latest attempt → the projection kept up to date on ingest
+        state = {"attempt": projected, "total_attempts": projected}
+        preview = []
+        previous = None
+
+        for row in projected_standings(race.id):
+            entry = row.race_entry
+
+            preview.append({
+                "entry_id": entry.id,
+                "helm": entry.helm.get_short_name(),
+                "sail": entry.boat.sail_number,
+                "laps": row.laps,
+                "elapsed": row.last_seconds,
+                "corrected": row.corrected,
+                "position": row.position,
+                "tied": row.position == previous,
+            })
+            previous = row.position
 
-    valid = [
-        b for b in boats
-        if b["laps"] and b["last"]
-    ]
+    else:
+        # an earlier attempt (or never projected) → replay the log
+        state = build_race_state(race.id, attempt=attempt)
 
-    if valid:
-        max_laps = max(b["laps"] for b in valid)
+        valid = [
+            b for b in state["boats"].values()
+            if b["laps"] and b["last"]
+        ]
 
-        ranked = sorted(
-            valid,
-            key=lambda b: (
-                (b["last"] * (max_laps / b["laps"]) * 1000 / b["py"])
-                if b["py"] else 999999
+        if valid:
+            score = score_fleet(
+                [b["laps"] for b in valid],
+                [b["last"] for b in valid],
+                [b["py"] for b in valid],
+                ties=TIES_EQUAL,
             )
-        )
 
-        preview = []
+            preview = []
 
-        for pos, b in enumerate(ranked, 1):
+            for i, pos, corrected, tied, _ in score.ranked():
+                b = valid[i]
 
-            corrected = (
-                b["last"] * (max_laps / b["laps"]) * 1000 / b["py"]
-                if b["py"] else None
-            )
+                preview.append({
+                    "entry_id": b["entry_id"],
+                    "helm": b["helm"],
+                    "sail": b["sail"],
+                    "laps": b["laps"],
+                    "elapsed": b["last"],
+                    "corrected": corrected,
+                    "position": pos,
+                    "tied": tied,
+                })
 
-            preview.append({
-                "entry_id": b["entry_id"],
-                "helm": b["helm"],
-                "sail": b["sail"],
-                "laps": b["laps"],
-                "elapsed": b["last"],
-                "corrected": corrected,
-                "position": pos,
-            })
+    attempt_numbers = range(1, state["total_attempts"] + 1)
 
     # ------------------------------------------
     # SAVE RESULT SET
@@ -1003,30 +1089,33 @@ def timed_results(request, race_id):
 
     if request.method == "POST" and preview:
 
-        result_set, created = ResultSet.objects.get_or_create(
-            race=race,
-            source=ResultSet.Source.TIMED,
-            created_by=request.user,
-            defaults={
-                "state": ResultSet.State.SAVED
-            }
-        )
-
-        # Always clear existing entries (safe)
-        result_set.entries.all().delete()
-
-        for row in preview:
-            ResultSetEntry.objects.create(
-                result_set=result_set,
-                race_entry_id=row["entry_id"],
-                laps=row["laps"],
-                elapsed_seconds=row["elapsed"],
-                corrected_seconds=row["corrected"],
-                finish_position=row["position"],
+        with transaction.atomic():
+            result_set, created = ResultSet.objects.get_or_create(
+                race=race,
+                source=ResultSet.Source.TIMED,
+                created_by=request.user,
+                defaults={
+                    "state": ResultSet.State.SAVED
+                }
             )
 
-        result_set.state = ResultSet.State.SAVED
-        result_set.save()
+            # Always clear existing entries (safe)
+            result_set.entries.all().delete()
+
+            ResultSetEntry.objects.bulk_create([
+                ResultSetEntry(
+                    result_set=result_set,
+                    race_entry_id=row["entry_id"],
+                    laps=row["laps"],
+                    elapsed_seconds=row["elapsed"],
+                    corrected_seconds=row["corrected"],
+                    finish_position=row["position"],
+                    tied=row["tied"],
+                )
+                for row in preview
+            ])
+
+            save_result_set_state(result_set, ResultSet.State.SAVED)
 
         if created:
             messages.success(request, "Timed result set created.")
@@ -1081,18 +1170,21 @@ def publish_result_set(request, result_set_id):
     result_set = get_object_or_404(ResultSet, pk=result_set_id)
     race = result_set.race
 
-    # Unpublish existing
-    ResultSet.objects.filter(
-        race=race,
-        state=ResultSet.State.PUBLISHED
-    ).update(
-        state=ResultSet.State.SAVED,
-        published_at=None
-    )
+    # the standings change with the published set, or neither does
+    with transaction.atomic():
+
+        # Unpublish existing
+        ResultSet.objects.filter(
+            race=race,
+            state=ResultSet.State.PUBLISHED
+        ).exclude(
+            pk=result_set.pk
+        ).update(
+            state=ResultSet.State.SAVED,
+            published_at=None
+        )
 
-    result_set.state = ResultSet.State.PUBLISHED
-    result_set.published_at = timezone.now()
-    result_set.save()
+        save_result_set_state(result_set, ResultSet.State.PUBLISHED)
 
     messages.success(request, "Result set published.")
 
@@ -1106,9 +1198,7 @@ def unpublish_result_set(request, result_set_id):
     result_set = get_object_or_404(ResultSet, pk=result_set_id)
 
     if result_set.state == ResultSet.State.PUBLISHED:
-        result_set.state = ResultSet.State.SAVED
-        result_set.published_at = None
-        result_set.save()
+        save_result_set_state(result_set, ResultSet.State.SAVED)
 
         messages.info(request, "Result set unpublished.")
 
@@ -1,10 +1,159 @@
-from django.http import JsonResponse
-from races.services import build_race_state
+import asyncio
+import json
+import re
+import time
 
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import permission_required
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import etag
+from races.archive import ARCHIVE_FORMATS, archive_records
+from races.engine import get_live_race_state
+from races.live_cache import get_live_state_payload, live_state_version
+from races.models import League, Race
+from races.pubsub import race_event_hub
 
+
+# seconds between keep-alives; also how often a stream re-checks the log
+# for events written by another worker
+STREAM_KEEPALIVE = 15
+
+# streams are closed after this long and the browser reconnects, so a
+# client that vanished without us noticing is only held this long
+STREAM_MAX_SECONDS = 300
+
+# attempt:seen:last_event_id:fleet, see RaceReplay.cursor
+CURSOR_RE = re.compile(r"^\d+:\d+:\d+:\d+x\d+x[0-9a-f]{8}$")
+
+
+def live_state_etag(request, race_id):
+    """
+    Changes whenever an event is added to the race or an entry changes,
+    so polls between two laps can be answered with 304 without building
+    any state.
+    """
+    attempt = request.GET.get("attempt") or "latest"
+    at = request.GET.get("at") or "now"
+    return f"{race_id}-{attempt}-{at}-{live_state_version(race_id)}"
+
+
+@etag(live_state_etag)
 def live_race_state(request, race_id):
     attempt = request.GET.get("attempt")
     attempt = int(attempt) if attempt else None
 
-    state = build_race_state(race_id, attempt)
-    return JsonResponse(state)
+    # cursor from the previous response → only what changed since
+    since = request.GET.get("since")
+    if since and not CURSOR_RE.match(since):
+        since = None
+
+    # race seconds → the standings at that moment (protests, scrubbing)
+    at = request.GET.get("at")
+    at = int(at) if at and at.isdigit() else None
+
+    payload = get_live_state_payload(race_id, attempt, since, at)
+
+    response = HttpResponse(payload, content_type="application/json")
+    patch_cache_control(response, no_cache=True)
+    return response
+
+#----------------------------------------------------------#
+
+def sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def race_stream(race_id, attempt):
+    """
+    Full state once, then a delta each time the race gets new events.
+    """
+    load_state = sync_to_async(get_live_race_state)
+
+    waiter = race_event_hub.subscribe(race_id)
+    _, wakeup = waiter
+    closes_at = time.monotonic() + STREAM_MAX_SECONDS
+
+    try:
+        yield "retry: 2000\n\n"
+
+        sent = await load_state(race_id, attempt)
+        yield sse_message("state", sent)
+
+        while time.monotonic() < closes_at:
+            try:
+                await asyncio.wait_for(wakeup.wait(), STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+
+            wakeup.clear()
+
+            current = await load_state(race_id, attempt, sent["cursor"])
+
+            if not current["delta"]:
+                yield sse_message("state", current)
+
+            elif current["cursor"] != sent["cursor"]:
+                yield sse_message("delta", current)
+
+            sent = current
+
+    finally:
+        race_event_hub.unsubscribe(race_id, waiter)
+
+
+async def live_race_stream(request, race_id):
+
+    # an endless async stream can only be served under ASGI;
+    # 204 tells EventSource to give up → the page falls back to polling
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    attempt = request.GET.get("attempt")
+    attempt = int(attempt) if attempt else None
+
+    response = StreamingHttpResponse(
+        race_stream(race_id, attempt),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+#----------------------------------------------------------#
+
+def archive_response(races, filename, request):
+    """
+    Streams archive_records(races) as ?format=ndjson (default) or csv.
+    """
+    fmt = request.GET.get("format", "ndjson")
+    if fmt not in ARCHIVE_FORMATS:
+        raise Http404("Unknown format")
+
+    lines, content_type = ARCHIVE_FORMATS[fmt]
+
+    response = StreamingHttpResponse(
+        lines(archive_records(races)),
+        content_type=content_type,
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+@permission_required("races.view_raceevent", raise_exception=True)
+def race_archive(request, race_id):
+    race = get_object_or_404(Race, pk=race_id)
+    return archive_response(
+        Race.objects.filter(pk=race.pk), f"race-{race.pk}", request
+    )
+
+
+@permission_required("races.view_raceevent", raise_exception=True)
+def league_archive(request, pk):
+    league = get_object_or_404(League, pk=pk)
+    return archive_response(
+        Race.objects.filter(league=league), f"league-{league.pk}", request
+    )